@@ -0,0 +1,243 @@
+"""Performance benchmarks of whispy.
+
+Measures, against the local inputs (inputs/jfk.*) and synthesized longer clips:
+
+1. Backend and model load time.
+2. First-call latency, cold and after `WhispyModel.warmup`.
+3. Steady-state real-time factor (processing seconds per audio second), across n_threads, sampling strategies and input formats.
+4. Throughput under concurrency (audio seconds transcribed per wall-clock second).
+5. Peak RSS.
+
+Results are written as JSON. When a baseline exists, every metric is compared against it and the run fails if any of them regressed beyond the tolerance.
+
+Usage:
+    python benchmarks/bench.py                  # Run and compare against benchmarks/baseline.json
+    python benchmarks/bench.py --save-baseline  # Run and store the results as the new baseline
+"""
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, dirname, realpath, exists
+from array import array
+import statistics
+import argparse
+import platform
+import resource
+import tempfile
+import json
+import time
+import sys
+import os
+
+import whispy
+from whispy.audio import load_audio
+from whispy.utils import PCM_SAMPLE_RATE
+
+
+PROJECT_ROOT = dirname(dirname(realpath(__file__)))
+INPUTS_DIR = join(PROJECT_ROOT, "inputs")
+DEFAULT_BASELINE = join(PROJECT_ROOT, "benchmarks", "baseline.json")
+DEFAULT_OUTPUT = join(PROJECT_ROOT, "benchmarks", "latest.json")
+
+INPUT_FORMATS = ("pcmf32", "flac", "mp3")
+
+
+def peak_rss():
+  """Peak resident set size of this process, in bytes.
+  """
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def synthesize_clip(samples, seconds: float, directory: str):
+  """Writes a raw PCM clip of roughly `seconds` seconds by repeating `samples` with a short pause in between.
+  """
+  pause = array("f", bytes(4 * PCM_SAMPLE_RATE // 2))
+  source = array("f", samples) + pause
+  repeats = max(1, round(seconds * PCM_SAMPLE_RATE / len(source)))
+
+  path = join(directory, f"synthesized-{int(seconds)}s.pcmf32")
+  with open(path, "wb") as clip:
+    for _ in range(repeats):
+      source.tofile(clip)
+  return path, repeats * len(source) / PCM_SAMPLE_RATE
+
+
+class Report:
+  """Collects named metrics, each one with its unit and whether lower or higher values are better.
+  """
+
+  def __init__(self):
+    self.metrics: dict[str, dict] = {}
+
+  def add(self, name: str, value: float, unit: str, better: str = "lower"):
+    self.metrics[name] = dict(value=value, unit=unit, better=better)
+    print(f"{name:<48} {value:>12.4f} {unit}", flush=True)
+
+  def to_dict(self, args: argparse.Namespace):
+    return dict(
+      created=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+      host=dict(machine=platform.machine(), system=platform.system(), python=platform.python_version(), cpus=os.cpu_count()),
+      config=dict(model=args.model, threads=args.threads, strategies=args.strategies, repeat=args.repeat),
+      metrics=self.metrics
+    )
+
+
+def timed(func, *args):
+  start = time.perf_counter()
+  result = func(*args)
+  return time.perf_counter() - start, result
+
+
+def bench_load(report: Report, args: argparse.Namespace):
+  elapsed, _ = timed(whispy.preload)
+  report.add("load/backend_seconds", elapsed, "s")
+
+  elapsed, model = timed(whispy.WhispyModel, whispy.ModelParams(model_name=args.model, use_gpu=args.gpu, n_states=max(args.concurrency)))
+  report.add("load/model_seconds", elapsed, "s")
+  return model
+
+
+def bench_first_call(report: Report, model, inputs: dict):
+  path, _ = inputs["pcmf32"]
+  elapsed, _ = timed(model.transcribe, path)
+  report.add("latency/first_call_seconds", elapsed, "s")
+
+
+def bench_warmup(report: Report, inputs: dict, args: argparse.Namespace):
+  """Loads a second model with warm-up, once the first one was destroyed, and measures its first call against the cold one.
+  """
+  path, _ = inputs["pcmf32"]
+  model = whispy.WhispyModel(whispy.ModelParams(model_name=args.model, use_gpu=args.gpu), warmup=True)
+  report.add("load/warmup_seconds", model.warmup_seconds, "s")
+
+  elapsed, _ = timed(model.transcribe, path)
+  report.add("latency/warm_first_call_seconds", elapsed, "s")
+  report.add("latency/cold_start_penalty_seconds", report.metrics["latency/first_call_seconds"]["value"] - elapsed, "s")
+  model.destroy()
+
+
+def bench_rtf(report: Report, model, inputs: dict, args: argparse.Namespace):
+  for strategy in args.strategies:
+    for n_threads in args.threads:
+      params = whispy.SpeechToTextParams(strategy, n_threads=n_threads)
+      for name, (path, audio_seconds) in inputs.items():
+        if strategy != "greedy" and name not in ("pcmf32", "long"): # Formats only change the decoding, once is enough
+          continue
+        elapsed = statistics.median(timed(model.transcribe, path, params)[0] for _ in range(args.repeat))
+        report.add(f"rtf/{strategy}/t{n_threads}/{name}", elapsed / audio_seconds, "x")
+
+
+def bench_language(report: Report, model, inputs: dict, args: argparse.Namespace):
+  """Detects the language of the long clip, which only analyzes its first window, against transcribing it.
+  """
+  path, _ = inputs["long"]
+  detect = statistics.median(timed(model.detect_language, path)[0] for _ in range(args.repeat))
+  transcribe = statistics.median(timed(model.transcribe, path)[0] for _ in range(args.repeat))
+  report.add("latency/detect_language_seconds", detect, "s")
+  report.add("latency/detect_language_vs_transcribe", detect / transcribe, "x")
+
+
+def bench_concurrency(report: Report, model, inputs: dict, args: argparse.Namespace):
+  path, audio_seconds = inputs["pcmf32"]
+  n_threads = max(1, (os.cpu_count() or 1) // max(args.concurrency))
+  params = whispy.SpeechToTextParams("greedy", n_threads=n_threads)
+
+  for concurrency in args.concurrency:
+    n_jobs = concurrency * args.repeat
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      start = time.perf_counter()
+      list(executor.map(lambda _: model.transcribe(path, params), range(n_jobs)))
+      elapsed = time.perf_counter() - start
+    report.add(f"throughput/c{concurrency}", n_jobs * audio_seconds / elapsed, "audio s/s", better="higher")
+
+
+def compare(current: dict, baseline: dict, tolerance: float):
+  """Compares the metrics of two reports.
+
+  Returns:
+      list[str]: A description of every metric that regressed beyond the tolerance.
+  """
+  regressions = []
+  for name, metric in current["metrics"].items():
+    previous = baseline["metrics"].get(name)
+    if previous is None or previous["value"] <= 0:
+      continue
+    change = (metric["value"] - previous["value"]) / previous["value"]
+    if metric["better"] == "higher":
+      change = -change
+    if change > tolerance:
+      regressions.append(f"{name}: {previous['value']:.4f} -> {metric['value']:.4f} {metric['unit']} ({change:+.1%} worse)")
+  return regressions
+
+
+def parse_args(argv: list[str] | None = None):
+  def int_list(text: str):
+    return [int(item) for item in text.split(",") if item]
+
+  def str_list(text: str):
+    return [item for item in text.split(",") if item]
+
+  parser = argparse.ArgumentParser(description="Runs the whispy performance benchmarks.")
+  parser.add_argument("--model", default="base", help="Model name or path (default: base).")
+  parser.add_argument("--gpu", action="store_true", help="Runs the model on the GPU.")
+  parser.add_argument("--threads", type=int_list, default=[1, 2, 4], help="Comma separated n_threads values (default: 1,2,4).")
+  parser.add_argument("--strategies", type=str_list, default=["greedy", "beam_search"], help="Comma separated sampling strategies (default: greedy,beam_search).")
+  parser.add_argument("--concurrency", type=int_list, default=[1, 2, 4], help="Comma separated concurrent transcriptions (default: 1,2,4).")
+  parser.add_argument("--long-seconds", type=float, default=120.0, help="Length of the synthesized long clip (default: 120).")
+  parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the median is reported (default: 3).")
+  parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the results.")
+  parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline to compare against.")
+  parser.add_argument("--save-baseline", action="store_true", help="Stores the results as the new baseline instead of comparing.")
+  parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression per metric (default: 0.15).")
+  return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+  args = parse_args(argv)
+  report = Report()
+
+  model = bench_load(report, args)
+  with tempfile.TemporaryDirectory() as clips_dir:
+    jfk = load_audio(model.dll(), join(INPUTS_DIR, "jfk.pcmf32"))
+    jfk_seconds = len(jfk) / PCM_SAMPLE_RATE
+    inputs = {name: (join(INPUTS_DIR, f"jfk.{name}"), jfk_seconds) for name in INPUT_FORMATS}
+    inputs["long"] = synthesize_clip(jfk, args.long_seconds, clips_dir)
+
+    bench_first_call(report, model, inputs)
+    bench_rtf(report, model, inputs, args)
+    bench_language(report, model, inputs, args)
+    bench_concurrency(report, model, inputs, args)
+  model.destroy()
+  bench_warmup(report, inputs, args)
+
+  report.add("memory/peak_rss_mib", peak_rss() / (1 << 20), "MiB")
+  results = report.to_dict(args)
+
+  os.makedirs(dirname(args.output), exist_ok=True)
+  with open(args.output, "w") as output:
+    json.dump(results, output, indent=2)
+  print(f"Results written to {args.output}")
+
+  if args.save_baseline:
+    with open(args.baseline, "w") as baseline_file:
+      json.dump(results, baseline_file, indent=2)
+    print(f"Baseline saved to {args.baseline}")
+    return 0
+
+  if not exists(args.baseline):
+    print(f"No baseline at {args.baseline}, run with --save-baseline to create one.")
+    return 0
+
+  with open(args.baseline, "r") as baseline_file:
+    regressions = compare(results, json.load(baseline_file), args.tolerance)
+  if regressions:
+    print(f"\nPERFORMANCE REGRESSION ({len(regressions)} metrics beyond {args.tolerance:.0%}):", file=sys.stderr)
+    for regression in regressions:
+      print("  " + regression, file=sys.stderr)
+    return 1
+
+  print("No regressions against the baseline.")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,6 +1,6 @@
 from typing import Sequence, Callable, Any
 from os.path import join, dirname
-from os import makedirs
+from os import makedirs, environ
 import subprocess
 import re
 import shutil
@@ -143,6 +143,10 @@ def download_ggml_model(model_name: str):
   makedirs(models_dir, exist_ok=True)
   shutil.copy(join(origin, f"ggml-{model_name}.bin"), models_dir)
 
+BUNDLED_MODELS = [name for name in environ.get("WHISPY_MODELS", "base").split(",") if name]
+"""ggml models downloaded and shipped within the package (e.g. WHISPY_MODELS=tiny,base,small).
+"""
+
 setup(
   # Metadata
   name="whispy",
@@ -156,6 +160,16 @@ setup(
   packages=find_packages(where="."),
   package_dir={"": "."},
 
+  # Optional dependencies
+  extras_require={
+    "numpy": ["numpy"] # Vectorized signal analysis (voice activity detection, chunking)
+  },
+
+  # Command line interface
+  entry_points={
+    "console_scripts": ["whispy=whispy.cli:main"]
+  },
+
   # CMake extensions
   ext_modules=[
     CMakeExtension("whispy/libwhispy", [ 
@@ -169,7 +183,7 @@ setup(
         "lib/whisper.cpp/ggml/src/libggml-base.so",
         "lib/whisper.cpp/ggml/src/libggml-cpu.so", 
       ],
-      on_finish=lambda: download_ggml_model(model_name="base")
+      on_finish=lambda: [download_ggml_model(model_name=name) for name in BUNDLED_MODELS]
     )
   ],
   cmdclass=dict(build_ext=CMakeBuild),
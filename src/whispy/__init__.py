@@ -1,5 +1,76 @@
-from .whispy import WhispyModel # type: ignore
-from .whispy import ModelParams # type: ignore
-from .whispy import SpeechToTextParams # type: ignore
-from .whispy import WhisperInitError # type: ignore
-from .whispy import WhisperTextGenError # type: ignore
\ No newline at end of file
+"""Exported names are imported on first access, so `import whispy` neither loads the backend library nor the heavier standard modules (asyncio, multiprocessing, sqlite3...).
+"""
+TYPE_CHECKING = False # Avoids importing typing, type checkers still treat it as typing.TYPE_CHECKING
+import importlib
+
+_EXPORTS = {
+  "WhispyModel": "whispy",
+  "ModelParams": "whispy",
+  "SpeechToTextParams": "whispy",
+  "WhisperInitError": "whispy",
+  "WhisperTextGenError": "whispy",
+  "WhisperAbortedError": "whispy",
+  "WhisperTimeoutError": "whispy",
+  "WhisperAudioTooLongError": "whispy",
+  "preload": "whispy",
+  "TranscriptSegment": "results",
+  "TranscriptResult": "results",
+  "WhisperStatePool": "state_pool",
+  "BatchResult": "batch",
+  "AbortFlag": "abort",
+  "StreamingSession": "streaming",
+  "StreamingUpdate": "streaming",
+  "EnergyVAD": "vad",
+  "SpeechRegion": "vad",
+  "AudioDecoder": "audio",
+  "PCMCache": "pcm_cache",
+  "ResultCache": "result_cache",
+  "ModelHeader": "models",
+  "PreforkPool": "prefork",
+  "Timings": "metrics",
+  "MetricsSink": "metrics",
+  "MetricsRegistry": "metrics",
+  "TranscriptionScheduler": "scheduler",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+  module = _EXPORTS.get(name)
+  if module is None:
+    raise AttributeError(f"module 'whispy' has no attribute {name!r}")
+  value = getattr(importlib.import_module(f".{module}", __name__), name)
+  globals()[name] = value # Later accesses skip this hook
+  return value
+
+def __dir__():
+  return sorted(set(globals()) | set(_EXPORTS))
+
+if TYPE_CHECKING:
+  from .whispy import WhispyModel # type: ignore
+  from .whispy import ModelParams # type: ignore
+  from .whispy import SpeechToTextParams # type: ignore
+  from .whispy import WhisperInitError # type: ignore
+  from .whispy import WhisperTextGenError # type: ignore
+  from .whispy import WhisperAbortedError # type: ignore
+  from .whispy import WhisperTimeoutError # type: ignore
+  from .whispy import WhisperAudioTooLongError # type: ignore
+  from .whispy import preload # type: ignore
+  from .results import TranscriptSegment # type: ignore
+  from .results import TranscriptResult # type: ignore
+  from .state_pool import WhisperStatePool # type: ignore
+  from .batch import BatchResult # type: ignore
+  from .abort import AbortFlag # type: ignore
+  from .streaming import StreamingSession # type: ignore
+  from .streaming import StreamingUpdate # type: ignore
+  from .vad import EnergyVAD # type: ignore
+  from .vad import SpeechRegion # type: ignore
+  from .audio import AudioDecoder # type: ignore
+  from .pcm_cache import PCMCache # type: ignore
+  from .result_cache import ResultCache # type: ignore
+  from .models import ModelHeader # type: ignore
+  from .prefork import PreforkPool # type: ignore
+  from .metrics import Timings # type: ignore
+  from .metrics import MetricsSink # type: ignore
+  from .metrics import MetricsRegistry # type: ignore
+  from .scheduler import TranscriptionScheduler # type: ignore
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from .whisper_bindings import *
+
+
+class AbortFlag:
+  """A flag whisper.cpp polls while transcribing, so native work can be stopped from any thread.
+
+  The backend reads it through `whispy_limits.abort_flag` from its own `abort_callback`, which ggml checks between graph computations, and `encoder_begin_callback`, which whisper.cpp checks before encoding every 30 seconds window. Polling it never takes the GIL.
+  """
+
+  def __init__(self):
+    self._event = threading.Event()
+    self._native = ctypes.c_int32(0)
+
+  def set(self):
+    """Asks the backend to stop as soon as possible.
+    """
+    self._native.value = 1
+    self._event.set()
+
+  def is_set(self):
+    return self._event.is_set()
+
+  def pointer(self):
+    """The native flag, for `whispy_limits.abort_flag`. The `AbortFlag` must be kept alive until the transcription finishes.
+    """
+    return ctypes.pointer(self._native)
+
+
+class CallBudget:
+  """The limits of a single transcription, enforced by the backend itself (see `whispy_limits`).
+
+  The time budget starts when the call is made, so time spent waiting for a whisper state or decoding the audio counts too.
+  """
+  __slots__ = ("timeout", "max_audio_seconds", "deadline")
+
+  def __init__(self, timeout: float | None = None, max_audio_seconds: float | None = None):
+    if timeout is not None and timeout <= 0:
+      raise ValueError("The timeout must be positive")
+    if max_audio_seconds is not None and max_audio_seconds <= 0:
+      raise ValueError("max_audio_seconds must be positive")
+    self.timeout = timeout
+    self.max_audio_seconds = max_audio_seconds
+    self.deadline = time.monotonic() + timeout if timeout is not None else None
+
+  def remaining(self):
+    """Seconds left of the time budget, never negative, or None if there is none.
+    """
+    if self.deadline is None:
+      return None
+    return max(0.0, self.deadline - time.monotonic())
+
+  def limits(self):
+    """The `whispy_limits` to set on a transcript context right before it runs.
+    """
+    remaining = self.remaining()
+    return whispy_limits(
+      remaining * 1000 if remaining is not None else 0,
+      self.max_audio_seconds * 1000 if self.max_audio_seconds is not None else 0
+    )
@@ -0,0 +1,316 @@
+from collections.abc import Sequence, Iterable, Iterator
+from array import array
+import threading
+import ctypes
+import queue
+import mmap
+import os
+
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view, WhisperTextGenError
+
+try:
+  import numpy as np
+except ImportError: # NumPy is optional, it only speeds up the signal analysis.
+  np = None
+
+
+FRAME_SECONDS = 0.02
+"""Length of the frames used to analyze the signal (20 ms).
+"""
+
+FRAME_SIZE = int(FRAME_SECONDS * PCM_SAMPLE_RATE)
+
+
+def load_pcm_file(path: str):
+  """Maps a raw mono 16 kHz float32 PCM file (e.g. `inputs/jfk.pcmf32`) into memory.
+
+  The file is mapped copy-on-write, so nothing is read until the samples are used and the view can be handed to the backend without being copied.
+
+  Args:
+      path (str): Path to the raw PCM file.
+
+  Raises:
+      ValueError: If the file is empty or its size is not a multiple of float32 size.
+
+  Returns:
+      memoryview: A float32 view over the mapped file.
+  """
+  with open(path, "rb") as pcm_file:
+    mapped = mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_COPY)
+  return pcm_f32_view(mapped)
+
+
+RAW_PCM_EXTENSION = ".pcmf32"
+"""Extension of raw mono 16 kHz float32 PCM files. Any other file is decoded with libav.
+"""
+
+
+class AudioDecoder:
+  """Streaming decoder of compressed audio files (wav, flac, mp3, ogg...) into mono 16 kHz float32 PCM.
+
+  The backend pulls packets from libavformat/libavcodec and resamples them with libswresample into a fixed-size ring buffer only as samples are read, so peak memory depends on `ring_seconds` and not on the length of the file. ctypes releases the GIL while decoding, so it can run on a background thread while other threads transcribe.
+  """
+
+  def __init__(self, lib: ctypes.CDLL, path: str, ring_seconds: float = 10.0):
+    """
+    Args:
+        lib (ctypes.CDLL): The backend library with the C api binded.
+        path (str): Path to the audio file.
+        ring_seconds (float, optional): Seconds of audio the ring buffer holds. Defaults to 10.0.
+
+    Raises:
+        WhisperTextGenError: If the file cannot be opened or has no audio.
+    """
+    self._lib = lib
+    error = ctypes.create_string_buffer(256)
+    self._handle = lib.whispy_decoder_open(
+      bytes(path, encoding="utf-8"),
+      int(ring_seconds * PCM_SAMPLE_RATE),
+      error,
+      len(error)
+    )
+    if not self._handle:
+      raise WhisperTextGenError(f"{str(error.value, encoding='utf-8')} ({path})")
+
+  @property
+  def duration_seconds(self):
+    """Estimated duration of the audio, or None if the container does not tell.
+    """
+    duration_ms: int = self._lib.whispy_decoder_duration_ms(self._handle)
+    return duration_ms / 1000 if duration_ms >= 0 else None
+
+  def read(self, max_samples: int):
+    """Decodes the next samples of the audio.
+
+    Args:
+        max_samples (int): Maximum number of samples to read.
+
+    Raises:
+        WhisperTextGenError: If the backend failed to decode the audio.
+
+    Returns:
+        array: Up to `max_samples` float32 samples. It is empty at the end of the audio.
+    """
+    buffer = (ctypes.c_float * max_samples)()
+    n_samples: int = self._lib.whispy_decoder_read(self._handle, buffer, max_samples)
+    if n_samples < 0:
+      raise WhisperTextGenError(str(self._lib.whispy_decoder_error(self._handle), encoding="utf-8"))
+
+    samples = array("f")
+    samples.frombytes(memoryview(buffer).cast("B")[: n_samples * ctypes.sizeof(ctypes.c_float)])
+    return samples
+
+  def close(self):
+    if self._handle:
+      self._lib.whispy_decoder_close(self._handle)
+      self._handle = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def __del__(self):
+    self.close()
+
+
+def iter_audio_blocks(lib: ctypes.CDLL, path: str, block_seconds: float = 10.0) -> Iterator[memoryview | array]:
+  """Yields the samples of an audio file in blocks, without holding the whole file in memory.
+
+  Args:
+      lib (ctypes.CDLL): The backend library with the C api binded.
+      path (str): A raw PCM file (see `RAW_PCM_EXTENSION`) or any file libav can decode.
+      block_seconds (float, optional): Seconds of audio per block. Defaults to 10.0.
+
+  Yields:
+      memoryview | array: Consecutive blocks of float32 samples.
+  """
+  block_size = int(block_seconds * PCM_SAMPLE_RATE)
+
+  if path.endswith(RAW_PCM_EXTENSION):
+    samples = load_pcm_file(path)
+    for start in range(0, len(samples), block_size):
+      yield samples[start: start + block_size]
+    return
+
+  with AudioDecoder(lib, path, ring_seconds=block_seconds) as decoder:
+    while True:
+      block = decoder.read(block_size)
+      if not block:
+        return
+      yield block
+
+
+def load_audio_head(lib: ctypes.CDLL, speech: str | object, max_seconds: float):
+  """Loads only the first `max_seconds` of the audio, e.g. to detect its language.
+
+  Raw PCM files and buffers are sliced without copying, any other file is decoded until enough samples were read.
+
+  Returns:
+      memoryview | array: Up to `max_seconds` of float32 samples.
+  """
+  max_samples = int(max_seconds * PCM_SAMPLE_RATE)
+  if not isinstance(speech, str):
+    return pcm_f32_view(speech)[:max_samples]
+  if speech.endswith(RAW_PCM_EXTENSION):
+    return load_pcm_file(speech)[:max_samples]
+
+  samples = array("f")
+  with AudioDecoder(lib, speech, ring_seconds=min(max_seconds, 10.0)) as decoder:
+    while len(samples) < max_samples:
+      block = decoder.read(max_samples - len(samples))
+      if not block:
+        break
+      samples.extend(block)
+  return samples
+
+
+def prefetch(blocks: Iterable[object], depth: int = 2) -> Iterator[object]:
+  """Runs an iterable on a background thread, `depth` items ahead of the consumer.
+
+  Used to overlap decoding with inference while keeping memory bounded.
+  """
+  items: queue.Queue = queue.Queue(maxsize=depth)
+  done = object()
+  stop = threading.Event()
+
+  def put(item: object):
+    while not stop.is_set():
+      try:
+        items.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        continue
+    return False
+
+  def produce():
+    try:
+      for block in blocks:
+        if not put(block):
+          return
+    except BaseException as e:
+      put(e)
+    else:
+      put(done)
+
+  producer = threading.Thread(target=produce, name="whispy-decoder", daemon=True)
+  producer.start()
+  try:
+    while True:
+      item = items.get()
+      if item is done:
+        return
+      if isinstance(item, BaseException):
+        raise item
+      yield item
+  finally:
+    stop.set()
+
+
+def audio_duration(lib: ctypes.CDLL, speech: str | object):
+  """Duration of the audio in seconds, without decoding it: the size of raw PCM files and buffers, or the container metadata of any other file.
+
+  Returns:
+      float | None: None if the container does not tell.
+  """
+  if not isinstance(speech, str):
+    return len(pcm_f32_view(speech)) / PCM_SAMPLE_RATE
+  if speech.endswith(RAW_PCM_EXTENSION):
+    return os.path.getsize(speech) / ctypes.sizeof(ctypes.c_float) / PCM_SAMPLE_RATE
+  with AudioDecoder(lib, speech, ring_seconds=0.1) as decoder:
+    return decoder.duration_seconds
+
+
+def load_audio(lib: ctypes.CDLL, path: str):
+  """Loads the whole audio file as float32 samples, for single-shot transcriptions.
+
+  Raw PCM files are memory-mapped, any other file is decoded with libav.
+
+  Returns:
+      memoryview | array: The samples of the file.
+  """
+  if path.endswith(RAW_PCM_EXTENSION):
+    return load_pcm_file(path)
+
+  samples = array("f")
+  for block in iter_audio_blocks(lib, path):
+    samples.extend(block)
+  return samples
+
+
+def frame_energies(samples: memoryview, start: int = 0, end: int | None = None, frame_size: int = FRAME_SIZE) -> Sequence[float]:
+  """Computes the mean energy of consecutive frames of the signal. Trailing samples that do not fill a frame are ignored.
+
+  Args:
+      samples (memoryview): A float32 view over the PCM samples (see `pcm_f32_view`).
+      start (int, optional): First sample to analyze. Defaults to 0.
+      end (int | None, optional): Sample after the last one to analyze. Defaults to the end of the signal.
+      frame_size (int, optional): Samples per frame. Defaults to 20 ms.
+
+  Returns:
+      Sequence[float]: The energy of every frame (a NumPy array if NumPy is available).
+  """
+  end = len(samples) if end is None else min(end, len(samples))
+  n_frames = max(0, (end - start) // frame_size)
+
+  if np is not None:
+    frames = np.frombuffer(samples[start: start + n_frames * frame_size], dtype=np.float32).reshape(n_frames, frame_size)
+    return np.einsum("ij,ij->i", frames, frames) / frame_size
+
+  energies = []
+  for frame_start in range(start, start + n_frames * frame_size, frame_size):
+    frame = samples[frame_start: frame_start + frame_size]
+    energies.append(sum(x * x for x in frame) / frame_size)
+  return energies
+
+
+def frame_zero_crossings(samples: memoryview, start: int = 0, end: int | None = None, frame_size: int = FRAME_SIZE) -> Sequence[float]:
+  """Computes the zero-crossing rate (crossings per sample) of consecutive frames of the signal.
+
+  Args:
+      samples (memoryview): A float32 view over the PCM samples (see `pcm_f32_view`).
+      start (int, optional): First sample to analyze. Defaults to 0.
+      end (int | None, optional): Sample after the last one to analyze. Defaults to the end of the signal.
+      frame_size (int, optional): Samples per frame. Defaults to 20 ms.
+
+  Returns:
+      Sequence[float]: The zero-crossing rate of every frame (a NumPy array if NumPy is available).
+  """
+  end = len(samples) if end is None else min(end, len(samples))
+  n_frames = max(0, (end - start) // frame_size)
+
+  if np is not None:
+    frames = np.frombuffer(samples[start: start + n_frames * frame_size], dtype=np.float32).reshape(n_frames, frame_size)
+    signs = np.signbit(frames)
+    return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_size
+
+  rates = []
+  for frame_start in range(start, start + n_frames * frame_size, frame_size):
+    frame = samples[frame_start: frame_start + frame_size]
+    rates.append(sum((a < 0) != (b < 0) for a, b in zip(frame, frame[1:])) / frame_size)
+  return rates
+
+
+def find_quiet_point(samples: memoryview, target: int, search: int, frame_size: int = FRAME_SIZE):
+  """Finds the quietest frame around a position of the signal, a good place to split it without cutting a word.
+
+  Args:
+      samples (memoryview): A float32 view over the PCM samples.
+      target (int): Preferred split position, in samples.
+      search (int): How far from `target` the split may move, in samples.
+
+  Returns:
+      int: The sample at the center of the quietest frame. Ties are resolved towards `target`, so the result is deterministic.
+  """
+  start = max(0, target - search)
+  end = min(len(samples), target + search)
+  energies = frame_energies(samples, start, end, frame_size)
+  if not len(energies):
+    return target
+
+  best = min(
+    range(len(energies)),
+    key=lambda i: (energies[i], abs(start + i * frame_size + frame_size // 2 - target))
+  )
+  return start + best * frame_size + frame_size // 2
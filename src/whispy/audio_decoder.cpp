@@ -0,0 +1,332 @@
+#include <vector>
+#include <string>
+#include <algorithm>
+#include <exception>
+
+#include <cstdint>
+#include <cstring>
+#include <cstdio>
+
+extern "C"
+{
+#include <libavformat/avformat.h>
+#include <libavcodec/avcodec.h>
+#include <libswresample/swresample.h>
+#include <libavutil/channel_layout.h>
+#include <libavutil/samplefmt.h>
+}
+
+#include "whispy.h"
+
+/**
+ * Sample rate whisper.cpp expects.
+ */
+constexpr int whispy_sample_rate = WHISPER_SAMPLE_RATE;
+
+struct whispy_audio_decoder
+{
+  AVFormatContext *format = nullptr;
+  AVCodecContext *codec = nullptr;
+  SwrContext *resampler = nullptr;
+  AVPacket *packet = nullptr;
+  AVFrame *frame = nullptr;
+  int stream_index = -1;
+
+  /**
+   * Fixed-size ring buffer with resampled samples ready to be read.
+   */
+  std::vector<float> ring;
+  std::size_t ring_head = 0;
+  std::size_t ring_size = 0;
+
+  /**
+   * Resampled samples of the last decoded frame that did not fit in the ring yet.
+   */
+  std::vector<float> converted;
+  std::size_t converted_pos = 0;
+
+  bool demuxer_eof = false;
+  bool resampler_flushed = false;
+  bool finished = false;
+
+  std::string error;
+};
+
+/**
+ * Stores a libav error within the decoder.
+ * 
+ * @returns Always false, so it can be returned straight away.
+ */
+static bool fail_decoder(whispy_audio_decoder &dec, const char *what, int av_error)
+{
+  char av_message[AV_ERROR_MAX_STRING_SIZE] = {0};
+  av_strerror(av_error, av_message, sizeof(av_message));
+  dec.error = std::string(what) + ": " + av_message;
+  return false;
+}
+
+/**
+ * Resamples a decoded frame (or flushes the resampler if frame is nullptr) into `dec.converted`.
+ */
+static bool convert_frame(whispy_audio_decoder &dec, AVFrame *frame)
+{
+  int in_samples = frame != nullptr ? frame->nb_samples : 0;
+  int out_capacity = swr_get_out_samples(dec.resampler, in_samples);
+  if (out_capacity < 0)
+    return fail_decoder(dec, "swr_get_out_samples() failed", out_capacity);
+
+  dec.converted.resize(static_cast<std::size_t>(out_capacity));
+  dec.converted_pos = 0;
+
+  std::uint8_t *out = reinterpret_cast<std::uint8_t *>(dec.converted.data());
+  int n_converted = swr_convert(
+      dec.resampler,
+      &out,
+      out_capacity,
+      frame != nullptr ? const_cast<const std::uint8_t **>(frame->extended_data) : nullptr,
+      in_samples);
+
+  if (frame != nullptr)
+    av_frame_unref(frame);
+  if (n_converted < 0)
+    return fail_decoder(dec, "swr_convert() failed", n_converted);
+
+  dec.converted.resize(static_cast<std::size_t>(n_converted));
+  return true;
+}
+
+/**
+ * Pulls packets from the demuxer until the decoder outputs a frame, and resamples it.
+ * Sets `dec.finished` once the demuxer, the decoder and the resampler are drained.
+ */
+static bool decode_next(whispy_audio_decoder &dec)
+{
+  int ret = 0;
+
+  while (true)
+  {
+    ret = avcodec_receive_frame(dec.codec, dec.frame);
+    if (ret == 0)
+      return convert_frame(dec, dec.frame);
+
+    if (ret == AVERROR_EOF)
+    {
+      if (!dec.resampler_flushed)
+      {
+        dec.resampler_flushed = true;
+        return convert_frame(dec, nullptr);
+      }
+      dec.finished = true;
+      return true;
+    }
+
+    if (ret != AVERROR(EAGAIN))
+      return fail_decoder(dec, "avcodec_receive_frame() failed", ret);
+
+    // The decoder needs more input.
+    ret = av_read_frame(dec.format, dec.packet);
+    if (ret == AVERROR_EOF)
+    {
+      dec.demuxer_eof = true;
+      avcodec_send_packet(dec.codec, nullptr); // Enters draining mode.
+      continue;
+    }
+    if (ret < 0)
+      return fail_decoder(dec, "av_read_frame() failed", ret);
+
+    if (dec.packet->stream_index == dec.stream_index)
+      ret = avcodec_send_packet(dec.codec, dec.packet);
+    av_packet_unref(dec.packet);
+
+    // Corrupted packets are skipped instead of aborting the whole file.
+    if (ret < 0 && ret != AVERROR_INVALIDDATA)
+      return fail_decoder(dec, "avcodec_send_packet() failed", ret);
+  }
+}
+
+/**
+ * Decodes until the ring buffer is full or the input is over.
+ */
+static bool fill_ring(whispy_audio_decoder &dec)
+{
+  const std::size_t capacity = dec.ring.size();
+
+  while (dec.ring_size < capacity)
+  {
+    if (dec.converted_pos < dec.converted.size())
+    {
+      std::size_t n = std::min(dec.converted.size() - dec.converted_pos, capacity - dec.ring_size);
+      for (std::size_t i = 0; i < n; i++)
+        dec.ring[(dec.ring_head + dec.ring_size + i) % capacity] = dec.converted[dec.converted_pos + i];
+      dec.converted_pos += n;
+      dec.ring_size += n;
+      continue;
+    }
+
+    if (dec.finished)
+      break;
+    if (!decode_next(dec))
+      return false;
+  }
+  return true;
+}
+
+extern "C"
+{
+  /**
+   * Opens an audio file (wav, flac, mp3, ogg...) for streaming decoding into mono 16 kHz float32 PCM.
+   * 
+   * @param speech_path The path to the audio file.
+   * @param ring_capacity Samples the internal ring buffer can hold. Peak memory depends on it, not on the length of the file.
+   * @param error A writable character array where to place the error message if the file cannot be opened. May be nullptr.
+   * @param error_size The error's memory block size.
+   * 
+   * @returns A decoder that must be closed with `whispy_decoder_close`, or nullptr on failure.
+   */
+  whispy_audio_decoder *whispy_decoder_open(const char *speech_path, std::size_t ring_capacity, char *error, std::size_t error_size)
+  {
+    whispy_audio_decoder *dec = nullptr;
+    const AVCodec *codec = nullptr;
+    AVChannelLayout mono = AV_CHANNEL_LAYOUT_MONO;
+    bool ok = false;
+    int ret = 0;
+
+    try
+    {
+      dec = new whispy_audio_decoder{};
+      dec->ring.resize(std::max<std::size_t>(ring_capacity, 1));
+    }
+    catch (const std::exception &e)
+    {
+      if (error != nullptr && error_size > 0)
+        std::snprintf(error, error_size, "%s", e.what());
+      delete dec;
+      return nullptr;
+    }
+
+    do
+    {
+      if ((ret = avformat_open_input(&dec->format, speech_path, nullptr, nullptr)) < 0)
+      {
+        fail_decoder(*dec, "avformat_open_input() failed", ret);
+        break;
+      }
+      if ((ret = avformat_find_stream_info(dec->format, nullptr)) < 0)
+      {
+        fail_decoder(*dec, "avformat_find_stream_info() failed", ret);
+        break;
+      }
+      if ((dec->stream_index = av_find_best_stream(dec->format, AVMEDIA_TYPE_AUDIO, -1, -1, &codec, 0)) < 0)
+      {
+        fail_decoder(*dec, "No audio stream", dec->stream_index);
+        break;
+      }
+
+      dec->codec = avcodec_alloc_context3(codec);
+      dec->packet = av_packet_alloc();
+      dec->frame = av_frame_alloc();
+      if (dec->codec == nullptr || dec->packet == nullptr || dec->frame == nullptr)
+      {
+        fail_decoder(*dec, "Memory allocation error", AVERROR(ENOMEM));
+        break;
+      }
+
+      avcodec_parameters_to_context(dec->codec, dec->format->streams[dec->stream_index]->codecpar);
+      if ((ret = avcodec_open2(dec->codec, codec, nullptr)) < 0)
+      {
+        fail_decoder(*dec, "avcodec_open2() failed", ret);
+        break;
+      }
+
+      ret = swr_alloc_set_opts2(
+          &dec->resampler,
+          &mono, AV_SAMPLE_FMT_FLT, whispy_sample_rate,
+          &dec->codec->ch_layout, dec->codec->sample_fmt, dec->codec->sample_rate,
+          0, nullptr);
+      if (ret < 0 || (ret = swr_init(dec->resampler)) < 0)
+      {
+        fail_decoder(*dec, "Could not initialize the resampler", ret);
+        break;
+      }
+
+      ok = true;
+    } while (false);
+
+    if (!ok)
+    {
+      if (error != nullptr && error_size > 0)
+        std::snprintf(error, error_size, "%s", dec->error.c_str());
+      whispy_decoder_close(dec);
+      return nullptr;
+    }
+    return dec;
+  }
+
+  /**
+   * Reads the next samples of the audio, decoding and resampling more packets only when the ring buffer runs out.
+   * 
+   * @param dec A decoder opened with `whispy_decoder_open`.
+   * @param samples A writable array of floats where to place the samples.
+   * @param max_samples The number of samples that fit in samples.
+   * 
+   * @returns The number of samples written, 0 at the end of the audio or -1 on failure (see `whispy_decoder_error`).
+   */
+  std::int64_t whispy_decoder_read(whispy_audio_decoder *dec, float *samples, std::size_t max_samples)
+  {
+    std::size_t written = 0, n = 0;
+    const std::size_t capacity = dec->ring.size();
+
+    while (written < max_samples)
+    {
+      if (dec->ring_size == 0)
+      {
+        if (!fill_ring(*dec))
+          return -1;
+        if (dec->ring_size == 0)
+          break; // End of the audio.
+      }
+
+      n = std::min(dec->ring_size, max_samples - written);
+      for (std::size_t i = 0; i < n; i++)
+        samples[written + i] = dec->ring[(dec->ring_head + i) % capacity];
+
+      dec->ring_head = (dec->ring_head + n) % capacity;
+      dec->ring_size -= n;
+      written += n;
+    }
+    return static_cast<std::int64_t>(written);
+  }
+
+  /**
+   * @returns The estimated duration of the audio in milliseconds, or -1 if the container does not tell.
+   */
+  std::int64_t whispy_decoder_duration_ms(const whispy_audio_decoder *dec)
+  {
+    if (dec->format == nullptr || dec->format->duration == AV_NOPTS_VALUE)
+      return -1;
+    return dec->format->duration / (AV_TIME_BASE / 1000);
+  }
+
+  /**
+   * @returns The message of the last error of the decoder.
+   */
+  const char *whispy_decoder_error(const whispy_audio_decoder *dec)
+  {
+    return dec->error.c_str();
+  }
+
+  /**
+   * Frees every resource associated with the decoder.
+   */
+  void whispy_decoder_close(whispy_audio_decoder *dec)
+  {
+    if (dec == nullptr)
+      return;
+    swr_free(&dec->resampler);
+    av_frame_free(&dec->frame);
+    av_packet_free(&dec->packet);
+    avcodec_free_context(&dec->codec);
+    avformat_close_input(&dec->format);
+    delete dec;
+  }
+}
@@ -0,0 +1,182 @@
+from typing import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import copy
+import os
+
+from .results import TranscriptResult
+from .tuning import tuned_topology
+
+
+class BatchResult:
+  """Outcome of a single input of a batch transcription.
+
+  Failures do not abort the batch: they are reported through `error` and `result` is left as None.
+  """
+
+  __slots__ = ("index", "speech", "result", "error")
+
+  def __init__(self, index: int, speech: str | None, result: TranscriptResult | None = None, error: str | None = None):
+    self.index = index
+    """Position of the input within the batch.
+    """
+    self.speech = speech
+    """The input path, or None for in-memory PCM inputs.
+    """
+    self.result = result
+    self.error = error
+
+  @property
+  def ok(self):
+    return self.error is None
+
+  def __repr__(self):
+    status = "ok" if self.ok else f"error={self.error!r}"
+    return f"BatchResult(index={self.index}, speech={self.speech!r}, {status})"
+
+
+def available_cores():
+  """Number of CPU cores this process is allowed to run on.
+  """
+  if hasattr(os, "sched_getaffinity"):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count() or 1
+
+
+def split_cores(
+  workers: int | None = None,
+  threads_per_worker: int | None = None,
+  n_cores: int | None = None
+):
+  """Splits the available cores between worker processes and the `n_threads` of each one.
+
+  Args:
+      workers (int | None, optional): Number of worker processes. Defaults to None, which means as many as fit.
+      threads_per_worker (int | None, optional): whisper.cpp threads per worker. Defaults to None, which means to share the cores evenly, with whisper.cpp's default (4) as the upper bound.
+      n_cores (int | None, optional): Cores to split. Defaults to the cores available to this process.
+
+  Returns:
+      tuple[int, int]: The number of workers and the threads per worker.
+  """
+  n_cores = n_cores or available_cores()
+
+  if threads_per_worker is None:
+    threads_per_worker = max(1, min(4, n_cores // workers)) if workers else min(4, n_cores)
+  if workers is None:
+    workers = max(1, n_cores // threads_per_worker)
+
+  return workers, threads_per_worker
+
+
+# Worker process state. Each worker loads its model once, within `_init_worker`, and keeps it for every item.
+
+_worker_model = None
+
+def _init_worker(model_params):
+  global _worker_model
+  from .whispy import WhispyModel
+  _worker_model = WhispyModel(model_params)
+
+def _transcribe_item(index: int, speech: object, params):
+  return transcribe_item(_worker_model, index, speech, params)
+
+def transcribe_item(model, index: int, speech: object, params):
+  """Transcribes one input of a batch, reporting failures within the `BatchResult` instead of raising them.
+  """
+  path = speech if isinstance(speech, str) else None
+  try:
+    result = model.transcribe(speech, params)
+  except Exception as e:
+    return BatchResult(index, path, error=f"{type(e).__name__}: {e}")
+  return BatchResult(index, path, result=result)
+
+
+def transcribe_many(
+  model_params,
+  inputs: Iterable[object],
+  params,
+  workers: int | None = None,
+  threads_per_worker: int | None = None,
+  ordered: bool = False,
+  mp_context: str = "spawn"
+) -> Iterator[BatchResult]:
+  """Transcribes many inputs with a pool of worker processes, each one with its own copy of the model.
+
+  Only a bounded number of inputs is in flight or waiting for their turn at once, so `inputs` may be a lazy iterable of any length.
+
+  Args:
+      model_params (ModelParams): Instructs the workers how to load the model.
+      inputs (Iterable[object]): Audio file paths or picklable PCM buffers (bytes, `array.array`, NumPy arrays...).
+      params (SpeechToTextParams): Transcription parameters. Callbacks are not sent to the workers.
+      workers (int | None, optional): Number of worker processes. When both `workers` and `threads_per_worker` are None, the throughput profile of this host is used (see `tuning.tune`), if any (see `split_cores` otherwise).
+      threads_per_worker (int | None, optional): whisper.cpp threads per worker. Overrides `params`' n_threads (see `split_cores`).
+      ordered (bool, optional): Yields results in input order instead of completion order. Defaults to False.
+      mp_context (str, optional): multiprocessing start method of the workers. Defaults to "spawn", since forking a process with a loaded backend is not safe.
+
+  Yields:
+      BatchResult: One per input.
+  """
+  if workers is None and threads_per_worker is None:
+    workers, threads_per_worker = tuned_topology(model_params) or (None, None)
+  workers, threads_per_worker = split_cores(workers, threads_per_worker)
+
+  worker_model_params = copy.deepcopy(model_params).n_states(1)
+  worker_params = copy.copy(params)
+  worker_params._wfull_params_dict = dict(params._wfull_params_dict, n_threads=threads_per_worker)
+
+  max_in_flight = workers * 2
+  pending: dict = {}
+  done_ahead: dict[int, BatchResult] = {}
+  next_index = 0
+
+  def make_executor():
+    return ProcessPoolExecutor(
+      max_workers=workers,
+      mp_context=multiprocessing.get_context(mp_context),
+      initializer=_init_worker,
+      initargs=(worker_model_params,)
+    )
+
+  def collect(futures):
+    nonlocal next_index
+    for future in futures:
+      index, path = pending.pop(future)
+      try:
+        item: BatchResult = future.result()
+      except Exception as e: # e.g. a worker died and broke the pool
+        item = BatchResult(index, path, error=f"{type(e).__name__}: {e}")
+
+      if not ordered:
+        yield item
+        continue
+      done_ahead[item.index] = item
+      while next_index in done_ahead:
+        yield done_ahead.pop(next_index)
+        next_index += 1
+
+  executor = make_executor()
+  try:
+    for index, speech in enumerate(inputs):
+      if isinstance(speech, memoryview):
+        speech = speech.tobytes()
+      path = speech if isinstance(speech, str) else None
+
+      try:
+        future = executor.submit(_transcribe_item, index, speech, worker_params)
+      except BrokenProcessPool:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = make_executor()
+        future = executor.submit(_transcribe_item, index, speech, worker_params)
+      pending[future] = (index, path)
+
+      # Results held back behind a slow input count too, or they would pile up while it runs.
+      while len(pending) + len(done_ahead) >= max_in_flight:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from collect(done)
+
+    while pending:
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+      yield from collect(done)
+  finally:
+    executor.shutdown(wait=True, cancel_futures=True)
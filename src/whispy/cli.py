@@ -0,0 +1,171 @@
+"""Command line interface of whispy.
+
+Usage:
+    whispy transcribe --output DIR [--format jsonl,srt,vtt] [--workers N] SOURCE [SOURCE ...]
+    whispy transcribe --output DIR --files-from LIST
+    whispy tune [--model base] [--objective latency|throughput] CLIP [CLIP ...]
+    whispy tune --show [--model base]
+"""
+import argparse
+import json
+import sys
+
+
+def _int_list(text: str):
+  return [int(item) for item in text.split(",") if item]
+
+def _str_list(text: str):
+  return [item.strip() for item in text.split(",") if item.strip()]
+
+
+def _print_profile(profile):
+  print(f"{profile.objective}: n_threads={profile.n_threads} workers={profile.workers} (model {profile.model}, clips of {profile.audio_seconds:.1f}s)")
+  for measurement in profile.measurements:
+    unit = "s per audio s" if profile.objective == "latency" else "audio s per s"
+    chosen = "*" if (measurement["n_threads"], measurement["workers"]) == (profile.n_threads, profile.workers) else " "
+    print(f"  {chosen} n_threads={measurement['n_threads']:<3} workers={measurement['workers']:<3} {measurement['score']:.4f} {unit}")
+
+
+def tune_command(args: argparse.Namespace):
+  from .whispy import ModelParams
+  from . import tuning
+
+  model_params = ModelParams(args.model, use_gpu=args.gpu)
+  objectives = [args.objective] if args.objective else list(tuning.OBJECTIVES)
+
+  if args.show:
+    from .models import registry
+    entry = registry.resolve(args.model)
+    if entry is None:
+      print(f"No such model name: {args.model}", file=sys.stderr)
+      return 1
+    profiles = {objective: tuning.load_profile(tuning.model_key(entry.header()), objective, args.profiles_dir) for objective in objectives}
+  else:
+    if not args.clips:
+      print("whispy tune needs at least one calibration clip", file=sys.stderr)
+      return 2
+    profiles = tuning.tune(
+      model_params,
+      args.clips,
+      objectives=objectives,
+      threads=args.threads,
+      repeat=args.repeat,
+      save=not args.dry_run,
+      directory=args.profiles_dir,
+      max_states=args.max_states
+    )
+
+  if args.json:
+    print(json.dumps({objective: profile.to_dict() if profile else None for objective, profile in profiles.items()}, indent=2))
+    return 0
+
+  print(f"Host {tuning.host_id()}: {tuning.host_info()}")
+  for objective, profile in profiles.items():
+    if profile is None:
+      print(f"{objective}: not tuned")
+    else:
+      _print_profile(profile)
+  if not args.show and not args.dry_run:
+    print(f"Profiles saved to {tuning.profile_path(args.profiles_dir)}")
+  return 0
+
+
+def transcribe_command(args: argparse.Namespace):
+  from .whispy import ModelParams, SpeechToTextParams
+  from . import corpus
+
+  sources = list(args.sources)
+  if args.files_from:
+    sources.extend(corpus.read_file_list(args.files_from))
+  if not sources:
+    print("whispy transcribe needs a directory, a file or --files-from", file=sys.stderr)
+    return 2
+  for output_format in args.format:
+    if output_format not in corpus.OUTPUT_FORMATS:
+      print(f"Unknown output format: {output_format} (choose from {', '.join(corpus.OUTPUT_FORMATS)})", file=sys.stderr)
+      return 2
+
+  try:
+    inputs = corpus.discover_inputs(sources, args.extensions or corpus.AUDIO_EXTENSIONS)
+  except ValueError as e:
+    print(e, file=sys.stderr)
+    return 2
+
+  params = SpeechToTextParams(
+    args.strategy,
+    language=bytes(args.language, encoding="utf-8") if args.language else None,
+    translate=args.translate or None
+  )
+
+  interactive = sys.stderr.isatty() # Redraws a single progress line, logs get one line per input
+
+  def report(progress, item, error):
+    if error is not None:
+      if interactive and not args.quiet:
+        print(file=sys.stderr)
+      print(f"{item.path}: {error}", file=sys.stderr)
+    if not args.quiet:
+      print(f"\r{progress}" if interactive else progress, end="" if interactive else "\n", file=sys.stderr, flush=True)
+
+  progress = corpus.transcribe_corpus(
+    ModelParams(args.model, use_gpu=args.gpu),
+    inputs,
+    args.output,
+    params,
+    formats=args.format,
+    manifest_path=args.manifest,
+    workers=args.workers,
+    threads_per_worker=args.threads_per_worker,
+    force=args.force,
+    rehash=args.rehash,
+    on_progress=report
+  )
+  if interactive and not args.quiet:
+    print(file=sys.stderr)
+  print(f"{progress.n_done} transcribed, {progress.n_skipped} already done, {progress.n_failed} failed: {progress.audio_seconds:.0f} audio s in {progress.elapsed:.0f} s ({progress.throughput:.1f} audio s/s)")
+  return 1 if progress.n_failed else 0
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(prog="whispy", description="whisper.cpp speech to text.")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  transcribe = commands.add_parser("transcribe", help="Transcribes directory trees or file lists with worker processes. Interrupted runs resume where they stopped.")
+  transcribe.add_argument("sources", nargs="*", help="Audio files, or directories walked recursively.")
+  transcribe.add_argument("-o", "--output", required=True, help="Output directory. Subtitles mirror the input tree.")
+  transcribe.add_argument("--files-from", help="File with one input per line, - reads stdin.")
+  transcribe.add_argument("--format", type=_str_list, default=["jsonl"], help="Comma separated jsonl, srt and vtt (default: jsonl, appended to transcripts.jsonl).")
+  transcribe.add_argument("--extensions", type=_str_list, help="Comma separated extensions picked up from directories (default: common audio and video formats).")
+  transcribe.add_argument("--model", default="base", help="Model name or path (default: base).")
+  transcribe.add_argument("--gpu", action="store_true", help="Runs the model on the GPU.")
+  transcribe.add_argument("--strategy", choices=("greedy", "beam_search"), default="greedy", help="Sampling strategy (default: greedy).")
+  transcribe.add_argument("--language", help="Spoken language, e.g. en (default: the model's).")
+  transcribe.add_argument("--translate", action="store_true", help="Translates to English.")
+  transcribe.add_argument("--workers", type=int, help="Worker processes (default: the tuned profile, or as many as fit in the available cores).")
+  transcribe.add_argument("--threads-per-worker", type=int, help="whisper.cpp threads per worker.")
+  transcribe.add_argument("--manifest", help="Resume manifest (default: OUTPUT/manifest.jsonl).")
+  transcribe.add_argument("--force", action="store_true", help="Transcribes inputs the manifest marks as done again.")
+  transcribe.add_argument("--rehash", action="store_true", help="Hashes every input, even those whose size and modification time did not change.")
+  transcribe.add_argument("--quiet", action="store_true", help="Only prints errors and the summary.")
+  transcribe.set_defaults(handler=transcribe_command)
+
+  tune = commands.add_parser("tune", help="Finds the fastest n_threads and worker topology of a model on this host and stores them as its profile.")
+  tune.add_argument("clips", nargs="*", help="Representative audio files to calibrate with.")
+  tune.add_argument("--model", default="base", help="Model name or path (default: base).")
+  tune.add_argument("--gpu", action="store_true", help="Runs the model on the GPU.")
+  tune.add_argument("--objective", choices=("latency", "throughput"), help="Tunes a single objective (default: both).")
+  tune.add_argument("--threads", type=_int_list, help="Comma separated n_threads values to try (default: powers of two up to the available cores).")
+  tune.add_argument("--max-states", type=int, default=8, help="Most concurrent transcriptions tried for throughput, each one holds a whisper state (default: 8).")
+  tune.add_argument("--repeat", type=int, default=2, help="Timed runs per configuration, the median is kept (default: 2).")
+  tune.add_argument("--profiles-dir", help="Where profiles are stored (default: $WHISPY_PROFILES_DIR or ~/.cache/whispy/profiles).")
+  tune.add_argument("--dry-run", action="store_true", help="Reports the best configuration without saving it.")
+  tune.add_argument("--show", action="store_true", help="Prints the stored profile instead of tuning.")
+  tune.add_argument("--json", action="store_true", help="Prints the profiles as JSON.")
+  tune.set_defaults(handler=tune_command)
+
+  return parser
+
+
+def main(argv: list[str] | None = None):
+  args = build_parser().parse_args(argv)
+  return args.handler(args)
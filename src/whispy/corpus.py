@@ -0,0 +1,402 @@
+"""Resumable transcription of directory trees and file lists (see `whispy transcribe`).
+
+Outputs are written as soon as every input is done, and a manifest records which inputs were transcribed, with which content hash and settings, so an interrupted run picks up where it stopped instead of starting from zero.
+"""
+from typing import Callable, Iterable
+from os.path import join, isdir, abspath, relpath, basename, dirname, splitext
+import json
+import time
+import os
+
+from .results import TranscriptResult
+from .pcm_cache import hash_file
+from .result_cache import canonical_params
+
+
+AUDIO_EXTENSIONS = (".pcmf32", ".wav", ".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac", ".webm", ".mp4", ".mkv")
+"""Files picked up when walking a directory. Explicitly listed files are taken whatever their extension.
+"""
+
+OUTPUT_FORMATS = ("jsonl", "srt", "vtt")
+"""`jsonl` appends one line per input to `transcripts.jsonl`, `srt` and `vtt` write subtitles next to each other, mirroring the input tree.
+"""
+
+JSONL_FILE = "transcripts.jsonl"
+MANIFEST_FILE = "manifest.jsonl"
+
+
+class CorpusInput:
+  """An audio file of the corpus and where its outputs go.
+  """
+  __slots__ = ("path", "stem", "size", "mtime_ns")
+
+  def __init__(self, path: str, stem: str):
+    self.path = path
+    """Absolute path of the audio file.
+    """
+    self.stem = stem
+    """Path of the outputs relative to the output directory, without extension.
+    """
+    self.size = 0
+    self.mtime_ns = 0
+
+  def __repr__(self):
+    return f"CorpusInput(path={self.path!r}, stem={self.stem!r})"
+
+
+def discover_inputs(sources: Iterable[str], extensions: Iterable[str] = AUDIO_EXTENSIONS):
+  """Expands directories into the audio files they contain, recursively and in a stable order.
+
+  Outputs mirror the tree below each directory, files given on their own keep their base name.
+
+  Raises:
+      ValueError: If two inputs would write the same outputs.
+
+  Returns:
+      list[CorpusInput]: Every input, once.
+  """
+  extensions = tuple(extension.lower() for extension in extensions)
+  inputs: list[CorpusInput] = []
+  seen_paths: set[str] = set()
+  stems: dict[str, str] = {}
+
+  def add(path: str, relative: str):
+    path = abspath(path)
+    if path in seen_paths:
+      return
+    stem = splitext(relative)[0]
+    if stem in stems:
+      raise ValueError(f"{stems[stem]} and {path} would write the same outputs")
+    seen_paths.add(path)
+    stems[stem] = path
+    inputs.append(CorpusInput(path, stem))
+
+  for source in sources:
+    if not isdir(source):
+      add(source, basename(source))
+      continue
+    for root, directories, files in os.walk(source):
+      directories.sort()
+      for name in sorted(files):
+        if name.lower().endswith(extensions):
+          path = join(root, name)
+          add(path, relpath(path, source))
+  return inputs
+
+
+def read_file_list(path: str):
+  """Reads one input path per line, "-" reads them from stdin. Blank lines and lines starting with # are skipped.
+  """
+  import sys
+
+  def lines(source):
+    return [line.strip() for line in source if line.strip() and not line.lstrip().startswith("#")]
+
+  if path == "-":
+    return lines(sys.stdin)
+  with open(path, "r") as list_file:
+    return lines(list_file)
+
+
+def run_fingerprint(model_name: str, params):
+  """Identifies the settings of a run. Inputs transcribed with other settings are done again.
+
+  Returns:
+      str | None: None if the parameters cannot be identified (see `canonical_params`), then every input is done again.
+  """
+  try:
+    return json.dumps(dict(model=model_name, params=canonical_params(params)), sort_keys=True)
+  except TypeError:
+    return None
+
+
+class Manifest:
+  """Append-only JSON lines record of the inputs of a corpus, keyed by their absolute path. The last line of an input wins.
+
+  Every finished input is flushed to disk right away, so a crash loses at most the inputs that were in flight. A line truncated by a crash is ignored.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self.entries: dict[str, dict] = {}
+    try:
+      with open(path, "r") as manifest_file:
+        for line in manifest_file:
+          try:
+            entry = json.loads(line)
+          except ValueError:
+            continue
+          self.entries[entry["path"]] = entry
+    except FileNotFoundError:
+      pass
+
+    os.makedirs(dirname(abspath(path)), exist_ok=True)
+    self._file = open(path, "a")
+
+  def is_done(self, item: CorpusInput, fingerprint: str | None, rehash: bool = False):
+    """Whether an input was already transcribed with the same contents and settings.
+
+    The content hash of an input whose size and modification time did not change is trusted without reading the file again, unless `rehash`.
+
+    Returns:
+        tuple[bool, str]: Whether it is done, and its content hash.
+    """
+    entry = self.entries.get(item.path)
+    unchanged = entry is not None and entry["size"] == item.size and entry["mtime_ns"] == item.mtime_ns
+    content_hash = entry["hash"] if unchanged and not rehash else hash_file(item.path)
+
+    done = fingerprint is not None and entry is not None and entry["status"] == "done" and entry["hash"] == content_hash and entry["fingerprint"] == fingerprint
+    if done and not unchanged: # Touched but identical, keeps the fast path for the next run
+      self.record(dict(entry, size=item.size, mtime_ns=item.mtime_ns)) # type: ignore
+    return done, content_hash
+
+  def record(self, entry: dict):
+    self.entries[entry["path"]] = entry
+    self._file.write(json.dumps(entry) + "\n")
+    self._file.flush()
+
+  def jsonl_end(self):
+    """Where the last `transcripts.jsonl` line recorded as done ends, 0 if there is none. Anything past it was written by a run that crashed before recording it.
+    """
+    return max((entry.get("jsonl_end", 0) for entry in self.entries.values() if entry["status"] == "done"), default=0)
+
+  def rewrite(self):
+    """Replaces the manifest with a single line per input, its current entry.
+    """
+    self._file.close()
+    _write_atomic(abspath(self.path), "".join(json.dumps(entry) + "\n" for entry in self.entries.values()))
+    self._file = open(self.path, "a")
+
+  def close(self):
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.close()
+
+
+class CorpusProgress:
+  """Counters of a corpus run, with its throughput and an ETA based on the bytes left to transcribe.
+  """
+
+  def __init__(self, n_total: int, bytes_total: int):
+    self.n_total = n_total
+    self.n_done = 0
+    self.n_skipped = 0
+    self.n_failed = 0
+    self.bytes_total = bytes_total
+    self.bytes_done = 0
+    """Bytes of the inputs transcribed (or failed) by this run, skipped ones excluded.
+    """
+    self.bytes_skipped = 0
+    self.audio_seconds = 0.0
+    self.start = time.monotonic()
+
+  @property
+  def elapsed(self):
+    return time.monotonic() - self.start
+
+  @property
+  def throughput(self):
+    """Audio seconds transcribed per second of this run.
+    """
+    elapsed = self.elapsed
+    return self.audio_seconds / elapsed if elapsed > 0 else 0.0
+
+  @property
+  def eta_seconds(self):
+    """Seconds left at the pace of this run, None until an input was transcribed.
+    """
+    if not self.bytes_done:
+      return None
+    bytes_left = self.bytes_total - self.bytes_skipped - self.bytes_done
+    return max(0.0, bytes_left * self.elapsed / self.bytes_done)
+
+  def __str__(self):
+    eta = self.eta_seconds
+    n_finished = self.n_done + self.n_skipped + self.n_failed
+    return (
+      f"[{n_finished}/{self.n_total}] {self.n_done} done, {self.n_skipped} skipped, {self.n_failed} failed"
+      f" | {self.throughput:.1f} audio s/s"
+      f" | ETA {_format_duration(eta) if eta is not None else '?'}"
+    )
+
+
+def _format_duration(seconds: float):
+  minutes, seconds = divmod(int(seconds), 60)
+  hours, minutes = divmod(minutes, 60)
+  return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _write_atomic(path: str, text: str):
+  os.makedirs(dirname(path), exist_ok=True)
+  staging = f"{path}.{os.getpid()}.tmp"
+  with open(staging, "w", encoding="utf-8") as output:
+    output.write(text)
+  os.replace(staging, path) # Resumed runs never find partial subtitles
+
+
+def compact_jsonl(path: str, manifest: Manifest):
+  """Rewrites `transcripts.jsonl` with one line per input the manifest records as done: the last one with the content hash it records. Lines of inputs transcribed again, failed since, or written by a run that crashed before recording them are dropped.
+
+  The manifest is rewritten afterwards with the new end of every line. A crash in between leaves lines that are already compacted, and compacting them again is harmless.
+  """
+  done = {item_path: entry["hash"] for item_path, entry in manifest.entries.items() if entry["status"] == "done"}
+  current: dict[str, int] = {}
+  with open(path, "rb") as source:
+    offset = 0
+    for line in source:
+      try:
+        record = json.loads(line)
+      except ValueError: # Truncated by a crash
+        record = None
+      if record is not None and done.get(record.get("path")) == record.get("hash"):
+        current[record["path"]] = offset
+      offset += len(line)
+
+  keep = {offset: item_path for item_path, offset in current.items()}
+  staging = f"{path}.{os.getpid()}.tmp"
+  with open(path, "rb") as source, open(staging, "wb") as compacted:
+    offset = 0
+    for line in source:
+      item_path = keep.get(offset)
+      offset += len(line)
+      if item_path is not None:
+        compacted.write(line)
+        manifest.entries[item_path] = dict(manifest.entries[item_path], jsonl_end=compacted.tell())
+  os.replace(staging, path)
+  manifest.rewrite()
+
+
+def transcribe_corpus(
+  model_params,
+  inputs: list[CorpusInput],
+  output_dir: str,
+  params=None,
+  formats: Iterable[str] = ("jsonl",),
+  manifest_path: str | None = None,
+  workers: int | None = None,
+  threads_per_worker: int | None = None,
+  force: bool = False,
+  rehash: bool = False,
+  on_progress: Callable[[CorpusProgress, CorpusInput, str | None], None] | None = None
+):
+  """Transcribes a corpus with worker processes (see `batch.transcribe_many`), skipping the inputs a previous run already did.
+
+  Inputs are hashed lazily, as the workers ask for more work, so hashing overlaps with inference. Failed inputs are recorded too and tried again by the next run.
+
+  `transcripts.jsonl` holds a single line per input once the run ends: lines left behind by inputs transcribed again (`force`, changed contents or settings) or by a run that crashed are dropped with `compact_jsonl`.
+
+  Args:
+      model_params (ModelParams): The model every worker loads.
+      inputs (list[CorpusInput]): See `discover_inputs`.
+      output_dir (str): Where outputs and, by default, the manifest are written.
+      params (SpeechToTextParams | None, optional): Transcription parameters. Defaults to greedy sampling.
+      formats (Iterable[str], optional): Any of `OUTPUT_FORMATS`. Defaults to ("jsonl",).
+      manifest_path (str | None, optional): Defaults to `manifest.jsonl` within `output_dir`.
+      workers (int | None, optional): Worker processes. Defaults to the throughput profile of this host, if any.
+      threads_per_worker (int | None, optional): whisper.cpp threads per worker.
+      force (bool, optional): Transcribes every input again. Defaults to False.
+      rehash (bool, optional): Hashes inputs whose size and modification time did not change too. Defaults to False.
+      on_progress (Callable | None, optional): Called after every input with the progress, the input and its error, if it failed. Skipped inputs are reported too.
+
+  Returns:
+      CorpusProgress: The final counters.
+  """
+  from .whispy import SpeechToTextParams
+  from .batch import transcribe_many
+
+  formats = tuple(formats)
+  for output_format in formats:
+    if output_format not in OUTPUT_FORMATS:
+      raise ValueError(f"Unknown output format: {output_format!r}")
+  if params is None:
+    params = SpeechToTextParams("greedy")
+
+  for item in inputs:
+    try:
+      stat = os.stat(item.path)
+    except OSError: # Reported as a failure of the input when it is hashed
+      continue
+    item.size, item.mtime_ns = stat.st_size, stat.st_mtime_ns
+  progress = CorpusProgress(len(inputs), sum(item.size for item in inputs))
+  fingerprint = run_fingerprint(model_params._get_whispy_params()["model_name"], params)
+
+  os.makedirs(output_dir, exist_ok=True)
+  manifest = Manifest(manifest_path or join(output_dir, MANIFEST_FILE))
+  jsonl_path = join(output_dir, JSONL_FILE)
+  if "jsonl" in formats and manifest.jsonl_end() and os.path.exists(jsonl_path) and os.path.getsize(jsonl_path) > manifest.jsonl_end():
+    compact_jsonl(jsonl_path, manifest)
+  jsonl = open(jsonl_path, "ab") if "jsonl" in formats else None
+  submitted: list[tuple[CorpusInput, str]] = []
+  n_stale = 0 # Lines of transcripts.jsonl replaced by this run
+
+  def pending():
+    for item in inputs:
+      try:
+        done, content_hash = manifest.is_done(item, fingerprint, rehash)
+      except OSError as e:
+        progress.n_failed += 1
+        if on_progress is not None:
+          on_progress(progress, item, f"{type(e).__name__}: {e}")
+        continue
+      if done and not force:
+        progress.n_skipped += 1
+        progress.bytes_skipped += item.size
+        if on_progress is not None:
+          on_progress(progress, item, None)
+        continue
+      submitted.append((item, content_hash))
+      yield item.path
+
+  def finish(item: CorpusInput, content_hash: str, result: TranscriptResult):
+    outputs = []
+    jsonl_end = None
+    for output_format in formats:
+      if output_format == "jsonl":
+        jsonl.write((json.dumps(dict(path=item.path, hash=content_hash, **result.to_dict())) + "\n").encode("utf-8")) # type: ignore
+        jsonl.flush() # type: ignore
+        jsonl_end = jsonl.tell() # type: ignore
+        continue
+      path = join(output_dir, f"{item.stem}.{output_format}")
+      _write_atomic(path, result.to_srt() if output_format == "srt" else result.to_vtt())
+      outputs.append(path)
+    return outputs, jsonl_end
+
+  try:
+    for batch_result in transcribe_many(model_params, pending(), params, workers, threads_per_worker):
+      item, content_hash = submitted[batch_result.index]
+      entry = dict(path=item.path, hash=content_hash, size=item.size, mtime_ns=item.mtime_ns, fingerprint=fingerprint)
+      progress.bytes_done += item.size
+
+      previous = manifest.entries.get(item.path)
+      if previous is not None and previous["status"] == "done" and "jsonl_end" in previous:
+        n_stale += 1 # Replaced by the new line, or dropped if this one fails
+
+      error = batch_result.error
+      if error is None:
+        try:
+          outputs, jsonl_end = finish(item, content_hash, batch_result.result) # type: ignore
+        except OSError as e:
+          error = f"{type(e).__name__}: {e}"
+        else:
+          progress.n_done += 1
+          progress.audio_seconds += batch_result.result.audio_seconds or 0.0 # type: ignore
+          if jsonl_end is not None:
+            entry["jsonl_end"] = jsonl_end
+          manifest.record(dict(entry, status="done", outputs=outputs, audio_seconds=batch_result.result.audio_seconds)) # type: ignore
+      if error is not None:
+        progress.n_failed += 1
+        manifest.record(dict(entry, status="error", error=error))
+
+      if on_progress is not None:
+        on_progress(progress, item, error)
+  finally:
+    if jsonl is not None:
+      jsonl.close()
+      if n_stale:
+        compact_jsonl(jsonl_path, manifest)
+    manifest.close()
+  return progress
@@ -1,19 +1,34 @@
+import threading
 import ctypes
-from .utils import get_libwhispy_path
+from . import utils
 from .whisper_bindings import *
 
 class LibWhispy:
   """Loads the backend library `libwhispy.so` using `ctypes.CDLL`.
+
+  Loading is deferred until the library is first needed (`dll`, `bool(...)`, `loading_error`...), so importing whispy does not pay for linking libwhisper, libggml and ffmpeg. The first use loads and binds the library exactly once, even from several threads.
   """
   def __init__(self):
     self._loading_error = ""
-    try:
-      self._lib_path = get_libwhispy_path()
-      self._lib = ctypes.CDLL(self._lib_path)
-    except Exception as e:
-      self._loading_error = str(e)
-    else:
-      bind_c_api(self._lib)
+    self._lib_path: str | None = None
+    self._lib: ctypes.CDLL | None = None
+    self._loaded = False
+    self._load_lock = threading.Lock()
+
+  def _load(self):
+    if self._loaded:
+      return
+    with self._load_lock:
+      if self._loaded:
+        return
+      try:
+        self._lib_path = utils.get_libwhispy_path()
+        self._lib = ctypes.CDLL(self._lib_path)
+      except Exception as e:
+        self._loading_error = str(e)
+      else:
+        bind_c_api(self._lib)
+      self._loaded = True
 
   def dll(self):
     """Returns an instance of `ctypes.CDLL` with backend library loaded.
@@ -24,17 +39,27 @@ class LibWhispy:
     Returns:
         ctypes.CDLL: The backend shared library.
     """
+    self._load()
     if len(self._loading_error):
       raise RuntimeError(self._loading_error)
     return self._lib
-  
-  @property 
+
+  @property
+  def loaded(self):
+    """Whether loading the library was already attempted.
+    """
+    return self._loaded
+
+  @property
   def lib_path(self):
+    self._load()
     return self._lib_path
-  
-  @property 
+
+  @property
   def loading_error(self):
+    self._load()
     return self._loading_error
 
   def __bool__(self):
-    return len(self._loading_error) == 0
\ No newline at end of file
+    self._load()
+    return len(self._loading_error) == 0
@@ -0,0 +1,198 @@
+from typing import Iterable, Iterator
+from collections import Counter, deque
+from array import array
+
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view
+from .audio import iter_audio_blocks, prefetch, find_quiet_point
+from .results import TranscriptSegment, TranscriptResult
+
+
+class AudioChunk:
+  """A piece of a long recording that is transcribed on its own.
+
+  The chunk owns the audio between `start` and `end`, but it is decoded with some extra context on each side (`padded_start` to `padded_end`) so words at the boundaries are not lost. Only the segments whose midpoint lies within the owned range are kept.
+  """
+
+  __slots__ = ("index", "start", "end", "padded_start", "padded_end")
+
+  def __init__(self, index: int, start: int, end: int, padded_start: int, padded_end: int):
+    self.index = index
+    self.start = start
+    self.end = end
+    self.padded_start = padded_start
+    self.padded_end = padded_end
+
+  def __repr__(self):
+    return f"AudioChunk(index={self.index}, start={self.start}, end={self.end})"
+
+
+def plan_chunks(
+  samples: memoryview,
+  chunk_seconds: float = 120.0,
+  search_seconds: float = 2.0,
+  overlap_seconds: float = 1.0
+):
+  """Splits a recording into chunks at low-energy points.
+
+  Args:
+      samples (memoryview): A float32 view over the PCM samples.
+      chunk_seconds (float, optional): Preferred length of every chunk. Defaults to 120.0.
+      search_seconds (float, optional): How far a boundary may move to find a quiet point. Defaults to 2.0.
+      overlap_seconds (float, optional): Extra context decoded on each side of a boundary. Defaults to 1.0.
+
+  Returns:
+      list[AudioChunk]: Consecutive chunks that cover the whole recording.
+  """
+  n_samples = len(samples)
+  chunk_size = int(chunk_seconds * PCM_SAMPLE_RATE)
+  search = int(search_seconds * PCM_SAMPLE_RATE)
+  overlap = int(overlap_seconds * PCM_SAMPLE_RATE)
+
+  boundaries = [0]
+  while n_samples - boundaries[-1] > chunk_size + search:
+    boundaries.append(find_quiet_point(samples, boundaries[-1] + chunk_size, search))
+  boundaries.append(n_samples)
+
+  return [
+    AudioChunk(
+      index, start, end,
+      max(0, start - overlap),
+      min(n_samples, end + overlap)
+    )
+    for index, (start, end) in enumerate(zip(boundaries, boundaries[1:]))
+  ]
+
+
+def iter_chunks(
+  blocks: Iterable[object],
+  chunk_seconds: float = 120.0,
+  search_seconds: float = 2.0,
+  overlap_seconds: float = 1.0
+) -> Iterator[tuple[AudioChunk, array]]:
+  """Same as `plan_chunks`, but over a stream of sample blocks (see `iter_audio_blocks`), so the whole recording never needs to be in memory.
+
+  Only the audio of the chunk being planned, plus its lookahead, is kept at once.
+
+  Yields:
+      tuple[AudioChunk, array]: Every chunk with its padded samples.
+  """
+  chunk_size = int(chunk_seconds * PCM_SAMPLE_RATE)
+  search = int(search_seconds * PCM_SAMPLE_RATE)
+  overlap = int(overlap_seconds * PCM_SAMPLE_RATE)
+
+  buffer = array("f")
+  buffer_start = 0 # Position of buffer[0] within the recording.
+  chunk_start = 0
+  index = 0
+
+  def take(chunk: AudioChunk):
+    return buffer[chunk.padded_start - buffer_start: chunk.padded_end - buffer_start]
+
+  def split(lookahead: int):
+    nonlocal buffer_start, chunk_start, index
+    while buffer_start + len(buffer) - chunk_start > chunk_size + search + lookahead:
+      end = buffer_start + len(buffer)
+      with memoryview(buffer) as view:
+        boundary = buffer_start + find_quiet_point(view, chunk_start - buffer_start + chunk_size, search)
+      chunk = AudioChunk(index, chunk_start, boundary, max(0, chunk_start - overlap), min(end, boundary + overlap))
+      yield chunk, take(chunk)
+
+      index += 1
+      chunk_start = boundary
+      drop = max(0, chunk_start - overlap) - buffer_start
+      del buffer[:drop]
+      buffer_start += drop
+
+  # Boundaries need `overlap` samples past them while more audio may come.
+  for block in blocks:
+    buffer.frombytes(pcm_f32_view(block).cast("B"))
+    yield from split(overlap)
+  yield from split(0)
+
+  end = buffer_start + len(buffer)
+  chunk = AudioChunk(index, chunk_start, end, max(0, chunk_start - overlap), end)
+  yield chunk, take(chunk)
+
+
+def merge_chunk_segments(chunk: AudioChunk, result: TranscriptResult):
+  """Moves the segments of a chunk to the timeline of the whole recording and drops the ones that belong to its neighbours.
+  """
+  offset_cs = chunk.padded_start * 100 // PCM_SAMPLE_RATE
+  start_cs = chunk.start * 100 // PCM_SAMPLE_RATE
+  end_cs = chunk.end * 100 // PCM_SAMPLE_RATE
+
+  segments = []
+  for segment in result.segments:
+    t0, t1 = segment.t0 + offset_cs, segment.t1 + offset_cs
+    if start_cs <= (t0 + t1) // 2 < end_cs:
+      segments.append(TranscriptSegment(segment.text, t0, t1, segment.no_speech_prob))
+  return segments
+
+
+def transcribe_long(
+  model,
+  speech: str | object,
+  params,
+  chunk_seconds: float = 120.0,
+  overlap_seconds: float = 1.0,
+  max_workers: int | None = None
+):
+  """Transcribes a long recording by splitting it into chunks that are transcribed in parallel on separate whisper states.
+
+  Chunks are sliced from the decoded PCM instead of using `offset_ms`/`duration_ms`, since whisper.cpp computes the spectrogram of the whole input on every `whisper_full` call.
+
+  Files are decoded as a stream on a background thread, overlapped with the inference of the chunks already decoded. Only a bounded number of chunks is in memory at once, so peak memory does not depend on the length of the recording.
+
+  Args:
+      model (WhispyModel): The model whose state pool runs the chunks.
+      speech (str | object): A path to an audio file or PCM samples already in memory.
+      params (SpeechToTextParams): Transcription parameters of every chunk.
+      chunk_seconds (float, optional): Preferred length of every chunk. Defaults to 120.0.
+      overlap_seconds (float, optional): Extra context decoded on each side of a boundary. Defaults to 1.0.
+      max_workers (int | None, optional): Chunks transcribed at once. Defaults to the size of the model's state pool.
+
+  Returns:
+      TranscriptResult: The stitched transcription, with timestamps relative to the beginning of the recording.
+  """
+  max_workers = max_workers or model.states.size
+
+  # Cached PCM is already on disk, so it is mapped instead of decoded again.
+  if isinstance(speech, str) and model.pcm_cache is not None:
+    speech = model.pcm_cache.get_or_decode(model.dll(), speech)
+
+  if isinstance(speech, str):
+    blocks = prefetch(iter_audio_blocks(model.dll(), speech))
+    chunks = iter_chunks(blocks, chunk_seconds, overlap_seconds=overlap_seconds)
+  else:
+    samples = pcm_f32_view(speech)
+    chunks = (
+      (chunk, samples[chunk.padded_start: chunk.padded_end])
+      for chunk in plan_chunks(samples, chunk_seconds, overlap_seconds=overlap_seconds)
+    )
+
+  segments: list[TranscriptSegment] = []
+  languages: Counter = Counter()
+
+  def collect(future):
+    chunk, result = future.result()
+    segments.extend(merge_chunk_segments(chunk, result))
+    if result.language:
+      languages[result.language] += 1
+
+  def run(chunk: AudioChunk, chunk_samples: object):
+    return chunk, model.transcribe(chunk_samples, params)
+
+  # Chunks are collected in submission order, so the output does not depend on which chunk finishes first.
+  from concurrent.futures import ThreadPoolExecutor
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    in_flight: deque = deque()
+    for chunk, chunk_samples in chunks:
+      in_flight.append(executor.submit(run, chunk, chunk_samples))
+      if len(in_flight) > max_workers:
+        collect(in_flight.popleft())
+    while in_flight:
+      collect(in_flight.popleft())
+
+  language = languages.most_common(1)[0][0] if languages else None
+  return TranscriptResult(segments, language)
@@ -0,0 +1,239 @@
+from bisect import bisect_left
+import threading
+import time
+
+from .whisper_bindings import whispy_timings
+
+
+class _StageTimer:
+  __slots__ = ("_timings", "_stage", "_start")
+
+  def __init__(self, timings: "Timings", stage: str):
+    self._timings = timings
+    self._stage = stage
+
+  def __enter__(self):
+    self._start = time.perf_counter_ns()
+    return self
+
+  def __exit__(self, *_):
+    self._timings.add(self._stage, (time.perf_counter_ns() - self._start) / 1e6)
+
+
+class Timings:
+  """Where the time of a transcription went, in milliseconds.
+
+  Wrapper-side stages are measured around each step of `WhispyModel.transcribe`:
+
+  1. `cache`: looking up and storing the result in the result cache.
+  2. `decode`: reading and decoding (libav decode and resample) compressed inputs.
+  3. `vad`: voice activity detection.
+  4. `queue`: waiting for a free whisper state.
+  5. `inference`: the backend call, including raw PCM file I/O.
+  6. `extract`: reading the segments back from the backend.
+  7. `total`: the whole call.
+
+  `native` holds the backend's view of the inference (see `whispy_timings`): raw PCM file I/O (`load_ms`), log-mel spectrogram (`mel_ms`), the whole `whisper_full` call (`inference_ms`), encoder windows (`n_windows`), the time spent encoding and decoding them (`encode_ms`, `decode_ms`, measured by whispy around whisper.cpp's callbacks) and, only for contexts that own their whisper state (never the pooled states of `WhispyModel`), whisper.cpp's internal sample/batchd/prompt timings.
+  """
+  __slots__ = ("stages", "native")
+
+  def __init__(self):
+    self.stages: dict[str, float] = {}
+    self.native: dict[str, float] | None = None
+
+  def measure(self, stage: str):
+    """Returns a context manager that adds the time spent within it to `stage`.
+    """
+    return _StageTimer(self, stage)
+
+  def add(self, stage: str, ms: float):
+    self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+  def set_native(self, native: whispy_timings):
+    """Copies the timings the backend left within a transcript context.
+    """
+    self.native = dict(
+      load_ms=native.load_ms,
+      mel_ms=native.mel_ms,
+      inference_ms=native.inference_ms,
+      n_windows=native.n_windows
+    )
+    for field in ("encode_ms", "decode_ms", "sample_ms", "batchd_ms", "prompt_ms"):
+      value = getattr(native, field)
+      if value >= 0:
+        self.native[field] = value
+
+  @property
+  def total_ms(self):
+    return self.stages.get("total", 0.0)
+
+  def to_dict(self):
+    return dict(stages=dict(self.stages), native=dict(self.native) if self.native is not None else None)
+
+  def __repr__(self):
+    stages = ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in self.stages.items())
+    return f"Timings({stages})"
+
+
+# Metrics
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+"""Upper bounds of the histogram buckets, in the unit of the observed values (seconds for durations).
+"""
+
+HELP = {
+  "whispy_transcriptions_total": "Transcriptions by outcome (ok, error, aborted, timeout).",
+  "whispy_audio_seconds_total": "Seconds of input audio transcribed.",
+  "whispy_vad_skipped_seconds_total": "Seconds of input audio the voice activity detection stage kept away from inference.",
+  "whispy_result_cache_total": "Result cache lookups by outcome (hit, miss).",
+  "whispy_stage_seconds": "Time spent in each stage of a transcription.",
+  "whispy_realtime_factor": "Processing seconds per second of input audio.",
+  "whispy_warmup_seconds": "Time spent warming a model up before serving.",
+  "whispy_server_requests_total": "Requests answered by the transcription server, by endpoint and status.",
+}
+
+
+class MetricsSink:
+  """Receives the metrics of whispy. This base class discards them; subclass it to forward them anywhere (StatsD, OpenTelemetry, logs...).
+
+  Labels are passed as keyword arguments. Both methods are called from the transcribing threads, so they must be thread-safe and cheap.
+  """
+
+  def inc(self, name: str, value: float = 1.0, **labels: str):
+    """Adds `value` to a counter.
+    """
+
+  def observe(self, name: str, value: float, **labels: str):
+    """Records a value within a histogram.
+    """
+
+
+class MetricsRegistry(MetricsSink):
+  """In-memory counters and fixed-bucket histograms, exportable as Prometheus text (see `prometheus_text`).
+  """
+
+  def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+    self.buckets = tuple(sorted(buckets))
+    self._counters: dict[tuple, float] = {}
+    self._histograms: dict[tuple, list] = {}
+    self._lock = threading.Lock()
+
+  def inc(self, name: str, value: float = 1.0, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0.0) + value
+
+  def observe(self, name: str, value: float, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    bucket = bisect_left(self.buckets, value)
+    with self._lock:
+      histogram = self._histograms.get(key)
+      if histogram is None:
+        # Per bucket counts (plus +Inf), sum and count.
+        histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+      histogram[0][bucket] += 1
+      histogram[1] += value
+      histogram[2] += 1
+
+  def counter(self, name: str, **labels: str):
+    with self._lock:
+      return self._counters.get((name, tuple(sorted(labels.items()))), 0.0)
+
+  def reset(self):
+    with self._lock:
+      self._counters.clear()
+      self._histograms.clear()
+
+  def prometheus_text(self):
+    """Renders every metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    with self._lock:
+      counters = sorted(self._counters.items())
+      histograms = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._histograms.items())
+
+    lines = []
+    described = set()
+
+    def describe(name: str, kind: str):
+      if name in described:
+        return
+      described.add(name)
+      if name in HELP:
+        lines.append(f"# HELP {name} {HELP[name]}")
+      lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+      describe(name, "counter")
+      lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for (name, labels), (counts, total, count) in histograms:
+      describe(name, "histogram")
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+        cumulative += bucket_count
+        le = "+Inf" if bound == float("inf") else _format_value(bound)
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+      lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+      lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str):
+  return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: tuple):
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+def _format_value(value: float):
+  return repr(float(value)) if value != int(value) else str(int(value))
+
+
+_sink: MetricsSink = MetricsRegistry()
+_sink_lock = threading.Lock()
+
+def get_sink():
+  """The sink that receives the metrics of every model. Defaults to an in-memory `MetricsRegistry`.
+  """
+  return _sink
+
+def set_sink(sink: MetricsSink | None):
+  """Replaces the global sink. None disables metrics.
+
+  Returns:
+      MetricsSink: The previous sink.
+  """
+  global _sink
+  with _sink_lock:
+    previous, _sink = _sink, sink if sink is not None else MetricsSink()
+  return previous
+
+def prometheus_text():
+  """Renders the metrics of the global sink in the Prometheus text format.
+
+  Raises:
+      TypeError: If the global sink is not a `MetricsRegistry`.
+  """
+  if not isinstance(_sink, MetricsRegistry):
+    raise TypeError(f"The metrics sink {type(_sink).__name__} cannot be exported")
+  return _sink.prometheus_text()
+
+
+def record_transcription(status: str, timings: Timings | None = None, result=None):
+  """Reports the outcome of a transcription to the global sink.
+  """
+  sink = _sink
+  sink.inc("whispy_transcriptions_total", status=status)
+  if timings is not None:
+    for stage, ms in timings.stages.items():
+      sink.observe("whispy_stage_seconds", ms / 1000, stage=stage)
+
+  if result is None or not result.audio_seconds:
+    return
+  sink.inc("whispy_audio_seconds_total", result.audio_seconds)
+  if timings is not None and timings.total_ms:
+    sink.observe("whispy_realtime_factor", timings.total_ms / 1000 / result.audio_seconds)
+  if result.speech_regions is not None:
+    sink.inc("whispy_vad_skipped_seconds_total", result.skipped_seconds)
@@ -0,0 +1,239 @@
+from os.path import join, expanduser, realpath, isfile
+from functools import lru_cache
+import threading
+import hashlib
+import struct
+import mmap
+import os
+
+from .utils import PACKAGE_ROOT, WhisperInitError
+
+
+MODEL_VARIANTS = (
+  "tiny", "tiny.en",
+  "base", "base.en",
+  "small", "small.en",
+  "medium", "medium.en",
+  "large-v1", "large-v2", "large-v3", "large-v3-turbo",
+)
+"""Model names published by whisper.cpp, stored as `ggml-<name>.bin` (see `lib/whisper.cpp/models/download-ggml-model.sh`).
+"""
+
+MODEL_ALIASES = {
+  "large": "large-v3",
+  "turbo": "large-v3-turbo",
+}
+
+GGML_MAGIC = 0x67676d6c
+"""First four bytes of every whisper.cpp model file ("ggml" as a little endian uint32).
+"""
+
+HEADER_FIELDS = (
+  "n_vocab",
+  "n_audio_ctx", "n_audio_state", "n_audio_head", "n_audio_layer",
+  "n_text_ctx", "n_text_state", "n_text_head", "n_text_layer",
+  "n_mels", "ftype",
+)
+
+_HEADER_STRUCT = struct.Struct("<I" + "i" * len(HEADER_FIELDS))
+
+SIZE_BY_AUDIO_STATE = {
+  384: "tiny",
+  512: "base",
+  768: "small",
+  1024: "medium",
+  1280: "large",
+}
+
+
+def model_search_path():
+  """Directories where named models are looked up, in order: `$WHISPY_MODELS_DIR` (a `os.pathsep` separated list), the models shipped within the package and `$XDG_CACHE_HOME/whispy/models`.
+  """
+  directories = [d for d in os.environ.get("WHISPY_MODELS_DIR", "").split(os.pathsep) if d]
+  directories.append(join(PACKAGE_ROOT, "models"))
+  base = os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+  directories.append(join(base, "whispy", "models"))
+  return directories
+
+
+class ModelHeader:
+  """Hyperparameters stored at the start of a ggml model file.
+  """
+  __slots__ = HEADER_FIELDS
+
+  def __init__(self, *values: int):
+    for field, value in zip(HEADER_FIELDS, values):
+      setattr(self, field, value)
+
+  @property
+  def size(self):
+    """The size class of the model (tiny, base, small, medium or large), or None if unknown.
+    """
+    return SIZE_BY_AUDIO_STATE.get(self.n_audio_state) # type: ignore
+
+  @property
+  def multilingual(self):
+    return self.n_vocab >= 51865 # type: ignore
+
+  @property
+  def quantized(self):
+    return self.ftype % 1000 > 1 # type: ignore
+
+  def alignment_heads(self, model_name: str | None = None):
+    """The `whisper_alignment_heads_preset` of the model, what DTW token timestamps are computed from.
+
+    large-v1 and large-v2 share their hyperparameters, so the model name tells them apart. Unknown models use the heads of their top text layers.
+    """
+    from .whisper_bindings import whisper_alignment_heads_preset as preset
+
+    size = self.size
+    if size is None:
+      return preset.N_TOP_MOST
+    if size == "large":
+      if self.n_mels == 128: # type: ignore
+        return preset.LARGE_V3_TURBO if self.n_text_layer == 4 else preset.LARGE_V3 # type: ignore
+      return preset.LARGE_V1 if model_name is not None and "large-v1" in model_name else preset.LARGE_V2
+    return preset[f"{size.upper()}{'' if self.multilingual else '_EN'}"]
+
+  def to_dict(self):
+    return {field: getattr(self, field) for field in HEADER_FIELDS}
+
+  def __repr__(self):
+    return f"ModelHeader(size={self.size!r}, multilingual={self.multilingual}, ftype={self.ftype})" # type: ignore
+
+
+@lru_cache(maxsize=32)
+def _parse_header(path: str, file_size: int, mtime_ns: int):
+  with open(path, "rb") as model_file:
+    data = model_file.read(_HEADER_STRUCT.size)
+  if len(data) < _HEADER_STRUCT.size:
+    raise WhisperInitError(f"Truncated model file: {path}")
+  magic, *values = _HEADER_STRUCT.unpack(data)
+  if magic != GGML_MAGIC:
+    raise WhisperInitError(f"Not a ggml model file: {path}")
+  return ModelHeader(*values)
+
+
+def read_model_header(path: str):
+  """Parses the header of a ggml model file. Results are cached until the file changes.
+
+  Raises:
+      WhisperInitError: If the file is not a ggml model.
+  """
+  path = realpath(path)
+  stat = os.stat(path)
+  return _parse_header(path, stat.st_size, stat.st_mtime_ns)
+
+
+_verified: set[tuple[str, int, int, str]] = set()
+_verified_lock = threading.Lock()
+
+def verify_checksum(path: str, expected: str):
+  """Checks the SHA-256 digest of a model file. Successful checks are remembered until the file changes, so loading the same model again does not hash it again.
+
+  Raises:
+      WhisperInitError: If the digest does not match.
+  """
+  path = realpath(path)
+  stat = os.stat(path)
+  expected = expected.strip().lower()
+  token = (path, stat.st_size, stat.st_mtime_ns, expected)
+  with _verified_lock:
+    if token in _verified:
+      return
+
+  with open(path, "rb") as model_file, mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    digest = hashlib.sha256(data).hexdigest()
+  if digest != expected:
+    raise WhisperInitError(f"Checksum mismatch for {path}: expected {expected}, got {digest}")
+
+  with _verified_lock:
+    _verified.add(token)
+
+
+class ModelEntry:
+  """A model file known to the registry.
+  """
+  __slots__ = ("name", "path", "checksum")
+
+  def __init__(self, name: str, path: str, checksum: str | None = None):
+    self.name = name
+    self.path = path
+    self.checksum = checksum
+
+  def header(self):
+    return read_model_header(self.path)
+
+  def verify(self):
+    """Verifies the file against its checksum, if it has one.
+    """
+    if self.checksum is not None:
+      verify_checksum(self.path, self.checksum)
+
+  def __repr__(self):
+    return f"ModelEntry(name={self.name!r}, path={self.path!r})"
+
+
+class ModelRegistry:
+  """Maps model names to ggml model files.
+
+  A name is resolved, in order, as a model registered with `register`, as one of `MODEL_VARIANTS` (or `MODEL_ALIASES`) looked up in `model_search_path()`, or as the path of a local ggml file. A `<model file>.sha256` file next to a model provides its checksum, unless one was given explicitly.
+  """
+
+  def __init__(self):
+    self._entries: dict[str, ModelEntry] = {}
+    self._lock = threading.Lock()
+
+  def register(self, name: str, path: str, checksum: str | None = None):
+    """Registers a model file under a custom name.
+    """
+    entry = ModelEntry(name, realpath(path), checksum or _sidecar_checksum(path))
+    with self._lock:
+      self._entries[name] = entry
+    return entry
+
+  def resolve(self, name: str):
+    """
+    Returns:
+        ModelEntry | None: The model file, or None if the name is unknown or the file is not available.
+    """
+    with self._lock:
+      entry = self._entries.get(name)
+    if entry is not None:
+      return entry
+
+    variant = MODEL_ALIASES.get(name, name)
+    if variant in MODEL_VARIANTS:
+      for directory in model_search_path():
+        path = join(directory, f"ggml-{variant}.bin")
+        if isfile(path):
+          return ModelEntry(variant, realpath(path), _sidecar_checksum(path))
+      return None
+
+    if isfile(name):
+      return ModelEntry(name, realpath(name), _sidecar_checksum(name))
+    return None
+
+  def available(self):
+    """Names of the registered models and of the variants found in the search path.
+    """
+    with self._lock:
+      names = list(self._entries)
+    names.extend(variant for variant in MODEL_VARIANTS if self.resolve(variant) is not None and variant not in names)
+    return names
+
+  def __contains__(self, name: str):
+    return self.resolve(name) is not None
+
+
+def _sidecar_checksum(path: str):
+  try:
+    with open(path + ".sha256", "r", encoding="utf-8") as sidecar:
+      return sidecar.read().split()[0]
+  except (OSError, IndexError):
+    return None
+
+
+registry = ModelRegistry()
+"""The registry used by `ModelParams.model_name`.
+"""
@@ -0,0 +1,206 @@
+from os.path import join, expanduser
+import threading
+import hashlib
+import ctypes
+import time
+import os
+
+from .utils import PCM_SAMPLE_RATE
+from .audio import RAW_PCM_EXTENSION, load_pcm_file, iter_audio_blocks, pcm_f32_view
+
+try:
+  import fcntl
+except ImportError: # Not available on Windows, eviction is then only safe within a process.
+  fcntl = None
+
+
+RESAMPLER_SETTINGS = f"libav+swresample;rate={PCM_SAMPLE_RATE};channels=1;format=f32le"
+"""Describes how cached samples were produced. It is part of every key, so changing it invalidates old entries.
+"""
+
+HASH_BLOCK_SIZE = 1 << 20 # 1 MiB
+
+
+def default_cache_dir():
+  base = os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+  return join(base, "whispy", "pcm")
+
+
+def hash_file(path: str):
+  """Returns the SHA-256 hex digest of the contents of a file.
+  """
+  digest = hashlib.sha256()
+  with open(path, "rb") as source:
+    while block := source.read(HASH_BLOCK_SIZE):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+class PCMCache:
+  """Content-addressed on-disk cache of decoded mono 16 kHz float32 PCM.
+
+  Entries are raw PCM files (the same format as `inputs/jfk.pcmf32`) named after a hash of the input file contents and the resampler settings, so renamed or copied files still hit. Hits are memory-mapped instead of decoded again.
+
+  Entries are written to a temporary file and atomically renamed into place, so concurrent processes never see partial entries. Once the cache grows beyond `max_bytes`, the least recently used entries are evicted while holding a lock file.
+  """
+
+  def __init__(self, directory: str | None = None, max_bytes: int = 4 << 30):
+    """
+    Args:
+        directory (str | None, optional): Where to store the entries. Defaults to `$XDG_CACHE_HOME/whispy/pcm`.
+        max_bytes (int, optional): Size limit of the cache. Defaults to 4 GiB.
+    """
+    self.directory = directory or default_cache_dir()
+    self.max_bytes = max_bytes
+
+    self.hits = 0
+    self.misses = 0
+    self._counters_lock = threading.Lock()
+
+    os.makedirs(self.directory, exist_ok=True)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_counters_lock"]
+    return state
+
+  def __setstate__(self, state: dict):
+    self.__dict__.update(state)
+    self._counters_lock = threading.Lock()
+
+  def key(self, path: str):
+    """Cache key of an input file: a hash of its contents and the resampler settings.
+    """
+    return hashlib.sha256(f"{hash_file(path)};{RESAMPLER_SETTINGS}".encode()).hexdigest()
+
+  def _entry_path(self, key: str):
+    return join(self.directory, key + RAW_PCM_EXTENSION)
+
+  def _count(self, hit: bool):
+    with self._counters_lock:
+      if hit:
+        self.hits += 1
+      else:
+        self.misses += 1
+
+  def get(self, key: str):
+    """Maps a cached entry into memory.
+
+    Returns:
+        memoryview | None: The cached samples, or None if there is no such entry.
+    """
+    entry = self._entry_path(key)
+    try:
+      os.utime(entry) # Recency for LRU eviction.
+      return load_pcm_file(entry)
+    except (FileNotFoundError, ValueError):
+      return None
+
+  def put(self, key: str, blocks):
+    """Stores the samples of an input, block by block, so it does not need to be in memory at once.
+
+    Args:
+        key (str): The cache key of the input.
+        blocks (Iterable[object]): Blocks of float32 samples.
+
+    Returns:
+        memoryview: The stored samples, memory-mapped. Inputs without samples are not stored and get an empty view.
+    """
+    import tempfile
+    from array import array
+
+    fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as tmp_file:
+        for block in blocks:
+          tmp_file.write(pcm_f32_view(block).cast("B"))
+        empty = tmp_file.tell() == 0
+      if empty: # Empty files cannot be mapped
+        os.unlink(tmp_path)
+        return pcm_f32_view(array("f"))
+      # Mapped before it is published, so neither our eviction nor another process's can take it away.
+      samples = load_pcm_file(tmp_path)
+      os.replace(tmp_path, self._entry_path(key))
+    except BaseException:
+      try:
+        os.unlink(tmp_path)
+      except FileNotFoundError:
+        pass
+      raise
+
+    self.evict()
+    return samples
+
+  def get_or_decode(self, lib: ctypes.CDLL, path: str):
+    """Returns the decoded samples of an audio file, decoding and storing them only on a miss.
+
+    Raw PCM inputs are never cached since they are memory-mapped directly.
+
+    Args:
+        lib (ctypes.CDLL): The backend library with the C api binded.
+        path (str): Path to the audio file.
+
+    Returns:
+        memoryview: The samples of the file, memory-mapped.
+    """
+    if path.endswith(RAW_PCM_EXTENSION):
+      return load_pcm_file(path)
+
+    key = self.key(path)
+    samples = self.get(key)
+    self._count(samples is not None)
+    if samples is not None:
+      return samples
+    return self.put(key, iter_audio_blocks(lib, path))
+
+  def size(self):
+    """Bytes currently used by the entries.
+    """
+    return sum(size for _, _, size in self._entries())
+
+  def _entries(self):
+    entries = []
+    for name in os.listdir(self.directory):
+      if not name.endswith(RAW_PCM_EXTENSION):
+        continue
+      entry = join(self.directory, name)
+      try:
+        stat = os.stat(entry)
+      except FileNotFoundError: # Evicted by another process.
+        continue
+      entries.append((stat.st_mtime, entry, stat.st_size))
+    return entries
+
+  def evict(self):
+    """Removes the least recently used entries until the cache fits in `max_bytes`.
+    """
+    with open(join(self.directory, ".lock"), "w") as lock_file:
+      if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+      entries = sorted(self._entries())
+      total = sum(size for _, _, size in entries)
+      for _, entry, size in entries:
+        if total <= self.max_bytes:
+          break
+        try:
+          os.unlink(entry) # Processes that mapped it keep their mapping.
+        except FileNotFoundError:
+          pass
+        total -= size
+
+      # Temporary files of writers that died are removed after a while.
+      for name in os.listdir(self.directory):
+        if name.endswith(".tmp"):
+          tmp_path = join(self.directory, name)
+          try:
+            if time.time() - os.stat(tmp_path).st_mtime > 24 * 3600:
+              os.unlink(tmp_path)
+          except FileNotFoundError:
+            pass
+
+  def stats(self):
+    return dict(hits=self.hits, misses=self.misses, bytes=self.size(), max_bytes=self.max_bytes)
+
+  def __repr__(self):
+    return f"PCMCache(directory={self.directory!r}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,271 @@
+from typing import Iterable, Iterator
+from multiprocessing.connection import Connection, wait
+import multiprocessing
+import resource
+import copy
+import gc
+import os
+
+from .batch import BatchResult, split_cores, transcribe_item
+from .tuning import tuned_topology
+
+
+def current_rss():
+  """Resident set size of the calling process, in bytes.
+  """
+  try:
+    with open("/proc/self/statm", "r") as statm:
+      return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except OSError: # No procfs, fall back to the peak RSS (KiB on Linux, bytes on macOS).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _worker_main(conn: Connection, model, max_jobs: int | None, max_rss_bytes: int | None, warmup: bool):
+  """Body of a forked worker: transcribes one job at a time until it is told to stop or it retires itself.
+  """
+  if warmup:
+    model.warmup() # Overlaps with the parent waiting for jobs, instead of delaying the first one
+  n_jobs = 0
+  while True:
+    try:
+      job = conn.recv()
+    except EOFError: # The parent went away
+      break
+    if job is None:
+      break
+
+    index, speech, params = job
+    item = transcribe_item(model, index, speech, params)
+    n_jobs += 1
+
+    retiring = (max_jobs is not None and n_jobs >= max_jobs) \
+      or (max_rss_bytes is not None and current_rss() > max_rss_bytes)
+    conn.send((item, retiring))
+    if retiring:
+      break
+  conn.close()
+
+
+class _Worker:
+  __slots__ = ("process", "conn", "job")
+
+  def __init__(self, process, conn: Connection):
+    self.process = process
+    self.conn = conn
+    self.job: tuple[int, str | None] | None = None
+    """The (index, path) of the input being transcribed, if any.
+    """
+
+
+class PreforkPool:
+  """A pool of worker processes forked from a parent that loaded the model once.
+
+  The workers inherit the initialized model weights copy-on-write, so starting or replacing one takes milliseconds instead of a model load. Each worker allocates its own whisper state on its first job and is recycled after `max_jobs` jobs or once its RSS grows beyond `max_rss_bytes`.
+
+  Fork safety: the parent only loads the weights, it never runs inference, so no backend thread pool nor whisper state exists when it forks (`fork` raises `RuntimeError` otherwise). The pool must be started and driven from a single thread, and is only available where the `fork` start method is.
+  """
+
+  def __init__(
+    self,
+    model_params,
+    workers: int | None = None,
+    threads_per_worker: int | None = None,
+    max_jobs: int | None = None,
+    max_rss_bytes: int | None = None,
+    warmup: bool = False
+  ):
+    """
+    Args:
+        model_params (ModelParams): Instructs the parent how to load the model.
+        workers (int | None, optional): Number of worker processes. When both `workers` and `threads_per_worker` are None, the throughput profile of this host is used (see `tuning.tune`), if any (see `split_cores` otherwise).
+        threads_per_worker (int | None, optional): whisper.cpp threads per worker. Overrides the n_threads of the transcription parameters (see `split_cores`).
+        max_jobs (int | None, optional): Jobs after which a worker is replaced. Defaults to None, which means never.
+        max_rss_bytes (int | None, optional): RSS after which a worker is replaced. Defaults to None, which means never.
+        warmup (bool, optional): Every worker warms its state up as soon as it is forked (see `WhispyModel.warmup`), so neither the first jobs nor the ones landing on a replaced worker pay for a cold start. Defaults to False.
+    """
+    if workers is None and threads_per_worker is None:
+      workers, threads_per_worker = tuned_topology(model_params) or (None, None)
+    self._n_workers, self._threads_per_worker = split_cores(workers, threads_per_worker)
+    self._model_params = copy.deepcopy(model_params).n_states(1)
+    self._max_jobs = max_jobs
+    self._max_rss_bytes = max_rss_bytes
+    self._warmup = warmup
+
+    self._context = multiprocessing.get_context("fork")
+    self._model = None
+    self._workers: list[_Worker] = []
+
+    self.n_forked = 0
+    self.n_recycled = 0
+
+  @property
+  def workers(self):
+    return self._n_workers
+
+  def start(self):
+    """Loads the model in this process and forks the workers.
+    """
+    if self._model is not None:
+      return self
+
+    from .whispy import WhispyModel
+    self._model = WhispyModel(self._model_params)
+    while len(self._workers) < self._n_workers:
+      self._workers.append(self._fork())
+    return self
+
+  def _fork(self):
+    if self._model.states.n_created: # type: ignore
+      raise RuntimeError("The parent model ran inference, forking it is not safe")
+
+    # Keep the garbage collector from touching (and so copying) every inherited object.
+    gc.collect()
+    gc.freeze()
+
+    parent_conn, child_conn = self._context.Pipe()
+    process = self._context.Process(
+      target=_worker_main,
+      args=(child_conn, self._model, self._max_jobs, self._max_rss_bytes, self._warmup),
+      daemon=True
+    )
+    process.start()
+    child_conn.close()
+    self.n_forked += 1
+    return _Worker(process, parent_conn)
+
+  def _retire(self, worker: _Worker, timeout: float | None = 5.0):
+    worker.conn.close()
+    worker.process.join(timeout)
+    if worker.process.is_alive():
+      worker.process.kill()
+      worker.process.join()
+    self._workers.remove(worker)
+
+  def _replace(self, worker: _Worker):
+    self._retire(worker)
+    self.n_recycled += 1
+    self._workers.append(self._fork())
+
+  def scale(self, workers: int):
+    """Changes the number of workers. New workers are forked from the loaded model, idle ones are stopped first.
+    """
+    self._n_workers = max(1, workers)
+    if self._model is None:
+      return
+
+    while len(self._workers) < self._n_workers:
+      self._workers.append(self._fork())
+    for worker in sorted(self._workers, key=lambda worker: worker.job is not None):
+      if len(self._workers) <= self._n_workers:
+        break
+      if worker.job is None:
+        worker.conn.send(None)
+        self._retire(worker)
+
+  def map(
+    self,
+    inputs: Iterable[object],
+    params,
+    ordered: bool = False
+  ) -> Iterator[BatchResult]:
+    """Transcribes many inputs with the workers. Each worker takes one input at a time, so `inputs` may be a lazy iterable of any length.
+
+    Args:
+        inputs (Iterable[object]): Audio file paths or picklable PCM buffers (bytes, `array.array`, NumPy arrays...).
+        params (SpeechToTextParams): Transcription parameters. Callbacks are not sent to the workers.
+        ordered (bool, optional): Yields results in input order instead of completion order. Defaults to False.
+
+    Yields:
+        BatchResult: One per input. A worker that dies reports its input as failed and is replaced.
+    """
+    self.start()
+
+    worker_params = copy.copy(params)
+    worker_params._wfull_params_dict = dict(params._wfull_params_dict, n_threads=self._threads_per_worker)
+
+    source = iter(enumerate(inputs))
+    done_ahead: dict[int, BatchResult] = {}
+    next_index = 0
+
+    def collect(item: BatchResult):
+      nonlocal next_index
+      if not ordered:
+        yield item
+        return
+      done_ahead[item.index] = item
+      while next_index in done_ahead:
+        yield done_ahead.pop(next_index)
+        next_index += 1
+
+    try:
+      yield from self._dispatch(source, worker_params, collect)
+    finally:
+      # An abandoned iteration leaves jobs in flight, drop their results so the next call starts clean.
+      for worker in list(self._workers):
+        if worker.job is None:
+          continue
+        worker.job = None
+        try:
+          _, retiring = worker.conn.recv()
+        except (EOFError, OSError):
+          retiring = True
+        if retiring:
+          self._replace(worker)
+
+  def _dispatch(self, source: Iterator, worker_params, collect):
+    exhausted = False
+    while True:
+      # Hand out inputs to the idle workers.
+      for worker in self._workers:
+        if exhausted or worker.job is not None:
+          continue
+        try:
+          index, speech = next(source)
+        except StopIteration:
+          exhausted = True
+          break
+        if isinstance(speech, memoryview):
+          speech = speech.tobytes()
+        worker.job = (index, speech if isinstance(speech, str) else None)
+        worker.conn.send((index, speech, worker_params))
+
+      busy = {worker.conn: worker for worker in self._workers if worker.job is not None}
+      if not busy:
+        break
+
+      for conn in wait(list(busy)):
+        worker = busy[conn]
+        index, path = worker.job # type: ignore
+        worker.job = None
+        try:
+          item, retiring = conn.recv() # type: ignore
+        except (EOFError, OSError): # The worker died, e.g. it was killed by the OOM killer
+          item, retiring = BatchResult(index, path, error=f"Worker {worker.process.pid} exited with code {worker.process.exitcode}"), True
+
+        if retiring:
+          self._replace(worker)
+        yield from collect(item)
+
+  def close(self):
+    """Stops the workers and frees the model.
+    """
+    for worker in list(self._workers):
+      try:
+        worker.conn.send(None)
+      except OSError:
+        pass
+      self._retire(worker)
+    if self._model is not None:
+      self._model.destroy()
+      self._model = None
+    gc.unfreeze()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *_):
+    self.close()
+
+  def __repr__(self):
+    return f"PreforkPool(workers={self._n_workers}, forked={self.n_forked}, recycled={self.n_recycled})"
@@ -0,0 +1,241 @@
+from os.path import join, expanduser, realpath, dirname
+import threading
+import hashlib
+import inspect
+import json
+import time
+import os
+
+from .utils import pcm_f32_view
+from .results import TranscriptResult
+from .pcm_cache import hash_file
+
+
+IGNORED_PARAMS = frozenset((
+  "n_threads",
+  "print_special",
+  "print_progress",
+  "print_realtime",
+  "print_timestampts",
+  "debug_mode",
+))
+"""whisper_full_params fields that do not change the transcription, so they are left out of the cache key.
+"""
+
+
+def default_cache_path():
+  base = os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+  return join(base, "whispy", "results.sqlite3")
+
+
+def _qualified_name(value: object):
+  return f"{getattr(value, '__module__', None)}.{getattr(value, '__qualname__', None)}"
+
+
+def _canonical_value(value: object):
+  if isinstance(value, bytes):
+    return value.hex()
+  if isinstance(value, float):
+    return repr(value)
+  if value is None or isinstance(value, (bool, int, str)):
+    return value
+  if isinstance(value, (list, tuple)):
+    return [_canonical_value(item) for item in value]
+  if isinstance(value, dict):
+    return {str(key): _canonical_value(item) for key, item in sorted(value.items())}
+
+  # Functions are identified by where they are defined, as long as that is enough to tell them apart.
+  if inspect.ismethod(value):
+    return ["method", _qualified_name(value.__func__), _canonical_value(value.__self__)]
+  if inspect.isfunction(value) or inspect.isbuiltin(value):
+    name = _qualified_name(value)
+    if "<lambda>" in name or "<locals>" in name or getattr(value, "__closure__", None):
+      raise TypeError(f"{name} cannot be told apart from other functions of the same name")
+    return ["function", name]
+
+  # Pluggable objects (e.g. voice activity detectors) are identified by their type and settings.
+  settings = dict(getattr(value, "__dict__", None) or {})
+  for cls in type(value).__mro__:
+    slots = cls.__dict__.get("__slots__", ())
+    for slot in (slots,) if isinstance(slots, str) else slots:
+      if slot not in ("__dict__", "__weakref__") and hasattr(value, slot):
+        settings[slot] = getattr(value, slot)
+  if settings or hasattr(value, "__dict__") or hasattr(type(value), "__slots__"):
+    return [_qualified_name(type(value)), {key: _canonical_value(item) for key, item in sorted(settings.items())}]
+  raise TypeError(f"Cannot identify a {_qualified_name(type(value))} for the result cache")
+
+
+def canonical_params(params):
+  """Canonical, hashable form of the `SpeechToTextParams` fields that affect the transcription.
+
+  Callbacks, their user data and fields that do not change the output (`IGNORED_PARAMS`) are left out.
+
+  Raises:
+      TypeError: If a field holds something that cannot be told apart from other values, e.g. a lambda used as a voice activity detector.
+
+  Returns:
+      str: A JSON document with sorted keys.
+  """
+  fields = {
+    key: _canonical_value(value)
+    for key, value in params._wfull_params_dict.items()
+    if value is not None and "_callback" not in key and key not in IGNORED_PARAMS
+  }
+  whispy_fields = {
+    key: _canonical_value(value)
+    for key, value in params._get_whispy_parms().items()
+    if value is not None and key != "segment_batch"
+  }
+  return json.dumps(dict(whispy=whispy_fields, whisper=fields), sort_keys=True)
+
+
+def model_identity(model_path: bytes | str, model_params=None):
+  """Identifies a model file by its location, size and modification time, plus the context parameters that change its output.
+  """
+  path = realpath(model_path if isinstance(model_path, str) else str(model_path, encoding="utf-8"))
+  stat = os.stat(path)
+  context_fields = {}
+  if model_params is not None:
+    context_fields = {
+      key: _canonical_value(value)
+      for key, value in model_params._whisper_context_params_dict.items()
+      if value is not None and key not in ("use_gpu", "gpu_device")
+    }
+  return json.dumps(dict(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns, context=context_fields), sort_keys=True)
+
+
+def hash_audio(speech: str | object):
+  """Content hash of the audio: the file contents for paths, the samples for in-memory PCM.
+  """
+  if isinstance(speech, str):
+    return hash_file(speech)
+  return hashlib.sha256(pcm_f32_view(speech).cast("B")).hexdigest()
+
+
+class ResultCache:
+  """Persistent cache of transcription results, stored in a local SQLite database.
+
+  Keys combine a content hash of the audio, the identity of the model and the canonical form of the transcription parameters (see `ResultCache.key`). The database runs in WAL mode with a busy timeout, so several processes can share it. Entries expire after `ttl_seconds`, and the least recently used ones are evicted once the stored results exceed `max_bytes`.
+  """
+
+  def __init__(
+    self,
+    path: str | None = None,
+    ttl_seconds: float | None = 30 * 24 * 3600,
+    max_bytes: int = 256 << 20
+  ):
+    """
+    Args:
+        path (str | None, optional): The SQLite database file. Defaults to `$XDG_CACHE_HOME/whispy/results.sqlite3`.
+        ttl_seconds (float | None, optional): Lifetime of every entry. Defaults to 30 days, None means forever.
+        max_bytes (int, optional): Size limit of the stored results. Defaults to 256 MiB.
+    """
+    self.path = path or default_cache_path()
+    self.ttl_seconds = ttl_seconds
+    self.max_bytes = max_bytes
+
+    self.hits = 0
+    self.misses = 0
+
+    os.makedirs(dirname(realpath(self.path)), exist_ok=True)
+    self._local = threading.local()
+    with self._connection() as db:
+      db.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        " key TEXT PRIMARY KEY,"
+        " value TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " created REAL NOT NULL,"
+        " accessed REAL NOT NULL)"
+      )
+      db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_local"]
+    return state
+
+  def __setstate__(self, state: dict):
+    self.__dict__.update(state)
+    self._local = threading.local()
+
+  def _connection(self):
+    """SQLite connections cannot be shared between threads, so there is one per thread.
+    """
+    db = getattr(self._local, "db", None)
+    if db is None:
+      import sqlite3
+      db = sqlite3.connect(self.path, timeout=30.0)
+      db.execute("PRAGMA journal_mode=WAL")
+      db.execute("PRAGMA synchronous=NORMAL")
+      self._local.db = db
+    return db
+
+  @staticmethod
+  def key(audio_hash: str, model_id: str, params_form: str):
+    """Combines the three parts of a cache key (see `hash_audio`, `model_identity` and `canonical_params`).
+    """
+    return hashlib.sha256("\n".join((audio_hash, model_id, params_form)).encode()).hexdigest()
+
+  def get(self, key: str):
+    """Looks up a result.
+
+    Returns:
+        TranscriptResult | None: The cached result, or None if there is no entry or it expired.
+    """
+    now = time.time()
+    with self._connection() as db:
+      row = db.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+      if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+        db.execute("DELETE FROM results WHERE key = ?", (key,))
+        row = None
+      if row is not None:
+        db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+
+    if row is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return TranscriptResult.from_dict(json.loads(row[0]))
+
+  def put(self, key: str, result: TranscriptResult):
+    """Stores a result, evicting expired and least recently used entries if needed.
+    """
+    value = json.dumps(result.to_dict())
+    now = time.time()
+    with self._connection() as db:
+      db.execute(
+        "INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+        (key, value, len(value), now, now)
+      )
+      self._evict(db, now)
+
+  def _evict(self, db, now: float):
+    if self.ttl_seconds is not None:
+      db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_seconds,))
+
+    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    excess = total - self.max_bytes
+    for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+      db.execute("DELETE FROM results WHERE key = ?", (key,))
+      excess -= size
+      if excess <= 0:
+        break
+
+  def size(self):
+    """Bytes used by the stored results.
+    """
+    with self._connection() as db:
+      return db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+  def clear(self):
+    with self._connection() as db:
+      db.execute("DELETE FROM results")
+
+  def stats(self):
+    return dict(hits=self.hits, misses=self.misses, bytes=self.size(), max_bytes=self.max_bytes)
+
+  def __repr__(self):
+    return f"ResultCache(path={self.path!r}, hits={self.hits}, misses={self.misses})"
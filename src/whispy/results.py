@@ -0,0 +1,276 @@
+from typing import Iterable
+from functools import cached_property
+from array import array
+import ctypes
+
+
+class TranscriptSegment:
+  """A piece of transcribed text together with its position in the audio.
+
+  Timestamps are kept in whisper.cpp units, that is, centiseconds (10 ms) since the beginning of the audio.
+  """
+
+  __slots__ = ("text", "t0", "t1", "no_speech_prob")
+
+  def __init__(self, text: str, t0: int, t1: int, no_speech_prob: float = 0.0):
+    self.text = text
+    self.t0 = t0
+    self.t1 = t1
+    self.no_speech_prob = no_speech_prob
+
+  @property
+  def start(self):
+    """Segment start in seconds.
+    """
+    return self.t0 / 100
+
+  @property
+  def end(self):
+    """Segment end in seconds.
+    """
+    return self.t1 / 100
+
+  def to_dict(self):
+    return dict(text=self.text, t0=self.t0, t1=self.t1, no_speech_prob=self.no_speech_prob)
+
+  @classmethod
+  def from_dict(cls, data: dict):
+    return cls(data["text"], data["t0"], data["t1"], data.get("no_speech_prob", 0.0))
+
+  def __repr__(self):
+    return f"TranscriptSegment(t0={self.t0}, t1={self.t1}, text={self.text!r})"
+
+
+TOKEN_FIELDS = ("segment", "id", "p", "plog", "t0", "t1", "t_dtw", "vlen")
+"""Columns of `TokenColumns`: the index of the segment of every token plus the fields of `whisper_token_data`. Timestamps are in centiseconds, `t0`/`t1` are only computed with `token_timestampts` and `t_dtw` with `ModelParams.dtw`.
+"""
+
+TOKEN_TYPECODES = dict(segment="i", id="i", p="f", plog="f", t0="q", t1="q", t_dtw="q", vlen="f")
+"""`array` type codes of the columns. NumPy columns use the equivalent dtypes.
+"""
+
+
+class TokenOutputSpec:
+  """What `SpeechToTextParams.token_output` asked for.
+  """
+
+  def __init__(self, fields: Iterable[str], special: bool):
+    self.fields = tuple(fields)
+    self.special = special
+
+
+class TokenColumns:
+  """Token-level output of a transcription, stored as one compact array per field instead of an object per token.
+
+  Columns are NumPy arrays when NumPy is installed, `array.array` otherwise, and are filled by the backend in a single call. A token takes 44 bytes with every column.
+  """
+  __slots__ = ("columns", "special")
+
+  def __init__(self, columns: dict[str, object], special: bool = False):
+    self.columns = columns
+    """The arrays by field name (see `TOKEN_FIELDS`), all of the same length.
+    """
+    self.special = special
+    """Whether special tokens (start of transcript, timestamps...) were kept.
+    """
+
+  @classmethod
+  def from_context(cls, lib: ctypes.CDLL, tc, fields: Iterable[str] = TOKEN_FIELDS, special: bool = False):
+    """Reads the tokens produced by the last transcription over a transcript context.
+
+    Args:
+        lib (ctypes.CDLL): The backend library with the C api binded.
+        tc (whispy_transcript_context): The transcript context that ran the transcription.
+        fields (Iterable[str], optional): Columns to fill. Defaults to every one.
+        special (bool, optional): Keeps special tokens. Defaults to False.
+    """
+    from .whisper_bindings import whispy_token_columns
+    try:
+      import numpy as np
+    except ImportError:
+      np = None
+
+    tc_pointer = ctypes.pointer(tc)
+    n_tokens: int = lib.whispy_count_tokens(tc_pointer, special)
+    columns: dict[str, object] = {}
+    pointers = whispy_token_columns()
+    for field in fields:
+      typecode = TOKEN_TYPECODES[field]
+      if np is not None:
+        column = np.empty(n_tokens, dtype=typecode)
+        address = column.ctypes.data
+      else:
+        column = array(typecode, bytes(n_tokens * array(typecode).itemsize))
+        address = column.buffer_info()[0]
+      columns[field] = column
+      setattr(pointers, field, ctypes.cast(address, type(getattr(pointers, field))))
+
+    n_filled: int = lib.whispy_fill_tokens(tc_pointer, special, ctypes.byref(pointers), n_tokens)
+    if n_filled != n_tokens: # Never expected, the transcript context did not change in between
+      columns = {field: column[:n_filled] for field, column in columns.items()}
+    return cls(columns, special)
+
+  def __getitem__(self, field: str):
+    return self.columns[field]
+
+  def __len__(self):
+    column = next(iter(self.columns.values()), None)
+    return len(column) if column is not None else 0 # type: ignore
+
+  @property
+  def nbytes(self):
+    """Memory taken by the columns.
+    """
+    return sum(len(column) * column.itemsize for column in self.columns.values()) # type: ignore
+
+  def map_times(self, timeline):
+    """Maps the timestamp columns of the packed speech back to the original audio (see `SpeechTimeline.to_original_column`).
+    """
+    for field in ("t0", "t1", "t_dtw"):
+      column = self.columns.get(field)
+      if column is not None:
+        timeline.to_original_column(column)
+
+  def to_structured(self):
+    """The columns as a single NumPy structured array, one field per column.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+    import numpy as np
+    structured = np.empty(len(self), dtype=[(field, TOKEN_TYPECODES[field]) for field in self.columns])
+    for field, column in self.columns.items():
+      structured[field] = column
+    return structured
+
+  def __repr__(self):
+    return f"TokenColumns(tokens={len(self)}, columns={list(self.columns)})"
+
+
+def format_timestamp(t_cs: int, decimal_marker: str = "."):
+  """Formats whisper.cpp centiseconds as a subtitle timestamp (HH:MM:SS.mmm).
+  """
+  ms = max(0, t_cs) * 10
+  hours, ms = divmod(ms, 3_600_000)
+  minutes, ms = divmod(ms, 60_000)
+  seconds, ms = divmod(ms, 1000)
+  return f"{hours:02d}:{minutes:02d}:{seconds:02d}{decimal_marker}{ms:03d}"
+
+
+class TranscriptResult:
+  """Structured output of a transcription.
+
+  Segments are read from the backend right after `whisper_full` finishes, so the result is sized to the actual output and stays valid after the model is reused. The plain text is only built when it is asked for.
+  """
+
+  def __init__(self, segments: list[TranscriptSegment], language: str | None = None):
+    self.segments = segments
+    self.language = language
+
+    self.speech_regions: list | None = None
+    """Speech regions found by the voice activity detection stage, or None if it did not run.
+    """
+    self.audio_seconds: float | None = None
+    """Length of the input audio, if known.
+    """
+    self.timings = None
+    """Where the time of the transcription went (see `metrics.Timings`). Not kept by `to_dict`, it belongs to the call that produced the result.
+    """
+    self.tokens: TokenColumns | None = None
+    """Token-level output, only filled when asked for with `SpeechToTextParams.token_output`. Not kept by `to_dict`.
+    """
+
+  @property
+  def skipped_seconds(self):
+    """Seconds of audio the voice activity detection stage kept away from inference.
+    """
+    if self.speech_regions is None or self.audio_seconds is None:
+      return 0.0
+    return self.audio_seconds - sum(region.end_seconds - region.start_seconds for region in self.speech_regions)
+
+  @classmethod
+  def from_state(cls, lib: ctypes.CDLL, state: ctypes.c_void_p | int):
+    """Reads the segments produced by the last transcription over a whisper state.
+
+    Args:
+        lib (ctypes.CDLL): The backend library with the C api binded.
+        state (ctypes.c_void_p | int): A pointer to the `whisper_state` that ran the transcription.
+
+    Returns:
+        TranscriptResult: The transcription segments and the detected language.
+    """
+    n_segments: int = lib.whisper_full_n_segments_from_state(state)
+    segments = [
+      TranscriptSegment(
+        text=str(lib.whisper_full_get_segment_text_from_state(state, i), encoding="utf-8", errors="replace"),
+        t0=lib.whisper_full_get_segment_t0_from_state(state, i),
+        t1=lib.whisper_full_get_segment_t1_from_state(state, i),
+        no_speech_prob=lib.whisper_full_get_segment_no_speech_prob_from_state(state, i)
+      )
+      for i in range(n_segments)
+    ]
+
+    lang_id: int = lib.whisper_full_lang_id_from_state(state)
+    language = lib.whisper_lang_str(lang_id) if lang_id >= 0 else None
+    return cls(segments, str(language, encoding="utf-8") if language else None)
+
+  @cached_property
+  def text(self):
+    """The plain text of the transcription, without the leading white space whisper.cpp places before the first segment.
+    """
+    text = "".join(segment.text for segment in self.segments)
+    return text[1:] if text.startswith(" ") else text
+
+  def to_dict(self):
+    result = dict(
+      text=self.text,
+      language=self.language,
+      segments=[segment.to_dict() for segment in self.segments]
+    )
+    if self.speech_regions is not None:
+      result["speech_regions"] = [region.to_dict() for region in self.speech_regions]
+    if self.audio_seconds is not None:
+      result["audio_seconds"] = self.audio_seconds
+    return result
+
+  @classmethod
+  def from_dict(cls, data: dict):
+    """Rebuilds a result from the output of `to_dict`.
+    """
+    result = cls(
+      [TranscriptSegment.from_dict(segment) for segment in data["segments"]],
+      data.get("language")
+    )
+    if "speech_regions" in data:
+      from .vad import SpeechRegion
+      result.speech_regions = [SpeechRegion(region["start"], region["end"]) for region in data["speech_regions"]]
+    result.audio_seconds = data.get("audio_seconds")
+    return result
+
+  def to_srt(self):
+    """The segments as SubRip subtitles.
+    """
+    return "".join(
+      f"{i}\n{format_timestamp(segment.t0, ',')} --> {format_timestamp(segment.t1, ',')}\n{segment.text.strip()}\n\n"
+      for i, segment in enumerate(self.segments, start=1)
+    )
+
+  def to_vtt(self):
+    """The segments as WebVTT subtitles.
+    """
+    return "WEBVTT\n\n" + "".join(
+      f"{format_timestamp(segment.t0)} --> {format_timestamp(segment.t1)}\n{segment.text.strip()}\n\n"
+      for segment in self.segments
+    )
+
+  def __iter__(self):
+    return iter(self.segments)
+
+  def __len__(self):
+    return len(self.segments)
+
+  def __str__(self):
+    return self.text
+
+  def __repr__(self):
+    return f"TranscriptResult(language={self.language!r}, segments={len(self.segments)})"
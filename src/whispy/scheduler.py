@@ -0,0 +1,383 @@
+from typing import Literal
+from concurrent.futures import Future
+from collections import Counter
+import threading
+import itertools
+import heapq
+import time
+
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view, WhisperAbortedError
+from .results import TranscriptSegment, TranscriptResult
+from .abort import AbortFlag
+from .audio import audio_duration, load_audio
+from .long_audio import AudioChunk, plan_chunks, merge_chunk_segments
+
+
+INTERACTIVE = 0
+"""Priority of requests someone is waiting for. Lower values are served first.
+"""
+
+BATCH = 10
+"""Priority of background work. Batch jobs are preemptible by default.
+"""
+
+
+class DeadlineExceededError(TimeoutError):
+  """The deadline of a job passed before it could be transcribed.
+  """
+
+
+class ScheduledJob:
+  """A transcription submitted to a `TranscriptionScheduler`.
+
+  Its audio is transcribed as a single piece unless it gets preempted: then the audio that was being transcribed is split into chunks, which are queued again and stitched back once all of them are done.
+  """
+
+  def __init__(
+    self,
+    speech: str | object,
+    params,
+    priority: int,
+    deadline: float | None,
+    expected_seconds: float | None,
+    preemptible: bool,
+    seq: int
+  ):
+    self.speech = speech
+    self.params = params
+    self.priority = priority
+    self.deadline = deadline
+    """`time.monotonic()` by which the job must have started, or None.
+    """
+    self.expected_seconds = expected_seconds
+    """Duration of the audio, the estimate of shortest-expected-job-first.
+    """
+    self.preemptible = preemptible
+    self.seq = seq
+    self.future: Future = Future()
+    self.n_preempted = 0
+
+    self._started = False
+    self._pending = 1
+    self._results: list[tuple[AudioChunk | None, TranscriptResult]] = []
+
+  def result(self, timeout: float | None = None) -> TranscriptResult:
+    return self.future.result(timeout)
+
+  def cancel(self):
+    """Cancels the job if it did not start yet.
+    """
+    return self.future.cancel()
+
+  def done(self):
+    return self.future.done()
+
+  def _stitch(self):
+    if len(self._results) == 1 and self._results[0][0] is None:
+      return self._results[0][1]
+
+    segments: list[TranscriptSegment] = []
+    languages: Counter = Counter()
+    for chunk, result in sorted(self._results, key=lambda item: item[0].start): # type: ignore
+      segments.extend(merge_chunk_segments(chunk, result)) # type: ignore
+      if result.language:
+        languages[result.language] += 1
+
+    result = TranscriptResult(segments, languages.most_common(1)[0][0] if languages else None)
+    result.audio_seconds = self.expected_seconds
+    return result
+
+  def __repr__(self):
+    return f"ScheduledJob(priority={self.priority}, expected_seconds={self.expected_seconds}, preempted={self.n_preempted})"
+
+
+class _Piece:
+  """The unit of work of the scheduler: a whole job, or a chunk of a preempted one.
+  """
+  __slots__ = ("job", "speech", "chunk", "key", "abort", "preempted", "split")
+
+  def __init__(self, job: ScheduledJob, speech: object, chunk: AudioChunk | None, key: tuple):
+    self.job = job
+    self.speech = speech
+    self.chunk = chunk
+    self.key = key
+    self.abort: AbortFlag | None = None
+    self.preempted = False
+    self.split = False
+    """Whether the piece is a preempted whole job, to be split into chunks by the worker that picks it up again.
+    """
+
+  def __lt__(self, other: "_Piece"):
+    return self.key < other.key
+
+
+class TranscriptionScheduler:
+  """Dispatches transcription jobs onto the whisper states of a model by priority and deadline, instead of in arrival order.
+
+  Pending jobs are ordered by priority (lower first), then by deadline (earliest first, jobs without one last), then by arrival or, with the `sjf` policy, by the expected duration of their audio. Jobs whose deadline passes before they start fail with `DeadlineExceededError`.
+
+  When every state is busy and a job arrives with a more urgent priority than a preemptible running one, the running one is aborted through its `AbortFlag` and queued again at its original position. The worker that picks it up next splits its audio into `chunk_seconds` chunks, so a long batch job holds a state for at most one chunk at a time from then on.
+  """
+
+  def __init__(
+    self,
+    model,
+    policy: Literal["fifo"] | Literal["sjf"] = "fifo",
+    preemption: bool = True,
+    chunk_seconds: float = 30.0,
+    workers: int | None = None
+  ):
+    """
+    Args:
+        model (WhispyModel): The model whose states run the jobs.
+        policy (str, optional): Order of jobs with the same priority and deadline: "fifo" or "sjf" (shortest expected job first). Defaults to "fifo".
+        preemption (bool, optional): Whether urgent jobs abort preemptible running ones. Defaults to True.
+        chunk_seconds (float, optional): Length of the chunks a preempted job is split into. Defaults to 30.0, whisper's own window.
+        workers (int | None, optional): Jobs run at once. Defaults to the size of the model's state pool.
+    """
+    if policy not in ("fifo", "sjf"):
+      raise ValueError(f"Unknown scheduling policy: {policy!r}")
+
+    self._model = model
+    self._policy = policy
+    self._preemption = preemption
+    self._chunk_seconds = chunk_seconds
+    self._n_workers = workers or model.states.size
+
+    self._queue: list[_Piece] = []
+    self._running: set[_Piece] = set()
+    self._cond = threading.Condition()
+    self._seq = itertools.count()
+    self._closed = False
+
+    self.n_preemptions = 0
+
+    self._threads = [
+      threading.Thread(target=self._worker, name=f"whispy-scheduler-{i}", daemon=True)
+      for i in range(self._n_workers)
+    ]
+    for thread in self._threads:
+      thread.start()
+
+  @property
+  def queue_depth(self):
+    """Pieces waiting for a state.
+    """
+    return len(self._queue)
+
+  def submit(
+    self,
+    speech: str | object,
+    params=None,
+    priority: int = INTERACTIVE,
+    deadline: float | None = None,
+    expected_seconds: float | None = None,
+    preemptible: bool | None = None
+  ):
+    """Queues a transcription.
+
+    Args:
+        speech (str | object): A path to an audio file or PCM samples already in memory.
+        params (SpeechToTextParams | None, optional): Transcription parameters. Defaults to greedy sampling.
+        priority (int, optional): Lower values are served first, see `INTERACTIVE` and `BATCH`. Defaults to `INTERACTIVE`.
+        deadline (float | None, optional): Seconds from now by which the job must have started. Defaults to None, which means no deadline.
+        expected_seconds (float | None, optional): Duration of the audio. Defaults to the one read from the input, without decoding it.
+        preemptible (bool | None, optional): Whether more urgent jobs may abort it. Defaults to True for priorities from `BATCH` on.
+
+    Raises:
+        RuntimeError: If the scheduler was closed.
+
+    Returns:
+        ScheduledJob: The job, whose `result` blocks until it is transcribed.
+    """
+    if params is None:
+      from .whispy import SpeechToTextParams
+      params = SpeechToTextParams("greedy")
+    if expected_seconds is None:
+      try:
+        expected_seconds = audio_duration(self._model.dll(), speech)
+      except Exception: # Unreadable inputs fail when they are transcribed
+        expected_seconds = None
+
+    job = ScheduledJob(
+      speech,
+      params,
+      priority,
+      time.monotonic() + deadline if deadline is not None else None,
+      expected_seconds,
+      preemptible if preemptible is not None else priority >= BATCH,
+      next(self._seq)
+    )
+    piece = _Piece(job, speech, None, self._key(job))
+
+    with self._cond:
+      if self._closed:
+        raise RuntimeError("The scheduler was closed")
+      heapq.heappush(self._queue, piece)
+      self._preempt_for(job)
+      self._cond.notify()
+    return job
+
+  def _key(self, job: ScheduledJob, chunk: AudioChunk | None = None):
+    deadline = job.deadline if job.deadline is not None else float("inf")
+    if self._policy == "sjf":
+      expected = (chunk.end - chunk.start) / PCM_SAMPLE_RATE if chunk is not None else job.expected_seconds
+      return (job.priority, deadline, expected if expected is not None else float("inf"), job.seq)
+    return (job.priority, deadline, job.seq, chunk.start if chunk is not None else 0)
+
+  def _preempt_for(self, job: ScheduledJob):
+    """Aborts the least urgent preemptible piece if every worker is busy and it is less urgent than `job`. Called with the lock held.
+    """
+    if not self._preemption or len(self._running) < self._n_workers:
+      return
+    victims = [
+      piece for piece in self._running
+      if piece.job.preemptible and not piece.preempted and piece.job.priority > job.priority
+    ]
+    if not victims:
+      return
+    victim = max(victims, key=lambda piece: piece.key)
+    victim.preempted = True
+    victim.abort.set() # type: ignore
+    self.n_preemptions += 1
+
+  # Workers
+
+  def _next_piece(self):
+    """Pops the most urgent piece that can still run, or returns None once closed. Called with the lock held.
+    """
+    while True:
+      while not self._queue and not self._closed:
+        self._cond.wait()
+      if not self._queue:
+        return None
+
+      piece = heapq.heappop(self._queue)
+      job = piece.job
+      if job.future.done(): # Cancelled, or another piece failed
+        continue
+      if not job._started:
+        if job.deadline is not None and time.monotonic() > job.deadline:
+          job.future.set_exception(DeadlineExceededError("The job did not start before its deadline"))
+          continue
+        if not job.future.set_running_or_notify_cancel():
+          continue
+        job._started = True
+
+      piece.abort = AbortFlag()
+      piece.preempted = False
+      self._running.add(piece)
+      return piece
+
+  def _worker(self):
+    while True:
+      with self._cond:
+        piece = self._next_piece()
+      if piece is None:
+        return
+
+      job = piece.job
+      if piece.split:
+        try:
+          if self._split(piece):
+            continue
+        except Exception as e:
+          self._finish(piece, error=e)
+          continue
+
+      try:
+        result = self._model.transcribe(piece.speech, job.params, piece.abort)
+      except WhisperAbortedError as e:
+        if piece.preempted:
+          self._requeue(piece)
+          continue
+        self._finish(piece, error=e)
+      except Exception as e:
+        self._finish(piece, error=e)
+      else:
+        self._finish(piece, result=result)
+
+  def _requeue(self, piece: _Piece):
+    """Queues a preempted piece again at its original position. Whole jobs are split into chunks by the worker that picks them up, so the worker that was preempted moves on to the urgent job right away instead of decoding the audio first.
+    """
+    piece.job.n_preempted += 1
+    with self._cond:
+      # Removed before it is pushed, another worker may pop it as soon as it is.
+      self._running.discard(piece)
+      piece.preempted = False
+      piece.split = piece.chunk is None
+      heapq.heappush(self._queue, piece)
+      self._cond.notify()
+
+  def _split(self, piece: _Piece):
+    """Replaces a preempted whole job with its chunks, so it can be preempted again without losing much work.
+
+    Returns:
+        bool: Whether the chunks were queued, False if the audio fits in a single chunk and the piece should just run.
+    """
+    job = piece.job
+    speech = piece.speech
+    samples = pcm_f32_view(load_audio(self._model.dll(), speech) if isinstance(speech, str) else speech)
+    chunks = plan_chunks(samples, self._chunk_seconds)
+    piece.split = False
+    if len(chunks) <= 1:
+      return False
+
+    if job.expected_seconds is None:
+      job.expected_seconds = len(samples) / PCM_SAMPLE_RATE
+    pieces = [
+      _Piece(job, samples[chunk.padded_start:chunk.padded_end], chunk, self._key(job, chunk))
+      for chunk in chunks
+    ]
+    with self._cond:
+      self._running.discard(piece)
+      job._pending += len(pieces) - 1
+      for chunk_piece in pieces:
+        heapq.heappush(self._queue, chunk_piece)
+      self._cond.notify(len(pieces))
+    return True
+
+  def _finish(self, piece: _Piece, result: TranscriptResult | None = None, error: BaseException | None = None):
+    job = piece.job
+    with self._cond:
+      self._running.discard(piece)
+      if job.future.done():
+        return
+      if error is not None:
+        job.future.set_exception(error)
+        return
+      job._results.append((piece.chunk, result))
+      job._pending -= 1
+      if job._pending:
+        return
+
+    try:
+      job.future.set_result(job._stitch())
+    except Exception as e:
+      job.future.set_exception(e)
+
+  def close(self, wait: bool = True, cancel_pending: bool = False):
+    """Stops the workers once the queue is empty.
+
+    Args:
+        wait (bool, optional): Blocks until the workers stop. Defaults to True.
+        cancel_pending (bool, optional): Cancels the jobs that did not start yet instead of running them. Defaults to False.
+    """
+    with self._cond:
+      self._closed = True
+      if cancel_pending:
+        for piece in self._queue:
+          # Chunks of preempted jobs belong to futures that already run and cannot be cancelled.
+          if not piece.job.future.cancel() and not piece.job.future.done():
+            piece.job.future.set_exception(RuntimeError("The scheduler was closed before the job finished"))
+        self._queue.clear()
+      self._cond.notify_all()
+    if wait:
+      for thread in self._threads:
+        thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.close()
@@ -0,0 +1,81 @@
+from typing import Callable
+import ctypes
+
+from .whisper_bindings import *
+from .results import TranscriptSegment
+
+
+class SegmentBatchSpec:
+  """How a transcription delivers its segments in batches (see `SpeechToTextParams.segment_batch_callback`).
+  """
+  __slots__ = ("func", "every_n", "every_ms", "zero_copy")
+
+  def __init__(self, func: Callable, every_n: int, every_ms: int, zero_copy: bool):
+    self.func = func
+    self.every_n = every_n
+    self.every_ms = every_ms
+    self.zero_copy = zero_copy
+
+
+class SegmentBatcher:
+  """A native `whispy_segment_batcher` serving a single transcription.
+
+  Segments are accumulated by the backend, which only calls back into Python once per batch instead of once per segment.
+  """
+
+  def __init__(self, lib: ctypes.CDLL, spec: SegmentBatchSpec, to_original: Callable[[int], int] | None = None):
+    """
+    Args:
+        lib (ctypes.CDLL): The backend library with the C api binded.
+        spec (SegmentBatchSpec): What to deliver and how often.
+        to_original (Callable[[int], int] | None, optional): Maps the timestamps of the transcribed audio to the ones of the input, e.g. `SpeechTimeline.to_original` when only the speech is transcribed. Defaults to None, which keeps them.
+    """
+    self._lib = lib
+    self._spec = spec
+    self._to_original = to_original
+
+    # Kept alive as long as the native batcher may call it.
+    self._callback = whispy_segment_batch_callback(self._deliver)
+    self._batcher = lib.whispy_batcher_make(spec.every_n, spec.every_ms, self._callback, None)
+    if not self._batcher:
+      raise MemoryError("whispy_batcher_make() failed")
+
+  def _deliver(self, segments, n_segments: int, text: int, text_size: int, user_data):
+    if self._to_original is not None:
+      # The batch is owned by the batcher and dropped after the call, so it is remapped in place.
+      for segment in segments[:n_segments]:
+        segment.t0 = self._to_original(segment.t0)
+        segment.t1 = self._to_original(segment.t1)
+
+    if self._spec.zero_copy:
+      # Views over native memory, only valid during the call.
+      segments_view = ctypes.cast(segments, ctypes.POINTER(whispy_segment * n_segments)).contents
+      text_view = memoryview((ctypes.c_char * text_size).from_address(text)) if text_size else memoryview(b"")
+      self._spec.func(segments_view, text_view)
+      return
+
+    raw = ctypes.string_at(text, text_size) if text_size else b""
+    self._spec.func([
+      TranscriptSegment(
+        str(raw[segment.text_offset:segment.text_offset + segment.text_size], encoding="utf-8", errors="replace"),
+        segment.t0,
+        segment.t1,
+        segment.no_speech_prob
+      )
+      for segment in segments[:n_segments]
+    ])
+
+  def install(self, wparams: whisper_full_params):
+    """Wires the batcher to the `new_segment_callback` of the transcription parameters.
+    """
+    self._lib.whispy_batcher_install(self._batcher, ctypes.byref(wparams))
+
+  def flush(self):
+    """Delivers the segments still pending once the transcription finished.
+    """
+    self._lib.whispy_batcher_flush(self._batcher)
+
+  def close(self):
+    if self._batcher:
+      self._lib.whispy_batcher_free(self._batcher)
+      self._batcher = None
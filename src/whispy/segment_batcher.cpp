@@ -0,0 +1,118 @@
+#include <vector>
+#include <string>
+#include <chrono>
+#include <new>
+
+#include <cstdint>
+#include <cstring>
+
+#include "whispy.h"
+
+using batch_clock = std::chrono::steady_clock;
+
+struct whispy_segment_batcher
+{
+  int every_n = 0;
+  batch_clock::duration every;
+  whispy_segment_batch_callback callback = nullptr;
+  void *user_data = nullptr;
+
+  /**
+   * Pending segments and their texts, back to back. Both keep their capacity between batches.
+   */
+  std::vector<whispy_segment> segments;
+  std::string text;
+
+  batch_clock::time_point last_delivery;
+};
+
+/**
+ * Hands the pending segments to the callback and clears them.
+ */
+static void deliver(whispy_segment_batcher &batcher)
+{
+  if (batcher.segments.empty())
+    return;
+
+  batcher.callback(
+      batcher.segments.data(),
+      static_cast<int>(batcher.segments.size()),
+      batcher.text.data(),
+      batcher.text.size(),
+      batcher.user_data);
+
+  batcher.segments.clear();
+  batcher.text.clear();
+  batcher.last_delivery = batch_clock::now();
+}
+
+/**
+ * new_segment_callback installed by whispy_batcher_install. It runs on the transcribing thread without entering the caller's runtime unless a batch is ready.
+ */
+static void on_new_segment(whisper_context *ctx, whisper_state *state, int n_new, void *user_data)
+{
+  auto *batcher = static_cast<whispy_segment_batcher *>(user_data);
+  const int n_segments = whisper_full_n_segments_from_state(state);
+  (void)ctx;
+
+  for (int i = n_segments - n_new; i < n_segments; i++)
+  {
+    const char *segment_text = whisper_full_get_segment_text_from_state(state, i);
+    const std::size_t segment_size = std::strlen(segment_text);
+
+    batcher->segments.push_back(whispy_segment{
+        whisper_full_get_segment_t0_from_state(state, i),
+        whisper_full_get_segment_t1_from_state(state, i),
+        whisper_full_get_segment_no_speech_prob_from_state(state, i),
+        static_cast<std::uint32_t>(batcher->text.size()),
+        static_cast<std::uint32_t>(segment_size)});
+    batcher->text.append(segment_text, segment_size);
+  }
+
+  const bool full = batcher->every_n > 0 && batcher->segments.size() >= static_cast<std::size_t>(batcher->every_n);
+  const bool due = batcher->every.count() > 0 && batch_clock::now() - batcher->last_delivery >= batcher->every;
+  if (full || due)
+    deliver(*batcher);
+}
+
+extern "C"
+{
+  whispy_segment_batcher *whispy_batcher_make(int every_n, int every_ms, whispy_segment_batch_callback callback, void *user_data)
+  {
+    if (callback == nullptr)
+      return nullptr;
+
+    auto *batcher = new (std::nothrow) whispy_segment_batcher{};
+    if (batcher == nullptr)
+      return nullptr;
+
+    batcher->every_n = every_n > 0 ? every_n : 0;
+    batcher->every = std::chrono::milliseconds(every_ms > 0 ? every_ms : 0);
+    batcher->callback = callback;
+    batcher->user_data = user_data;
+    batcher->last_delivery = batch_clock::now();
+    if (batcher->every_n > 0)
+      batcher->segments.reserve(static_cast<std::size_t>(batcher->every_n));
+    return batcher;
+  }
+
+  void whispy_batcher_install(whispy_segment_batcher *batcher, whisper_full_params *wparams)
+  {
+    batcher->segments.clear();
+    batcher->text.clear();
+    batcher->last_delivery = batch_clock::now();
+
+    wparams->new_segment_callback = on_new_segment;
+    wparams->new_segment_callback_user_data = batcher;
+  }
+
+  void whispy_batcher_flush(whispy_segment_batcher *batcher)
+  {
+    deliver(*batcher);
+  }
+
+  void whispy_batcher_free(whispy_segment_batcher *batcher)
+  {
+    delete batcher;
+  }
+}
@@ -0,0 +1,477 @@
+"""Local transcription server over a pool of warm whisper states.
+
+Usage:
+    python -m whispy.serve --model base --port 8080 --states 2 --max-queue 16
+
+Endpoints:
+    POST /transcribe  Audio in the body: raw mono 16 kHz float32 PCM (Content-Type: audio/pcm), any file libav can decode, or a multipart/form-data upload of either.
+                      Query: strategy (greedy, beam_search), language, translate, stream. With stream=1 the segments are sent as NDJSON lines as soon as they are produced, followed by the whole result.
+    GET  /healthz     Liveness, 200 while the process serves requests.
+    GET  /readyz      Readiness, 200 once the model states are warm and the server is not draining.
+    GET  /metrics     Prometheus text (see `metrics.prometheus_text`), plus the queue gauges of the server.
+
+Admission control: at most `n_states` transcriptions run at once and at most `max_queue` more wait for a state. Requests beyond that are rejected with 429 before their body is read, requests that wait longer than `queue_timeout` get 503, and so does everything while the model warms up or the server drains.
+"""
+from urllib.parse import urlsplit, parse_qsl
+import argparse
+import asyncio
+import signal
+import json
+import os
+import sys
+
+from .whispy import WhispyModel, ModelParams, SpeechToTextParams, WhisperAbortedError, WhisperAudioTooLongError, WhisperTextGenError
+from .metrics import get_sink as get_metrics_sink, prometheus_text
+from .results import TranscriptSegment
+
+
+RAW_PCM_CONTENT_TYPES = ("audio/pcm", "audio/x-pcm-f32le")
+"""Content types read as mono 16 kHz float32 little endian samples. Anything else is decoded with libav.
+"""
+
+MAX_HEADER_BYTES = 64 * 1024
+
+ENDPOINTS = ("/transcribe", "/healthz", "/readyz", "/metrics")
+"""Paths served. Requests to any other path are counted under the `other` endpoint, so scanning arbitrary URLs cannot grow the metrics without bound.
+"""
+
+REASONS = {
+  200: "OK",
+  400: "Bad Request",
+  404: "Not Found",
+  405: "Method Not Allowed",
+  411: "Length Required",
+  413: "Payload Too Large",
+  422: "Unprocessable Content",
+  429: "Too Many Requests",
+  431: "Request Header Fields Too Large",
+  500: "Internal Server Error",
+  503: "Service Unavailable",
+  504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+  def __init__(self, status: int, message: str, headers: dict[str, str] | None = None):
+    super().__init__(message)
+    self.status = status
+    self.headers = headers or {}
+
+
+class Request:
+  __slots__ = ("method", "path", "query", "headers")
+
+  def __init__(self, method: str, target: str, headers: dict[str, str]):
+    url = urlsplit(target)
+    self.method = method
+    self.path = url.path
+    self.query = dict(parse_qsl(url.query))
+    self.headers = headers
+    """Header names are lowercase.
+    """
+
+  @property
+  def content_type(self):
+    return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+async def read_request(reader: asyncio.StreamReader):
+  """Reads the request line and the headers, leaving the body in the stream.
+  """
+  try:
+    head = await reader.readuntil(b"\r\n\r\n")
+  except asyncio.LimitOverrunError:
+    raise HTTPError(431, "Request headers are too large")
+  except asyncio.IncompleteReadError:
+    return None # The client went away
+
+  request_line, *header_lines = head.decode("latin-1").split("\r\n")
+  try:
+    method, target, _version = request_line.split(" ", 2)
+  except ValueError:
+    raise HTTPError(400, "Malformed request line")
+
+  headers = {}
+  for line in header_lines:
+    name, separator, value = line.partition(":")
+    if separator:
+      headers[name.strip().lower()] = value.strip()
+  return Request(method.upper(), target, headers)
+
+
+def multipart_file(content_type: str, body: bytes):
+  """Returns the first file of a multipart/form-data body, with its content type.
+  """
+  from email.parser import BytesParser
+  from email.policy import HTTP
+
+  message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+  for part in message.iter_parts(): # type: ignore
+    if part.get_filename() is not None or part.get_param("name", header="content-disposition") == "file":
+      return part.get_content_type(), part.get_payload(decode=True)
+  raise HTTPError(400, "The multipart body has no file")
+
+
+def speech_params(query: dict[str, str]):
+  """Builds the transcription parameters of a request from its query string.
+  """
+  strategy = query.get("strategy", "greedy")
+  if strategy not in ("greedy", "beam_search"):
+    raise HTTPError(400, f"Unknown sampling strategy: {strategy}")
+  language = query.get("language")
+  return SpeechToTextParams(
+    strategy, # type: ignore
+    language=bytes(language, encoding="utf-8") if language else None,
+    translate=_flag(query, "translate")
+  )
+
+def _flag(query: dict[str, str], name: str):
+  return query.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _write_upload(body: bytes):
+  import tempfile
+  with tempfile.NamedTemporaryFile(prefix="whispy-upload-", suffix=".audio", delete=False) as upload:
+    upload.write(body)
+  return upload.name
+
+
+class TranscriptionServer:
+  """An asyncio HTTP server that transcribes with a single `WhispyModel` whose states serve the requests (see the module documentation for the endpoints).
+  """
+
+  def __init__(
+    self,
+    model: WhispyModel,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    max_queue: int = 16,
+    queue_timeout: float | None = 30.0,
+    request_timeout: float | None = None,
+    max_body_bytes: int = 256 * 1024 * 1024,
+    max_audio_seconds: float | None = None
+  ):
+    """
+    Args:
+        model (WhispyModel): Serves every request, as many at once as its `n_states`.
+        host (str, optional): Interface to listen on. Defaults to loopback.
+        port (int, optional): 0 picks a free port, see `port` once started. Defaults to 8080.
+        max_queue (int, optional): Requests that may wait for a state before new ones get 429. Defaults to 16.
+        queue_timeout (float | None, optional): Seconds a request may wait for a state before it gets 503. Defaults to 30.
+        request_timeout (float | None, optional): Seconds after which the backend stops a transcription, which gets 504. Defaults to None, which means never.
+        max_body_bytes (int, optional): Larger bodies get 413. Defaults to 256 MiB.
+        max_audio_seconds (float | None, optional): Longer audio gets 413 without being transcribed. Defaults to None, which means no limit.
+    """
+    self.model = model
+    self.host = host
+    self.port = port
+    self.max_queue = max_queue
+    self.queue_timeout = queue_timeout
+    self.request_timeout = request_timeout
+    self.max_body_bytes = max_body_bytes
+    self.max_audio_seconds = max_audio_seconds
+
+    self._server: asyncio.Server | None = None
+    self._slots: asyncio.Semaphore | None = None
+    self._waiting = 0
+    self._active = 0
+    self._draining = False
+    self._idle: asyncio.Event | None = None
+
+  @property
+  def queue_depth(self):
+    """Requests waiting for a state.
+    """
+    return self._waiting
+
+  @property
+  def in_flight(self):
+    """Requests being transcribed.
+    """
+    return self._active
+
+  async def start(self):
+    self._slots = asyncio.Semaphore(self.model.states.size)
+    self._idle = asyncio.Event()
+    self._idle.set()
+    self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+    self.port = self._server.sockets[0].getsockname()[1]
+    return self
+
+  async def serve_forever(self):
+    if self._server is None:
+      await self.start()
+    async with self._server: # type: ignore
+      await self._server.serve_forever() # type: ignore
+
+  async def close(self, grace: float | None = 30.0):
+    """Stops accepting connections and waits up to `grace` seconds for the requests in progress.
+    """
+    self._draining = True
+    if self._server is not None:
+      self._server.close()
+    if self._idle is not None:
+      try:
+        await asyncio.wait_for(self._idle.wait(), grace)
+      except asyncio.TimeoutError:
+        pass
+
+  # Connections
+
+  async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    status = 500
+    request = None
+    try:
+      request = await read_request(reader)
+      if request is None:
+        return
+      status = await self._route(request, reader, writer)
+    except HTTPError as e:
+      status = e.status
+      await self._respond_json(writer, e.status, dict(error=str(e)), e.headers)
+    except (ConnectionError, asyncio.IncompleteReadError):
+      status = 499 # The client went away, nothing to answer
+    except Exception as e:
+      await self._respond_json(writer, 500, dict(error=f"{type(e).__name__}: {e}"))
+    finally:
+      if request is not None:
+        endpoint = request.path if request.path in ENDPOINTS else "other"
+        get_metrics_sink().inc("whispy_server_requests_total", endpoint=endpoint, status=str(status))
+      try:
+        writer.close()
+        await writer.wait_closed()
+      except (ConnectionError, OSError):
+        pass
+
+  async def _route(self, request: Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    if request.path == "/transcribe":
+      if request.method != "POST":
+        raise HTTPError(405, "Use POST", {"Allow": "POST"})
+      return await self._transcribe(request, reader, writer)
+
+    if request.method != "GET":
+      raise HTTPError(405, "Use GET", {"Allow": "GET"})
+    if request.path == "/healthz":
+      await self._respond_json(writer, 200, dict(status="ok"))
+      return 200
+    if request.path == "/readyz":
+      ready = self.model.ready and not self._draining
+      await self._respond_json(writer, 200 if ready else 503, dict(ready=ready, queue_depth=self._waiting, in_flight=self._active))
+      return 200 if ready else 503
+    if request.path == "/metrics":
+      await self._respond(writer, 200, self._metrics_text().encode(), "text/plain; version=0.0.4")
+      return 200
+    raise HTTPError(404, f"No such endpoint: {request.path}")
+
+  def _metrics_text(self):
+    try:
+      text = prometheus_text()
+    except TypeError: # A custom sink, only the server gauges can be exported
+      text = ""
+    return text + (
+      "# HELP whispy_server_queue_depth Requests waiting for a whisper state.\n"
+      "# TYPE whispy_server_queue_depth gauge\n"
+      f"whispy_server_queue_depth {self._waiting}\n"
+      "# HELP whispy_server_in_flight Requests being transcribed.\n"
+      "# TYPE whispy_server_in_flight gauge\n"
+      f"whispy_server_in_flight {self._active}\n"
+    )
+
+  # Transcriptions
+
+  def _admit(self):
+    """Takes a place in the queue, or rejects the request before its body is read.
+    """
+    if self._draining:
+      raise HTTPError(503, "The server is shutting down")
+    if not self.model.ready:
+      raise HTTPError(503, "The model is warming up", {"Retry-After": "1"})
+    if self._waiting >= self.max_queue and self._slots.locked(): # type: ignore
+      raise HTTPError(429, "Too many requests queued", {"Retry-After": "1"})
+    self._waiting += 1
+    self._idle.clear() # type: ignore
+
+  async def _read_speech(self, request: Request, reader: asyncio.StreamReader):
+    """Reads the body and returns what `WhispyModel.transcribe` takes: PCM samples or the path of a temporary upload.
+    """
+    if "content-length" not in request.headers:
+      raise HTTPError(411, "Content-Length is required")
+    try:
+      length = int(request.headers["content-length"])
+    except ValueError:
+      raise HTTPError(400, "Malformed Content-Length")
+    if length > self.max_body_bytes:
+      raise HTTPError(413, f"Bodies are limited to {self.max_body_bytes} bytes")
+    if length == 0:
+      raise HTTPError(400, "The body has no audio")
+
+    body = await reader.readexactly(length)
+    content_type = request.content_type
+    if content_type == "multipart/form-data":
+      # Parsing bodies this large would stall every other connection if it ran on the event loop.
+      content_type, body = await asyncio.to_thread(multipart_file, request.headers["content-type"], body)
+
+    if content_type in RAW_PCM_CONTENT_TYPES:
+      if len(body) % 4:
+        raise HTTPError(400, "Raw PCM bodies must hold float32 samples")
+      return body
+    return await asyncio.to_thread(_write_upload, body)
+
+  async def _transcribe(self, request: Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    params = speech_params(request.query)
+    stream = _flag(request.query, "stream")
+
+    self._admit()
+    speech = None
+    try:
+      try:
+        speech = await self._read_speech(request, reader)
+        await asyncio.wait_for(self._slots.acquire(), self.queue_timeout) # type: ignore
+      except asyncio.TimeoutError:
+        raise HTTPError(503, "Timed out waiting for a whisper state", {"Retry-After": "1"})
+      finally:
+        self._waiting -= 1
+
+      self._active += 1
+      try:
+        if stream:
+          return await self._transcribe_stream(speech, params, writer)
+        result = await self._run(speech, params)
+        await self._respond_json(writer, 200, _result_dict(result))
+        return 200
+      finally:
+        self._active -= 1
+        self._slots.release() # type: ignore
+    finally:
+      if isinstance(speech, str):
+        os.unlink(speech)
+      if not self._waiting and not self._active:
+        self._idle.set() # type: ignore
+
+  async def _run(self, speech: object, params: SpeechToTextParams):
+    try:
+      return await self.model.transcribe_async(speech, params, self.request_timeout, self.max_audio_seconds)
+    except asyncio.TimeoutError: # WhisperTimeoutError included
+      raise HTTPError(504, f"The transcription took longer than {self.request_timeout} seconds")
+    except WhisperAbortedError as e:
+      raise HTTPError(504, str(e))
+    except WhisperAudioTooLongError as e:
+      raise HTTPError(413, str(e))
+    except ValueError as e:
+      raise HTTPError(400, str(e))
+    except WhisperTextGenError as e:
+      raise HTTPError(422, str(e))
+
+  async def _transcribe_stream(self, speech: object, params: SpeechToTextParams, writer: asyncio.StreamWriter):
+    """Sends every segment as soon as the backend produces it, as NDJSON lines, and the whole result last.
+    """
+    loop = asyncio.get_running_loop()
+    batches: asyncio.Queue[list[TranscriptSegment] | None] = asyncio.Queue()
+    params.segment_batch_callback(lambda batch: loop.call_soon_threadsafe(batches.put_nowait, batch), every_n=1, every_ms=0)
+
+    task = asyncio.ensure_future(self._run(speech, params))
+    task.add_done_callback(lambda _: batches.put_nowait(None)) # Segment batches are always queued before completion
+
+    writer.write(_status_line(200) + b"Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+    try:
+      while (batch := await batches.get()) is not None:
+        for segment in batch:
+          _write_chunk(writer, dict(segment=segment.to_dict()))
+        await writer.drain()
+
+      try:
+        _write_chunk(writer, dict(result=_result_dict(await task)))
+        status = 200
+      except HTTPError as e: # Headers are already sent, the error goes within the stream
+        _write_chunk(writer, dict(error=str(e), status=e.status))
+        status = e.status
+      except Exception as e: # Same for unexpected errors, the connection handler would start a second response
+        _write_chunk(writer, dict(error=f"{type(e).__name__}: {e}", status=500))
+        status = 500
+      writer.write(b"0\r\n\r\n")
+      await writer.drain()
+      return status
+    finally:
+      if not task.done():
+        task.cancel() # The client went away, which aborts the native work
+
+  # Responses
+
+  async def _respond(self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str, headers: dict[str, str] | None = None):
+    head = _status_line(status) + f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n".encode()
+    for name, value in (headers or {}).items():
+      head += f"{name}: {value}\r\n".encode("latin-1")
+    writer.write(head + b"\r\n" + body)
+    await writer.drain()
+
+  async def _respond_json(self, writer: asyncio.StreamWriter, status: int, payload: dict, headers: dict[str, str] | None = None):
+    await self._respond(writer, status, json.dumps(payload).encode(), "application/json", headers)
+
+
+def _status_line(status: int):
+  return f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n".encode()
+
+def _write_chunk(writer: asyncio.StreamWriter, payload: dict):
+  line = json.dumps(payload).encode() + b"\n"
+  writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+
+def _result_dict(result):
+  data = result.to_dict()
+  if result.timings is not None:
+    data["timings"] = result.timings.to_dict()
+  return data
+
+
+def parse_args(argv: list[str] | None = None):
+  parser = argparse.ArgumentParser(prog="python -m whispy.serve", description="Serves transcriptions over HTTP.")
+  parser.add_argument("--model", default="base", help="Model name or path (default: base).")
+  parser.add_argument("--gpu", action="store_true", help="Runs the model on the GPU.")
+  parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1).")
+  parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080).")
+  parser.add_argument("--states", type=int, default=2, help="Whisper states, that is, concurrent transcriptions (default: 2).")
+  parser.add_argument("--max-queue", type=int, default=16, help="Requests that may wait for a state before new ones get 429 (default: 16).")
+  parser.add_argument("--queue-timeout", type=float, default=30.0, help="Seconds a request may wait for a state before it gets 503 (default: 30).")
+  parser.add_argument("--request-timeout", type=float, help="Seconds after which a transcription is stopped with 504 (default: none).")
+  parser.add_argument("--max-body-mb", type=float, default=256, help="Largest accepted body, in MiB (default: 256).")
+  parser.add_argument("--max-audio-seconds", type=float, help="Longest accepted audio, longer one gets 413 (default: none).")
+  parser.add_argument("--no-warmup", action="store_true", help="Reports ready without warming the states up.")
+  return parser.parse_args(argv)
+
+
+async def serve(args: argparse.Namespace):
+  model = WhispyModel(
+    ModelParams(args.model, use_gpu=args.gpu, n_states=args.states),
+    warmup=False if args.no_warmup else "background" # Listens right away, /readyz reports when the states are warm
+  )
+  server = TranscriptionServer(
+    model,
+    args.host,
+    args.port,
+    max_queue=args.max_queue,
+    queue_timeout=args.queue_timeout,
+    request_timeout=args.request_timeout,
+    max_body_bytes=int(args.max_body_mb * 1024 * 1024),
+    max_audio_seconds=args.max_audio_seconds
+  )
+  await server.start()
+  print(f"Serving {args.model} on http://{server.host}:{server.port} with {args.states} states", flush=True)
+
+  stop = asyncio.Event()
+  loop = asyncio.get_running_loop()
+  for signum in (signal.SIGINT, signal.SIGTERM):
+    loop.add_signal_handler(signum, stop.set)
+
+  serving = asyncio.ensure_future(server.serve_forever())
+  await stop.wait()
+  await server.close()
+  serving.cancel()
+  model.destroy()
+
+
+def main(argv: list[str] | None = None):
+  asyncio.run(serve(parse_args(argv)))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
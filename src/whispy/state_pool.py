@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+import threading
+import ctypes
+import time
+
+from .whisper_bindings import *
+from .utils import *
+
+
+class WhisperStatePool:
+  """Bounded pool of transcript contexts that share the weights of a single model.
+
+  Every pooled transcript context owns a `whisper_state` (KV caches, mel buffers, results...) but borrows the `whisper_context` of the shared one, so N threads can run `whisper_full_with_state` in parallel over one copy of the weights.
+
+  States are created lazily up to `size`. Once every state is checked out, `checkout` blocks until another thread returns one. States that end up broken are discarded when returned and recreated on demand, while the ones that only failed a transcription are reused.
+  """
+
+  def __init__(self, lib: ctypes.CDLL, shared_tc: whispy_transcript_context, size: int = 1):
+    if size < 1:
+      raise ValueError("State pool size must be at least 1")
+
+    self._lib = lib
+    self._shared_tc = shared_tc
+    self._size = size
+
+    self._idle: list[whispy_transcript_context] = []
+    self._n_created = 0
+    self._closed = False
+    self._cond = threading.Condition()
+
+  @property
+  def size(self):
+    """Maximum number of states that may exist at once.
+    """
+    return self._size
+
+  @property
+  def n_created(self):
+    """Number of states currently allocated, whether idle or checked out.
+    """
+    return self._n_created
+
+  @property
+  def n_idle(self):
+    return len(self._idle)
+
+  def _make_state(self):
+    tc = whispy_transcript_context()
+    make_result: int = self._lib.whispy_tc_make_state(
+      ctypes.pointer(tc),
+      ctypes.pointer(self._shared_tc)
+    )
+    if make_result != 0:
+      message = format_tc_error(tc)
+      self._lib.whispy_tc_free(ctypes.pointer(tc))
+      raise WhisperInitError(message)
+    return tc
+
+  def checkout(self, timeout: float | None = None):
+    """Takes a state out of the pool, creating it if the pool is not full yet.
+
+    Args:
+        timeout (float | None, optional): Seconds to wait for a state to be returned. Defaults to None, which means to wait forever.
+
+    Raises:
+        TimeoutError: If no state became available within `timeout`.
+        WhisperInitError: If a new state could not be created or the pool was closed.
+
+    Returns:
+        whispy_transcript_context: A transcript context with its own `whisper_state`.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    with self._cond:
+      while True:
+        if self._closed:
+          raise WhisperInitError("The state pool was closed")
+        if self._idle:
+          return self._idle.pop()
+        if self._n_created < self._size:
+          self._n_created += 1
+          break
+        # Losing the race for a returned state must not restart the timeout.
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if (remaining is not None and remaining <= 0) or not self._cond.wait(remaining):
+          raise TimeoutError("No whisper state became available")
+
+    # Allocating a state takes a while, so it is done outside the lock.
+    try:
+      return self._make_state()
+    except BaseException:
+      with self._cond:
+        self._n_created -= 1
+        self._cond.notify()
+      raise
+
+  def checkin(self, tc: whispy_transcript_context):
+    """Gives a state back to the pool.
+
+    Args:
+        tc (whispy_transcript_context): A transcript context obtained from `checkout`.
+    """
+    # Limits belong to the call that set them, no later backend call on this state may inherit them.
+    tc.limits = whispy_limits()
+    # Failed transcriptions leave the whisper state usable, anything else means the state is broken.
+    discard = self._closed or self._lib.whispy_tc_reset(ctypes.pointer(tc)) != whispy_tc_state.OK
+    if discard:
+      self._lib.whispy_tc_free(ctypes.pointer(tc))
+
+    with self._cond:
+      if discard:
+        self._n_created -= 1
+      else:
+        self._idle.append(tc)
+      self._cond.notify()
+
+  @contextmanager
+  def state(self, timeout: float | None = None):
+    """Checks out a state for the duration of a `with` block.
+    """
+    tc = self.checkout(timeout)
+    try:
+      yield tc
+    finally:
+      self.checkin(tc)
+
+  def close(self):
+    """Frees the idle states. States still checked out are freed as soon as they are returned.
+    """
+    with self._cond:
+      self._closed = True
+      idle, self._idle = self._idle, []
+      self._n_created -= len(idle)
+      self._cond.notify_all()
+
+    for tc in idle:
+      self._lib.whispy_tc_free(ctypes.pointer(tc))
@@ -0,0 +1,167 @@
+from typing import Iterable, Iterator, AsyncIterable, AsyncIterator
+from array import array
+
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view
+from .results import TranscriptSegment
+
+
+class StreamingUpdate:
+  """Segments produced by a `StreamingSession` after decoding its window.
+
+  Finalized segments will never change again. Tentative segments are the current guess for the audio at the end of the window, and are replaced by the next update.
+  """
+
+  __slots__ = ("finalized", "tentative")
+
+  def __init__(self, finalized: list[TranscriptSegment], tentative: list[TranscriptSegment]):
+    self.finalized = finalized
+    self.tentative = tentative
+
+  def __repr__(self):
+    return f"StreamingUpdate(finalized={self.finalized!r}, tentative={self.tentative!r})"
+
+
+class StreamingSession:
+  """Incremental transcription of audio that arrives in chunks (e.g. from a microphone or a socket).
+
+  The session keeps a sliding window with the audio that has not been finalized yet. Every `step_seconds` of new audio the window is decoded again: segments that end before the last `overlap_seconds` of the window are finalized and their audio is dropped, the rest are reported as tentative. Since finalized audio is never decoded again, the latency per chunk stays steady, and since the window never grows beyond `window_seconds`, so does the memory, no matter how long the session runs.
+
+  Timestamps are relative to the beginning of the session.
+  """
+
+  def __init__(
+    self,
+    model,
+    params,
+    step_seconds: float = 3.0,
+    window_seconds: float = 30.0,
+    overlap_seconds: float = 1.0
+  ):
+    """
+    Args:
+        model (WhispyModel): The model used to decode the window.
+        params (SpeechToTextParams): Transcription parameters of every decode.
+        step_seconds (float, optional): Amount of new audio that triggers a decode. Defaults to 3.0.
+        window_seconds (float, optional): Maximum amount of audio in the window. Defaults to 30.0, whisper's own window.
+        overlap_seconds (float, optional): Audio at the end of the window whose segments are kept tentative. Defaults to 1.0.
+    """
+    if not 0 <= overlap_seconds < step_seconds <= window_seconds:
+      raise ValueError("Expected 0 <= overlap_seconds < step_seconds <= window_seconds")
+
+    self._model = model
+    self._params = params
+    self._step = int(step_seconds * PCM_SAMPLE_RATE)
+    self._window = int(window_seconds * PCM_SAMPLE_RATE)
+    self._overlap = int(overlap_seconds * PCM_SAMPLE_RATE)
+
+    self._buffer = array("f")
+    """Audio not finalized yet.
+    """
+    self._buffer_offset = 0
+    """Position of the first sample of the buffer since the beginning of the session.
+    """
+    self._n_new = 0
+    """Samples received since the last decode.
+    """
+
+  @property
+  def position(self):
+    """Seconds of audio received since the beginning of the session.
+    """
+    return (self._buffer_offset + len(self._buffer)) / PCM_SAMPLE_RATE
+
+  def feed(self, chunk: object):
+    """Appends a chunk of audio and decodes the window if enough new audio was received.
+
+    Args:
+        chunk (object): Mono 16 kHz float32 PCM samples (see `pcm_f32_view`).
+
+    Returns:
+        StreamingUpdate | None: The update of the decode, or None if the window was not decoded.
+    """
+    view = pcm_f32_view(chunk)
+    self._buffer.frombytes(view.cast("B"))
+    self._n_new += len(view)
+
+    if self._n_new < self._step and len(self._buffer) < self._window:
+      return None
+    return self._decode(final=False)
+
+  def flush(self):
+    """Decodes the remaining audio and finalizes every segment. The session can keep being fed afterwards.
+
+    Returns:
+        StreamingUpdate: The last segments of the audio received so far.
+    """
+    if not self._buffer:
+      return StreamingUpdate([], [])
+    return self._decode(final=True)
+
+  def _decode(self, final: bool):
+    self._n_new = 0
+    result = self._model.transcribe(self._buffer, self._params)
+
+    buffer_cs = len(self._buffer) * 100 // PCM_SAMPLE_RATE
+    commit_cs = buffer_cs if final else (len(self._buffer) - self._overlap) * 100 // PCM_SAMPLE_RATE
+    offset_cs = self._buffer_offset * 100 // PCM_SAMPLE_RATE
+
+    n_final = 0
+    for segment in result.segments:
+      if segment.t1 > commit_cs:
+        break
+      n_final += 1
+
+    # The window must make room for the next step: the audio before `forced` is dropped whatever the segments say, so every segment that starts within it is finalized instead of being lost.
+    forced = 0 if final else max(0, len(self._buffer) - (self._window - self._step))
+    forced_cs = -(-forced * 100 // PCM_SAMPLE_RATE)
+    while n_final < len(result.segments) and result.segments[n_final].t0 < forced_cs:
+      n_final += 1
+
+    def shifted(segment: TranscriptSegment, t1_limit: int):
+      return TranscriptSegment(
+        segment.text,
+        offset_cs + min(segment.t0, t1_limit),
+        offset_cs + min(segment.t1, t1_limit),
+        segment.no_speech_prob
+      )
+
+    finalized = [shifted(segment, buffer_cs) for segment in result.segments[:n_final]]
+    tentative = [shifted(segment, buffer_cs) for segment in result.segments[n_final:]]
+
+    # Finalized audio is never decoded again.
+    if final:
+      cut = len(self._buffer)
+    elif n_final:
+      cut = min(result.segments[n_final - 1].t1 * PCM_SAMPLE_RATE // 100, len(self._buffer))
+    else:
+      cut = 0
+    cut = max(cut, forced) # Any audio left between them had no segment
+
+    if cut:
+      del self._buffer[:cut]
+      self._buffer_offset += cut
+
+    return StreamingUpdate(finalized, tentative)
+
+  def stream(self, chunks: Iterable[object]) -> Iterator[StreamingUpdate]:
+    """Feeds every chunk of an iterable and yields the updates, flushing the session at the end.
+    """
+    for chunk in chunks:
+      update = self.feed(chunk)
+      if update is not None:
+        yield update
+    yield self.flush()
+
+  async def astream(self, chunks: AsyncIterable[object]) -> AsyncIterator[StreamingUpdate]:
+    """Same as `stream` but for asynchronous sources. Decodes run on the model's executor, so the event loop is never blocked.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    executor = self._model._get_executor()
+
+    async for chunk in chunks:
+      update = await loop.run_in_executor(executor, self.feed, chunk)
+      if update is not None:
+        yield update
+    yield await loop.run_in_executor(executor, self.flush)
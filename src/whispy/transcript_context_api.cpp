@@ -24,46 +24,124 @@ extern "C"
    */
   whispy_tc_state whispy_tc_make(whispy_transcript_context *tc, const char *model_path, whisper_context_params cparams)
   {
-    std::vector<std::uint8_t> model_file;
+    mapped_model_file model_file;
+    whisper_model_loader loader;
 
     // Initialize the context's internal state.
+    whispy_tc_state alloc_state = alloc_tc_message(*tc);
+    if (alloc_state != whispy_tc_state::OK)
+      return alloc_state;
+
+    // Map the model file.
     try
     {
-      tc->last_error_message = new char[tc_message_size];
-
-      // Some implementations could work with libc under the hood.
-      if (tc->last_error_message == nullptr)
-        throw std::runtime_error("Memory allocation error");
+      map_model_file(model_file, model_path);
     }
     catch (const std::exception &e)
     {
-      return set_tc_state(*tc, whispy_tc_state::MEMALLOC_ERROR, e.what());
+      return set_tc_state(*tc, whispy_tc_state::LOADMODEL_ERROR, e.what());
     }
 
-    // Load the model file.
+    loader = make_model_loader(model_file);
+    tc->model_context = whisper_init_with_params(&loader, cparams);
+    mapped_model_close(&model_file);
+
+    if (tc->model_context == nullptr)
+      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "whisper_init_with_params() failed");
+
+    return set_tc_state(*tc, whispy_tc_state::OK, nullptr);
+  }
+
+  /**
+   * Initializes a `whispy_transcript_context` that only holds the model weights. No `whisper_state` is allocated, so it cannot transcribe by itself; use `whispy_tc_make_state` to create transcript contexts that share its weights.
+   * 
+   * @param tc A reference to a `whispy_transcript_context`.
+   * @param model_path A character array containing the path to the model file.
+   * @param cparams Internal transcript context's model initialization parameters. 
+   * 
+   * @returns The same state as the one within the transcript context.
+   */
+  whispy_tc_state whispy_tc_make_shared(whispy_transcript_context *tc, const char *model_path, whisper_context_params cparams)
+  {
+    whispy_tc_state alloc_state = alloc_tc_message(*tc);
+    if (alloc_state != whispy_tc_state::OK)
+      return alloc_state;
+
+    mapped_model_file model_file;
+    whisper_model_loader loader;
+
     try
     {
-      model_file = load_binary_data<std::uint8_t>(model_path);
+      map_model_file(model_file, model_path);
     }
     catch (const std::exception &e)
     {
       return set_tc_state(*tc, whispy_tc_state::LOADMODEL_ERROR, e.what());
     }
 
-    tc->model_context = whisper_init_from_buffer_with_params(
-        model_file.data(),
-        model_file.size(),
-        cparams);
+    loader = make_model_loader(model_file);
+    tc->model_context = whisper_init_with_params_no_state(&loader, cparams);
+    mapped_model_close(&model_file);
 
     if (tc->model_context == nullptr)
-      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "whisper_init_from_buffer_with_params() failed");
+      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "whisper_init_with_params_no_state() failed");
+
+    return set_tc_state(*tc, whispy_tc_state::OK, nullptr);
+  }
+
+  /**
+   * Initializes a `whispy_transcript_context` with its own `whisper_state` over the weights of a shared one.
+   * 
+   * @param tc A reference to the `whispy_transcript_context` to initialize.
+   * @param shared A healthy `whispy_transcript_context` created with `whispy_tc_make_shared`. It must outlive `tc`.
+   * 
+   * @returns The same state as the one within the transcript context.
+   */
+  whispy_tc_state whispy_tc_make_state(whispy_transcript_context *tc, const whispy_transcript_context *shared)
+  {
+    whispy_tc_state alloc_state = alloc_tc_message(*tc);
+    if (alloc_state != whispy_tc_state::OK)
+      return alloc_state;
+
+    if (shared == nullptr || shared->last_error_code != whispy_tc_state::OK || shared->model_context == nullptr)
+      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "Bad shared whisper context");
+
+    tc->model_context = shared->model_context;
+    tc->model_state = whisper_init_state(shared->model_context);
+    if (tc->model_state == nullptr)
+      return set_tc_state(*tc, whispy_tc_state::MEMALLOC_ERROR, "whisper_init_state() failed");
 
     return set_tc_state(*tc, whispy_tc_state::OK, nullptr);
   }
 
+  /**
+   * Clears a recoverable error so the `whispy_transcript_context` can be used again. Failed, aborted, timed out or rejected transcriptions leave the model and the state untouched, so only `LOADSPEECH_ERROR`, `SPEECHGEN_ERROR`, `TIMEOUT_ERROR` and `AUDIOLEN_ERROR` are cleared.
+   * 
+   * @param tc Any `whispy_transcript_context`
+   * 
+   * @returns The state of the transcript context after the reset.
+   */
+  whispy_tc_state whispy_tc_reset(whispy_transcript_context *tc)
+  {
+    switch (tc->last_error_code)
+    {
+    case whispy_tc_state::LOADSPEECH_ERROR:
+    case whispy_tc_state::SPEECHGEN_ERROR:
+    case whispy_tc_state::TIMEOUT_ERROR:
+    case whispy_tc_state::AUDIOLEN_ERROR:
+      tc->last_error_code = whispy_tc_state::OK;
+      break;
+    default:
+      break;
+    }
+    return tc->last_error_code;
+  }
+
   /**
    * Frees the resources associated with a `whispy_transcript_context`.
    * 
+   * Transcript contexts with their own `whisper_state` only free that state, since the model context is borrowed.
+   * 
    * @param tc Any `whispy_transcript_context`
    */
   void whispy_tc_free(whispy_transcript_context *tc)
@@ -72,9 +150,20 @@ extern "C"
       return;
     tc->last_error_code = whispy_tc_state::FREEDCTX_ERROR;
     if (tc->last_error_message != nullptr)
-      delete tc->last_error_message;
-    if (tc->model_context != nullptr)
+      delete[] tc->last_error_message;
+    tc->last_error_message = nullptr;
+
+    if (tc->model_state != nullptr)
+    {
+      whisper_free_state(tc->model_state);
+      tc->model_state = nullptr;
+      tc->model_context = nullptr;
+    }
+    else if (tc->model_context != nullptr)
+    {
       whisper_free(tc->model_context);
+      tc->model_context = nullptr;
+    }
   }
 
   /**
@@ -87,12 +176,43 @@ extern "C"
    */
   whispy_tc_state whispy_speech_to_text(char *text, std::size_t text_size, whispy_transcript_context *tc, const char *speech_path, whisper_full_params wparams)
   {
-    std::vector<float> speech_file;
-    std::size_t text_pos = 0;
+    whispy_tc_state state = whispy_transcribe(tc, speech_path, wparams);
+    if (state != whispy_tc_state::OK)
+      return state;
 
-    int wret = 0, nsegments = 0;
-    const char *text_segment = nullptr;
-    std::size_t writable_len = 0;
+    write_segments_text(*tc, text, text_size);
+    return state;
+  }
+
+  /**
+   * Generates plain text from PCM samples that are already in memory.
+   * 
+   * @param text The destination where to place the resulting text.
+   * @param text_size The text's memory block size. 
+   * @param tc A healthy `whispy_transcript_context` that will be used to transcribe.
+   * @param samples Mono 16 kHz float32 PCM samples. The buffer is handed to `whisper_full` as it is, so it must outlive the call.
+   * @param n_samples The number of samples pointed by `samples`.
+   */
+  whispy_tc_state whispy_speech_to_text_pcm(char *text, std::size_t text_size, whispy_transcript_context *tc, const float *samples, std::size_t n_samples, whisper_full_params wparams)
+  {
+    whispy_tc_state state = whispy_transcribe_pcm(tc, samples, n_samples, wparams);
+    if (state != whispy_tc_state::OK)
+      return state;
+
+    write_segments_text(*tc, text, text_size);
+    return state;
+  }
+
+  /**
+   * Transcribes an audio file and keeps the resulting segments within the model context.
+   * 
+   * @param tc A healthy `whispy_transcript_context` that will be used to transcribe.
+   * @param speech_path The path to the audio file that will be transcribed. The only supported audio format is raw pcm little endian 32-bits.
+   */
+  whispy_tc_state whispy_transcribe(whispy_transcript_context *tc, const char *speech_path, whisper_full_params wparams)
+  {
+    std::vector<float> speech_file;
+    timing_clock::time_point load_start = timing_clock::now();
 
     if (tc->last_error_code != whispy_tc_state::OK)
       return tc->last_error_code;
@@ -100,6 +220,7 @@ extern "C"
     if (tc->model_context == nullptr)
       return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "Bad whisper context");
 
+    tc->timings = whispy_timings{};
     try
     {
       speech_file = load_binary_data<float>(speech_path);
@@ -108,28 +229,109 @@ extern "C"
     {
       return set_tc_state(*tc, whispy_tc_state::LOADSPEECH_ERROR, e.what());
     }
+    tc->timings.load_ms = elapsed_ms(load_start);
 
-    wret = whisper_full(tc->model_context, wparams, speech_file.data(), speech_file.size());
-    if (wret != 0)
-    {
-      return set_tc_state(*tc, whispy_tc_state::SPEECHGEN_ERROR, "whisper_full() failed");
-    }
+    if (speech_file.empty())
+      return set_tc_state(*tc, whispy_tc_state::LOADSPEECH_ERROR, "Empty PCM buffer");
 
-    nsegments = whisper_full_n_segments(tc->model_context);
-    for (int i = 0; i < nsegments && text_pos < text_size - 1; i++)
-    {
-      text_segment = whisper_full_get_segment_text(tc->model_context, i);
-      writable_len = std::min(std::strlen(text_segment), text_size - text_pos - 1);
+    return run_whisper_full(*tc, speech_file.data(), speech_file.size(), wparams);
+  }
+
+  /**
+   * Transcribes PCM samples that are already in memory and keeps the resulting segments within the model context.
+   * 
+   * @param tc A healthy `whispy_transcript_context` that will be used to transcribe.
+   * @param samples Mono 16 kHz float32 PCM samples. The buffer is handed to `whisper_full` as it is, so it must outlive the call.
+   * @param n_samples The number of samples pointed by `samples`.
+   */
+  whispy_tc_state whispy_transcribe_pcm(whispy_transcript_context *tc, const float *samples, std::size_t n_samples, whisper_full_params wparams)
+  {
+    if (tc->last_error_code != whispy_tc_state::OK)
+      return tc->last_error_code;
 
-      std::memcpy(
-          text + text_pos,
-          text_segment,
-          writable_len);
+    if (tc->model_context == nullptr)
+      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "Bad whisper context");
 
-      text_pos += writable_len;
-    }
-    text[text_pos] = '\0';
+    if (samples == nullptr || n_samples == 0)
+      return set_tc_state(*tc, whispy_tc_state::LOADSPEECH_ERROR, "Empty PCM buffer");
+
+    tc->timings = whispy_timings{};
+    return run_whisper_full(*tc, samples, n_samples, wparams);
+  }
+
+  /**
+   * Counts the tokens produced by the last transcription of a transcript context.
+   * 
+   * @param tc A `whispy_transcript_context` whose last transcription succeeded.
+   * @param include_special Whether special tokens (start of transcript, timestamps...) are counted.
+   */
+  std::size_t whispy_count_tokens(const whispy_transcript_context *tc, bool include_special)
+  {
+    std::size_t n_tokens = 0;
+
+    if (tc == nullptr || tc->model_context == nullptr)
+      return 0;
+    for_each_token(*tc, include_special, [&](int, const whisper_token_data &) {
+      ++n_tokens;
+      return true;
+    });
+    return n_tokens;
+  }
+
+  /**
+   * Copies the token data of the last transcription of a transcript context into columns, without creating an object per token.
+   * 
+   * @param tc A `whispy_transcript_context` whose last transcription succeeded.
+   * @param include_special Whether special tokens (start of transcript, timestamps...) are copied.
+   * @param columns The destination arrays. Null columns are skipped.
+   * @param capacity Maximum number of tokens to copy.
+   * 
+   * @returns The number of tokens copied.
+   */
+  std::size_t whispy_fill_tokens(const whispy_transcript_context *tc, bool include_special, const whispy_token_columns *columns, std::size_t capacity)
+  {
+    std::size_t n_tokens = 0;
+
+    if (tc == nullptr || tc->model_context == nullptr || columns == nullptr)
+      return 0;
+    for_each_token(*tc, include_special, [&](int segment, const whisper_token_data &data) {
+      if (n_tokens == capacity)
+        return false;
+      if (columns->segment != nullptr) columns->segment[n_tokens] = segment;
+      if (columns->id != nullptr) columns->id[n_tokens] = data.id;
+      if (columns->p != nullptr) columns->p[n_tokens] = data.p;
+      if (columns->plog != nullptr) columns->plog[n_tokens] = data.plog;
+      if (columns->t0 != nullptr) columns->t0[n_tokens] = data.t0;
+      if (columns->t1 != nullptr) columns->t1[n_tokens] = data.t1;
+      if (columns->t_dtw != nullptr) columns->t_dtw[n_tokens] = data.t_dtw;
+      if (columns->vlen != nullptr) columns->vlen[n_tokens] = data.vlen;
+      ++n_tokens;
+      return true;
+    });
+    return n_tokens;
+  }
+
+  /**
+   * Detects the spoken language of PCM samples without transcribing them. The spectrogram is computed for every sample, so callers should only pass the leading window.
+   * 
+   * @param tc A healthy `whispy_transcript_context` that will be used to run the model.
+   * @param samples Mono 16 kHz float32 PCM samples.
+   * @param n_samples The number of samples pointed by `samples`.
+   * @param n_threads Threads used to compute the spectrogram and run the model.
+   * @param lang_probs Receives the probability of every language, indexed by language id. It must hold `whisper_lang_max_id() + 1` floats.
+   */
+  whispy_tc_state whispy_detect_language_pcm(whispy_transcript_context *tc, const float *samples, std::size_t n_samples, int n_threads, float *lang_probs)
+  {
+    if (tc->last_error_code != whispy_tc_state::OK)
+      return tc->last_error_code;
+
+    if (tc->model_context == nullptr)
+      return set_tc_state(*tc, whispy_tc_state::INVWHISCTX_ERROR, "Bad whisper context");
+
+    if (samples == nullptr || n_samples == 0)
+      return set_tc_state(*tc, whispy_tc_state::LOADSPEECH_ERROR, "Empty PCM buffer");
 
-    return set_tc_state(*tc, whispy_tc_state::OK, nullptr); // Flushes any previous bad state.
+    tc->timings = whispy_timings{};
+    return run_language_detection(*tc, samples, n_samples, n_threads, lang_probs);
   }
 }
\ No newline at end of file
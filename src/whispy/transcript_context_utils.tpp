@@ -1,3 +1,7 @@
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <memory>
 #include <type_traits>
 #include <vector>
 #include <string>
@@ -7,8 +11,14 @@
 #include <stdexcept>
 
 #include <cstring>
+#include <cerrno>
 #include <cmath>
 
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
 #include "whispy.h"
 
 
@@ -70,12 +80,386 @@ whispy_tc_state set_tc_state(whispy_transcript_context &tc, whispy_tc_state stat
   if (tc.last_error_message != nullptr && error_message != nullptr) {
     msg_max_length = std::min(tc_message_size - 1, std::strlen(error_message));
     std::memcpy(tc.last_error_message, error_message, msg_max_length);
-    tc.last_error_message[msg_max_length + 1] = '\0';
+    tc.last_error_message[msg_max_length] = '\0';
   }
 
   return state;
 }
 
+/**
+ * Concatenates the text of every segment produced by the last transcription of a `whispy_transcript_context`.
+ * 
+ * @param tc The transcript context that ran the transcription.
+ * @param text The destination where to place the resulting text.
+ * @param text_size The text's memory block size. The result is truncated to fit and always null-terminated.
+ */
+void write_segments_text(whispy_transcript_context &tc, char *text, std::size_t text_size)
+{
+  std::size_t text_pos = 0;
+  std::size_t writable_len = 0;
+  const char *text_segment = nullptr;
+  int nsegments = 0;
+
+  if (text == nullptr || text_size == 0)
+    return;
+
+  nsegments = tc.model_state != nullptr
+                  ? whisper_full_n_segments_from_state(tc.model_state)
+                  : whisper_full_n_segments(tc.model_context);
+
+  for (int i = 0; i < nsegments && text_pos < text_size - 1; i++)
+  {
+    text_segment = tc.model_state != nullptr
+                       ? whisper_full_get_segment_text_from_state(tc.model_state, i)
+                       : whisper_full_get_segment_text(tc.model_context, i);
+    writable_len = std::min(std::strlen(text_segment), text_size - text_pos - 1);
+
+    std::memcpy(
+        text + text_pos,
+        text_segment,
+        writable_len);
+
+    text_pos += writable_len;
+  }
+  text[text_pos] = '\0';
+}
+
+/**
+ * Allocates the error message buffer of a `whispy_transcript_context`.
+ * 
+ * @param tc A reference to a `whispy_transcript_context`.
+ * 
+ * @return Returns the same state that was stablished into the `whispy_transcript_context`.
+ */
+whispy_tc_state alloc_tc_message(whispy_transcript_context &tc)
+{
+  try
+  {
+    tc.last_error_message = new char[tc_message_size];
+
+    // Some implementations could work with libc under the hood.
+    if (tc.last_error_message == nullptr)
+      throw std::runtime_error("Memory allocation error");
+  }
+  catch (const std::exception &e)
+  {
+    tc.last_error_code = whispy_tc_state::MEMALLOC_ERROR;
+    return tc.last_error_code;
+  }
+
+  tc.last_error_message[0] = '\0';
+  return whispy_tc_state::OK;
+}
+
+using timing_clock = std::chrono::steady_clock;
+
+double elapsed_ms(timing_clock::time_point since)
+{
+  return std::chrono::duration<double, std::milli>(timing_clock::now() - since).count();
+}
+
+/**
+ * Wraps the encoder_begin_callback, logits_filter_callback and abort_callback of a transcription to time it and enforce its time budget and abort flag, chaining to the caller's callbacks if there are any.
+ *
+ * Every window is split in two phases: encoding, from encoder_begin_callback to the first logits_filter_callback of the window, and decoding, from then on until the next window (or the end of whisper_full).
+ */
+struct timing_probe
+{
+  whisper_encoder_begin_callback callback = nullptr;
+  void *user_data = nullptr;
+  ggml_abort_callback abort_callback = nullptr;
+  void *abort_user_data = nullptr;
+  whispy_timings *timings = nullptr;
+  timing_clock::time_point start;
+  timing_clock::time_point deadline = timing_clock::time_point::max();
+  bool timed_out = false;
+  int32_t *abort_flag = nullptr;
+
+  whisper_logits_filter_callback logits_callback = nullptr;
+  void *logits_user_data = nullptr;
+  enum class phase { none, encoding, decoding } window_phase = phase::none;
+  timing_clock::time_point phase_start;
+  double encode_ms = 0;
+  double decode_ms = 0;
+};
+
+/**
+ * Adds the time spent in the current phase of the window, if any, and leaves it.
+ */
+void probe_end_phase(timing_probe &probe, timing_clock::time_point now)
+{
+  const double ms = std::chrono::duration<double, std::milli>(now - probe.phase_start).count();
+  if (probe.window_phase == timing_probe::phase::encoding)
+    probe.encode_ms += ms;
+  else if (probe.window_phase == timing_probe::phase::decoding)
+    probe.decode_ms += ms;
+  probe.window_phase = timing_probe::phase::none;
+}
+
+bool probe_flagged(const timing_probe &probe)
+{
+  return probe.abort_flag != nullptr && std::atomic_ref<int32_t>(*probe.abort_flag).load(std::memory_order_relaxed) != 0;
+}
+
+bool probe_out_of_time(timing_probe &probe)
+{
+  if (!probe.timed_out && timing_clock::now() >= probe.deadline)
+    probe.timed_out = true;
+  return probe.timed_out;
+}
+
+bool probe_encoder_begin(whisper_context *ctx, whisper_state *state, void *user_data)
+{
+  auto *probe = static_cast<timing_probe *>(user_data);
+  const auto now = timing_clock::now();
+
+  if (probe->timings->n_windows++ == 0)
+    probe->timings->mel_ms = std::chrono::duration<double, std::milli>(now - probe->start).count();
+  probe_end_phase(*probe, now);
+
+  if (probe_out_of_time(*probe) || probe_flagged(*probe))
+    return false;
+  if (probe->callback != nullptr && !probe->callback(ctx, state, probe->user_data))
+    return false;
+
+  probe->window_phase = timing_probe::phase::encoding;
+  probe->phase_start = timing_clock::now();
+  return true;
+}
+
+void probe_logits_filter(whisper_context *ctx, whisper_state *state, const whisper_token_data *tokens, int n_tokens, float *logits, void *user_data)
+{
+  auto *probe = static_cast<timing_probe *>(user_data);
+
+  // Only the first call of a window reads the clock, the decoder calls it for every token.
+  if (probe->window_phase == timing_probe::phase::encoding)
+  {
+    const auto now = timing_clock::now();
+    probe_end_phase(*probe, now);
+    probe->window_phase = timing_probe::phase::decoding;
+    probe->phase_start = now;
+  }
+
+  if (probe->logits_callback != nullptr)
+    probe->logits_callback(ctx, state, tokens, n_tokens, logits, probe->logits_user_data);
+}
+
+bool probe_abort(void *user_data)
+{
+  auto *probe = static_cast<timing_probe *>(user_data);
+  return probe_out_of_time(*probe) || probe_flagged(*probe) || (probe->abort_callback != nullptr && probe->abort_callback(probe->abort_user_data));
+}
+
+/**
+ * Runs whisper_full over the samples with the whisper state of the transcript context, if it has one, and times it.
+ */
+whispy_tc_state run_whisper_full(whispy_transcript_context &tc, const float *samples, std::size_t n_samples, whisper_full_params wparams)
+{
+  int wret = 0;
+  timing_probe probe{
+    wparams.encoder_begin_callback,
+    wparams.encoder_begin_callback_user_data,
+    wparams.abort_callback,
+    wparams.abort_callback_user_data,
+    &tc.timings,
+    timing_clock::now()
+  };
+  probe.abort_flag = tc.limits.abort_flag;
+  probe.logits_callback = wparams.logits_filter_callback;
+  probe.logits_user_data = wparams.logits_filter_callback_user_data;
+
+  if (tc.limits.max_audio_ms > 0 && static_cast<double>(n_samples) * 1000 / WHISPER_SAMPLE_RATE > tc.limits.max_audio_ms)
+    return set_tc_state(tc, whispy_tc_state::AUDIOLEN_ERROR, "The audio is longer than allowed");
+
+  wparams.encoder_begin_callback = probe_encoder_begin;
+  wparams.encoder_begin_callback_user_data = &probe;
+  wparams.logits_filter_callback = probe_logits_filter;
+  wparams.logits_filter_callback_user_data = &probe;
+  if (tc.limits.timeout_ms > 0)
+    probe.deadline = probe.start + std::chrono::duration_cast<timing_clock::duration>(std::chrono::duration<double, std::milli>(tc.limits.timeout_ms));
+  if (tc.limits.timeout_ms > 0 || probe.abort_flag != nullptr)
+  {
+    wparams.abort_callback = probe_abort;
+    wparams.abort_callback_user_data = &probe;
+  }
+
+  if (tc.model_state != nullptr)
+  {
+    wret = whisper_full_with_state(tc.model_context, tc.model_state, wparams, samples, static_cast<int>(n_samples));
+  }
+  else
+  {
+    whisper_reset_timings(tc.model_context);
+    wret = whisper_full(tc.model_context, wparams, samples, static_cast<int>(n_samples));
+  }
+  const auto end = timing_clock::now();
+  tc.timings.inference_ms = std::chrono::duration<double, std::milli>(end - probe.start).count();
+  probe_end_phase(probe, end);
+  if (tc.timings.n_windows > 0)
+  {
+    tc.timings.encode_ms = static_cast<float>(probe.encode_ms);
+    tc.timings.decode_ms = static_cast<float>(probe.decode_ms);
+  }
+
+  // The finer breakdown of whisper.cpp is only kept by contexts that own their state. whisper_get_timings allocates a copy that the caller owns.
+  if (const std::unique_ptr<whisper_timings> internal{tc.model_state == nullptr ? whisper_get_timings(tc.model_context) : nullptr})
+  {
+    tc.timings.sample_ms = internal->sample_ms;
+    tc.timings.batchd_ms = internal->batchd_ms;
+    tc.timings.prompt_ms = internal->prompt_ms;
+  }
+
+  // Running out of time before an encoder window makes whisper_full return early without an error, so the probe is checked first.
+  if (probe.timed_out)
+    return set_tc_state(tc, whispy_tc_state::TIMEOUT_ERROR, "The transcription ran out of time");
+  if (probe_flagged(probe))
+    return set_tc_state(tc, whispy_tc_state::SPEECHGEN_ERROR, "The transcription was aborted");
+  if (wret != 0)
+    return set_tc_state(tc, whispy_tc_state::SPEECHGEN_ERROR, "whisper_full() failed");
+  return set_tc_state(tc, whispy_tc_state::OK, nullptr); // Flushes any previous bad state.
+}
+
+/**
+ * Calls `visit(segment, token_data)` for every token of the last transcription of a transcript context, in order, until it returns false.
+ */
+template <typename Visitor>
+void for_each_token(const whispy_transcript_context &tc, bool include_special, Visitor &&visit)
+{
+  const whisper_token eot = whisper_token_eot(tc.model_context);
+  const int n_segments = tc.model_state != nullptr ? whisper_full_n_segments_from_state(tc.model_state) : whisper_full_n_segments(tc.model_context);
+
+  for (int i_segment = 0; i_segment < n_segments; ++i_segment)
+  {
+    const int n_tokens = tc.model_state != nullptr ? whisper_full_n_tokens_from_state(tc.model_state, i_segment) : whisper_full_n_tokens(tc.model_context, i_segment);
+    for (int i_token = 0; i_token < n_tokens; ++i_token)
+    {
+      const whisper_token_data data = tc.model_state != nullptr
+        ? whisper_full_get_token_data_from_state(tc.model_state, i_segment, i_token)
+        : whisper_full_get_token_data(tc.model_context, i_segment, i_token);
+      if (!include_special && data.id >= eot) // Special tokens follow the text vocabulary
+        continue;
+      if (!visit(i_segment, data))
+        return;
+    }
+  }
+}
+
+/**
+ * Runs the language detection of whisper.cpp over the samples with the whisper state of the transcript context, if it has one, and times it.
+ */
+whispy_tc_state run_language_detection(whispy_transcript_context &tc, const float *samples, std::size_t n_samples, int n_threads, float *lang_probs)
+{
+  int lang_id = -1;
+  int mret = 0;
+  timing_clock::time_point start = timing_clock::now();
+
+  if (tc.model_state != nullptr)
+    mret = whisper_pcm_to_mel_with_state(tc.model_context, tc.model_state, samples, static_cast<int>(n_samples), n_threads);
+  else
+    mret = whisper_pcm_to_mel(tc.model_context, samples, static_cast<int>(n_samples), n_threads);
+  tc.timings.mel_ms = elapsed_ms(start);
+  if (mret != 0)
+    return set_tc_state(tc, whispy_tc_state::SPEECHGEN_ERROR, "whisper_pcm_to_mel() failed");
+
+  // Encodes the first window and decodes the start of transcript token only.
+  if (tc.model_state != nullptr)
+    lang_id = whisper_lang_auto_detect_with_state(tc.model_context, tc.model_state, 0, n_threads, lang_probs);
+  else
+    lang_id = whisper_lang_auto_detect(tc.model_context, 0, n_threads, lang_probs);
+  tc.timings.inference_ms = elapsed_ms(start);
+  tc.timings.n_windows = 1;
+
+  if (lang_id < 0)
+    return set_tc_state(tc, whispy_tc_state::SPEECHGEN_ERROR, "whisper_lang_auto_detect() failed");
+  return set_tc_state(tc, whispy_tc_state::OK, nullptr);
+}
+
+/**
+ * A read-only, shared memory mapping of a model file, consumed sequentially by whisper.cpp through a `whisper_model_loader`.
+ *
+ * The file is read straight from the page cache, so loading a model neither buffers the whole file on the heap nor duplicates the page cache pages between the processes of a host.
+ */
+struct mapped_model_file
+{
+  const std::uint8_t *data = nullptr;
+  std::size_t size = 0;
+  std::size_t offset = 0;
+};
+
+/**
+ * Maps a model file into memory.
+ *
+ * @param file The mapping to initialize.
+ * @param model_path A character array containing the path to the model file.
+ *
+ * @throws std::runtime_error
+ */
+void map_model_file(mapped_model_file &file, const char *model_path) noexcept(false)
+{
+  struct stat file_stat{};
+  void *data = nullptr;
+
+  int fd = ::open(model_path, O_RDONLY | O_CLOEXEC);
+  if (fd < 0)
+    throw std::runtime_error(std::string("Could not open model file: ") + std::strerror(errno));
+
+  if (::fstat(fd, &file_stat) != 0 || file_stat.st_size <= 0)
+  {
+    ::close(fd);
+    throw std::runtime_error("Could not stat model file or it is empty");
+  }
+
+  data = ::mmap(nullptr, static_cast<std::size_t>(file_stat.st_size), PROT_READ, MAP_SHARED, fd, 0);
+  ::close(fd); // The mapping keeps the file referenced.
+  if (data == MAP_FAILED)
+    throw std::runtime_error(std::string("Could not map model file: ") + std::strerror(errno));
+
+  ::madvise(data, static_cast<std::size_t>(file_stat.st_size), MADV_SEQUENTIAL);
+
+  file.data = static_cast<const std::uint8_t *>(data);
+  file.size = static_cast<std::size_t>(file_stat.st_size);
+  file.offset = 0;
+}
+
+std::size_t mapped_model_read(void *ctx, void *output, std::size_t read_size)
+{
+  auto *file = static_cast<mapped_model_file *>(ctx);
+  std::size_t readable = std::min(read_size, file->size - file->offset);
+
+  std::memcpy(output, file->data + file->offset, readable);
+  file->offset += readable;
+  return readable;
+}
+
+bool mapped_model_eof(void *ctx)
+{
+  auto *file = static_cast<mapped_model_file *>(ctx);
+  return file->offset >= file->size;
+}
+
+/**
+ * Unmaps a model file. It is called by whisper.cpp once the weights are loaded and it is safe to call it again.
+ */
+void mapped_model_close(void *ctx)
+{
+  auto *file = static_cast<mapped_model_file *>(ctx);
+  if (file->data == nullptr)
+    return;
+
+  ::munmap(const_cast<std::uint8_t *>(file->data), file->size);
+  file->data = nullptr;
+  file->size = file->offset = 0;
+}
+
+whisper_model_loader make_model_loader(mapped_model_file &file)
+{
+  return whisper_model_loader{
+      &file,
+      mapped_model_read,
+      mapped_model_eof,
+      mapped_model_close};
+}
+
 /**
  * Parses an stream insternal std::ios_base::iostate to text.
  * @param stream Any C++ stream.
@@ -0,0 +1,340 @@
+from typing import Iterable, Literal
+from os.path import join, expanduser
+from functools import lru_cache
+import itertools
+import hashlib
+import math
+import copy
+import json
+import time
+import os
+
+from .models import ModelHeader, registry as model_registry
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view
+
+
+OBJECTIVES = ("latency", "throughput")
+"""What a profile optimizes: `latency` picks the `n_threads` of a single transcription, `throughput` the split of the cores between concurrent transcriptions (workers or states) and their `n_threads`.
+"""
+
+Objective = Literal["latency"] | Literal["throughput"]
+
+DEFAULT_MAX_STATES = 8
+"""Cap of the concurrent transcriptions tried by `tune`. Every one of them holds a whisper state, whose buffers take from hundreds of MB to GBs with larger models.
+"""
+
+
+def default_profiles_dir():
+  """`$WHISPY_PROFILES_DIR`, or `$XDG_CACHE_HOME/whispy/profiles`.
+  """
+  directory = os.environ.get("WHISPY_PROFILES_DIR")
+  if directory:
+    return directory
+  base = os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+  return join(base, "whispy", "profiles")
+
+
+def _cpu_model():
+  try:
+    with open("/proc/cpuinfo", "r") as cpuinfo:
+      for line in cpuinfo:
+        key, _, value = line.partition(":")
+        if key.strip() in ("model name", "Model", "Hardware"):
+          return value.strip()
+  except OSError:
+    pass
+  return os.uname().machine
+
+
+@lru_cache(maxsize=1)
+def host_info():
+  """What makes a host perform differently: its CPU model, architecture and the cores available to this process.
+  """
+  from .batch import available_cores
+  return dict(cpu=_cpu_model(), machine=os.uname().machine, cores=available_cores())
+
+
+def host_id():
+  """A short digest of `host_info`, so hosts with the same hardware share their profiles.
+  """
+  digest = hashlib.sha256(json.dumps(host_info(), sort_keys=True).encode())
+  return digest.hexdigest()[:16]
+
+
+def model_key(header: ModelHeader):
+  """Profiles are kept per model size and tensor type, since both change how inference scales with threads (e.g. "base-f1").
+  """
+  return f"{header.size or header.n_audio_state}-f{header.ftype}" # type: ignore
+
+
+def candidate_threads(n_cores: int):
+  """Powers of two up to `n_cores`, plus `n_cores` itself.
+  """
+  candidates = []
+  n_threads = 1
+  while n_threads < n_cores:
+    candidates.append(n_threads)
+    n_threads *= 2
+  candidates.append(n_cores)
+  return candidates
+
+
+class TuningProfile:
+  """The best configuration found for a model on this host, with the measurements it was chosen from.
+  """
+  __slots__ = ("model", "objective", "n_threads", "workers", "audio_seconds", "measurements", "created")
+
+  def __init__(
+    self,
+    model: str,
+    objective: Objective,
+    n_threads: int,
+    workers: int = 1,
+    audio_seconds: float = 0.0,
+    measurements: list[dict] | None = None,
+    created: float | None = None
+  ):
+    self.model = model
+    """The `model_key` of the tuned model.
+    """
+    self.objective = objective
+    self.n_threads = n_threads
+    """whisper.cpp threads per transcription.
+    """
+    self.workers = workers
+    """Concurrent transcriptions (worker processes or whisper states). Always 1 for latency profiles.
+    """
+    self.audio_seconds = audio_seconds
+    """Median length of the calibration clips.
+    """
+    self.measurements = measurements or []
+    """Every configuration tried, with its `n_threads`, `workers` and `score` (seconds per audio second for latency, audio seconds per second for throughput).
+    """
+    self.created = created if created is not None else time.time()
+
+  def to_dict(self):
+    return {name: getattr(self, name) for name in self.__slots__}
+
+  @classmethod
+  def from_dict(cls, data: dict):
+    return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+  def __repr__(self):
+    return f"TuningProfile(model={self.model!r}, objective={self.objective!r}, n_threads={self.n_threads}, workers={self.workers})"
+
+
+# Persistence
+
+def profile_path(directory: str | None = None):
+  return join(directory or default_profiles_dir(), f"{host_id()}.json")
+
+
+@lru_cache(maxsize=8)
+def _read_profiles(path: str, mtime_ns: int):
+  with open(path, "r") as profiles_file:
+    return json.load(profiles_file)
+
+def _load_document(path: str):
+  try:
+    return _read_profiles(path, os.stat(path).st_mtime_ns)
+  except (OSError, ValueError): # No profile yet, or a corrupt one that the next `save_profile` replaces
+    return dict(host=host_info(), models={})
+
+
+def load_profile(model: str, objective: Objective, directory: str | None = None):
+  """Returns the profile this host stored for a model (see `model_key`), or None if it was never tuned.
+  """
+  data = _load_document(profile_path(directory))["models"].get(model, {}).get(objective)
+  return TuningProfile.from_dict(data) if data is not None else None
+
+
+def save_profile(profile: TuningProfile, directory: str | None = None):
+  """Stores the profile of this host, replacing the previous one for the same model and objective.
+
+  Returns:
+      str: The path of the profiles file.
+  """
+  path = profile_path(directory)
+  document = _load_document(path)
+  models = dict(document["models"])
+  models[profile.model] = dict(models.get(profile.model, {}), **{profile.objective: profile.to_dict()})
+
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  staging = f"{path}.{os.getpid()}.tmp"
+  with open(staging, "w") as profiles_file:
+    json.dump(dict(host=host_info(), models=models), profiles_file, indent=2)
+  os.replace(staging, path) # Readers never see a partial file
+  return path
+
+
+# Applying profiles
+
+def tuned_threads(header: ModelHeader, n_states: int = 1, directory: str | None = None):
+  """The `n_threads` a model should use on this host when the transcription parameters leave it unset.
+
+  A single-state model uses the latency profile, a model with several states the throughput one, since its transcriptions share the cores. Falls back to the other profile when only one was tuned.
+
+  Returns:
+      int | None: None if the model was never tuned on this host.
+  """
+  preferred = ("throughput", "latency") if n_states > 1 else ("latency", "throughput")
+  for objective in preferred:
+    profile = load_profile(model_key(header), objective, directory) # type: ignore
+    if profile is not None:
+      return profile.n_threads
+  return None
+
+
+def tuned_topology(model_params, directory: str | None = None):
+  """The workers and threads per worker the batch APIs should use for a model on this host (see `transcribe_many` and `PreforkPool`).
+
+  Returns:
+      tuple[int, int] | None: None if the model was never tuned for throughput on this host or `model_params` opted out.
+  """
+  whispy_params = model_params._get_whispy_params()
+  if not whispy_params.get("use_profile", True):
+    return None
+  entry = model_registry.resolve(whispy_params["model_name"])
+  if entry is None:
+    return None
+  try:
+    header = entry.header()
+  except Exception: # Reported when the model is actually loaded
+    return None
+  profile = load_profile(model_key(header), "throughput", directory)
+  return (profile.workers, profile.n_threads) if profile is not None else None
+
+
+# Calibration
+
+def _median_seconds(func, repeat: int):
+  import statistics
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    samples.append(time.perf_counter() - start)
+  return statistics.median(samples)
+
+
+def _calibrate_latency(model, clips: list, params, threads: list[int], repeat: int):
+  audio_seconds = sum(len(clip) for clip in clips) / PCM_SAMPLE_RATE
+  measurements = []
+  for n_threads in threads:
+    params._wfull_params_dict["n_threads"] = n_threads
+
+    def run():
+      for clip in clips:
+        model.transcribe(clip, params)
+    run() # Untimed, first calls pay for allocations
+    measurements.append(dict(n_threads=n_threads, workers=1, score=_median_seconds(run, repeat) / audio_seconds))
+  return measurements
+
+
+def _tuning_model(model_params, n_states: int):
+  """A model that measures inference alone, without caches nor a previous profile.
+  """
+  from .whispy import WhispyModel
+  tuning_params = copy.copy(model_params)
+  tuning_params._whispy_params = dict(model_params._get_whispy_params())
+  tuning_params.use_profile(False).pcm_cache(None).result_cache(None).n_states(n_states)
+  return WhispyModel(tuning_params)
+
+
+def _calibrate_throughput(model_params, clips: list, params, topologies: list[tuple[int, int]], repeat: int):
+  from concurrent.futures import ThreadPoolExecutor
+
+  measurements = []
+  # One model at a time, with exactly the states its topologies use, so the largest topology does not keep its states alive for the rest.
+  for workers, group in itertools.groupby(sorted(topologies), key=lambda topology: topology[0]):
+    model = _tuning_model(model_params, workers)
+    try:
+      for _, n_threads in group:
+        params._wfull_params_dict["n_threads"] = n_threads
+        jobs = clips * max(1, math.ceil(repeat * workers / len(clips))) # At least `repeat` jobs per worker
+        audio_seconds = sum(len(clip) for clip in jobs) / PCM_SAMPLE_RATE
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+          list(executor.map(lambda clip: model.transcribe(clip, params), clips[:1] * workers)) # Creates every state
+          start = time.perf_counter()
+          list(executor.map(lambda clip: model.transcribe(clip, params), jobs))
+          elapsed = time.perf_counter() - start
+        measurements.append(dict(n_threads=n_threads, workers=workers, score=audio_seconds / elapsed))
+    finally:
+      model.destroy()
+  return measurements
+
+
+def tune(
+  model_params,
+  audio: Iterable[object],
+  params=None,
+  objectives: Iterable[Objective] = OBJECTIVES,
+  threads: list[int] | None = None,
+  repeat: int = 2,
+  save: bool = True,
+  directory: str | None = None,
+  max_states: int = DEFAULT_MAX_STATES
+):
+  """Runs a calibration matrix over representative audio and picks the fastest configuration of the model on this host.
+
+  Latency tries every `n_threads` over one transcription at a time and keeps the lowest real-time factor. Throughput splits the cores into `cores // n_threads` concurrent transcriptions, at most `max_states`, over the whisper states of a single model, and keeps the highest audio seconds per second.
+
+  Args:
+      model_params (ModelParams): The model to tune. Profiles apply to every model of the same size and tensor type (see `model_key`).
+      audio (Iterable[object]): Calibration clips, audio file paths or mono 16 kHz float32 PCM buffers, as long as the ones served in production. They are decoded once, before measuring.
+      params (SpeechToTextParams | None, optional): Transcription parameters as used in production, their n_threads is overridden. Defaults to greedy sampling.
+      objectives (Iterable[Objective], optional): Which profiles to tune. Defaults to both.
+      threads (list[int] | None, optional): `n_threads` values to try. Defaults to `candidate_threads`.
+      repeat (int, optional): Timed runs per configuration, the median is kept. Defaults to 2.
+      save (bool, optional): Stores the profiles, so models load them automatically. Defaults to True.
+      directory (str | None, optional): Where profiles are stored. Defaults to `default_profiles_dir`.
+      max_states (int, optional): Most concurrent transcriptions tried, each of them allocates a whisper state. Defaults to `DEFAULT_MAX_STATES`.
+
+  Returns:
+      dict[str, TuningProfile]: The best profile of each objective.
+  """
+  from .whispy import SpeechToTextParams
+  from .audio import load_audio
+  import statistics
+
+  objectives = list(objectives)
+  for objective in objectives:
+    if objective not in OBJECTIVES:
+      raise ValueError(f"Unknown tuning objective: {objective!r}")
+  if max_states < 1:
+    raise ValueError("max_states must be at least 1")
+
+  n_cores = host_info()["cores"]
+  threads = sorted(set(threads or candidate_threads(n_cores)))
+  topologies = sorted({(min(max_states, max(1, n_cores // n_threads)), n_threads) for n_threads in threads})
+
+  def trial_params():
+    trial = copy.copy(params if params is not None else SpeechToTextParams("greedy"))
+    trial._wfull_params_dict = dict(trial._wfull_params_dict)
+    return trial
+
+  model = _tuning_model(model_params, 1)
+  try:
+    clips = [pcm_f32_view(load_audio(model.dll(), clip) if isinstance(clip, str) else clip) for clip in audio]
+    if not clips:
+      raise ValueError("Tuning needs at least one calibration clip")
+    key = model_key(model.header)
+    latency = _calibrate_latency(model, clips, trial_params(), threads, repeat) if "latency" in objectives else None
+  finally:
+    model.destroy()
+  clip_seconds = statistics.median(len(clip) / PCM_SAMPLE_RATE for clip in clips)
+
+  profiles: dict[str, TuningProfile] = {}
+  for objective in objectives:
+    if objective == "latency":
+      measurements = latency
+      best = min(measurements, key=lambda measurement: measurement["score"]) # type: ignore
+    else:
+      measurements = _calibrate_throughput(model_params, clips, trial_params(), topologies, repeat)
+      best = max(measurements, key=lambda measurement: measurement["score"])
+
+    profile = profiles[objective] = TuningProfile(key, objective, best["n_threads"], best["workers"], clip_seconds, measurements) # type: ignore
+    if save:
+      save_profile(profile, directory)
+  return profiles
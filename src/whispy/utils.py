@@ -1,5 +1,6 @@
 from typing import TypedDict, Literal
 from os.path import join, dirname, exists
+from math import prod
 import ctypes
 
 from .whisper_bindings import *
@@ -20,12 +21,84 @@ def get_libwhispy_path():
 
 # Model selection 
 
-MODELS = {
-  "base": bytes(join(PACKAGE_ROOT, "models", "ggml-base.bin"), encoding="utf-8")
-}
-
 def fetch_model_path(name: str):
-  return MODELS.get(name)
+  """Resolves a model name or a local ggml path through the model registry (see `models.ModelRegistry`).
+
+  Returns:
+      bytes | None: The utf-8 encoded path of the model file, or None if it is not available.
+  """
+  from .models import registry
+  entry = registry.resolve(name)
+  return None if entry is None else bytes(entry.path, encoding="utf-8")
+
+
+# Audio input
+
+PCM_SAMPLE_RATE = 16000
+"""Sample rate whisper.cpp expects for every PCM buffer.
+"""
+
+PCM_F32_FORMATS = ("f", "<f", "=f")
+"""Buffer protocol format codes that describe native float32 items.
+"""
+
+def pcm_f32_view(samples: object):
+  """Returns a flat float32 `memoryview` over a buffer of PCM samples, without copying it.
+
+  Args:
+      samples (object): A C-contiguous buffer-protocol object of float32 items or untyped bytes.
+
+  Raises:
+      ValueError: If the buffer is not C-contiguous or its items are not float32.
+
+  Returns:
+      memoryview: A one dimensional view with format "f".
+  """
+  view = memoryview(samples) # type: ignore
+  if not view.c_contiguous:
+    raise ValueError("PCM samples must be C-contiguous")
+  if view.format not in PCM_F32_FORMATS and view.itemsize != 1:
+    raise ValueError(f"PCM samples must be float32, got '{view.format}'")
+  if view.nbytes % ctypes.sizeof(ctypes.c_float):
+    raise ValueError("PCM buffer size is not a multiple of float32 size")
+  return view.cast("B").cast("f")
+
+def as_pcm_f32(samples: object):
+  """Exposes mono 16 kHz float32 PCM samples as a C `float *` without copying them.
+
+  NumPy arrays are read through `__array_interface__`, so even read-only arrays are not copied. Any other buffer-protocol object (`memoryview`, `array.array("f")`, `bytearray`, `bytes`, ...) is read through `memoryview`; untyped byte buffers are reinterpreted as native float32 samples. Read-only buffers other than `bytes` are the only ones that need to be copied since ctypes cannot point to them.
+
+  Args:
+      samples (object): A C-contiguous buffer of float32 samples.
+
+  Raises:
+      ValueError: If the buffer is not C-contiguous or its items are not float32.
+
+  Returns:
+      tuple: A `ctypes.POINTER(ctypes.c_float)` to the first sample, the number of samples and the object that owns the memory, which must be kept alive while the pointer is in use.
+  """
+
+  interface = getattr(samples, "__array_interface__", None)
+  if interface is not None:
+    if interface["typestr"] not in ("<f4", "=f4"):
+      raise ValueError(f"PCM samples must be float32, got '{interface['typestr']}'")
+    if interface.get("strides") is not None:
+      raise ValueError("PCM samples must be C-contiguous")
+    pointer = ctypes.cast(interface["data"][0], ctypes.POINTER(ctypes.c_float))
+    return pointer, prod(interface["shape"]), samples
+
+  view = pcm_f32_view(samples)
+  n_samples = len(view)
+  if isinstance(samples, bytes):
+    # c_char_p points straight to the internal buffer of the bytes object.
+    pointer = ctypes.cast(ctypes.c_char_p(samples), ctypes.POINTER(ctypes.c_float))
+    return pointer, n_samples, samples
+  
+  if view.readonly:
+    buffer = (ctypes.c_float * n_samples).from_buffer_copy(view)
+  else:
+    buffer = (ctypes.c_float * n_samples).from_buffer(view)
+  return ctypes.cast(buffer, ctypes.POINTER(ctypes.c_float)), n_samples, buffer
 
 
 # Errors
@@ -38,6 +111,25 @@ class WhisperTextGenError(RuntimeError):
   def __init__(self, detail: str | None):
     super().__init__(f"Speech to text error: {detail}")
 
+class WhisperAbortedError(WhisperTextGenError):
+  """The transcription was aborted (e.g. its asyncio task was cancelled) before it finished.
+  """
+
+class WhisperTimeoutError(WhisperTextGenError, TimeoutError):
+  """The transcription ran out of its time budget. The backend stopped by itself, no native work is left running.
+  """
+
+  def __init__(self, detail: str | None, partial=None, timeout: float | None = None):
+    super().__init__(detail)
+    self.partial = partial
+    """`TranscriptResult` with the segments decoded before the budget ran out, or None if the transcription did not start.
+    """
+    self.timeout = timeout
+
+class WhisperAudioTooLongError(WhisperTextGenError):
+  """The audio is longer than the `max_audio_seconds` of the call.
+  """
+
 
 def format_tc_error(tc: whispy_transcript_context):
   """Provides format to messages related with backend errors.
@@ -67,7 +159,7 @@ class whisper_context_params_dict(TypedDict, total=False):
   use_gpu: bool | None
   flash_attn: bool | None
   gpu_device: int | None
-  dtw_token_timestampts: bool | None
+  dtw_token_timestamps: bool | None
   dtw_aheads_preset: int | None
   dtw_n_top: int | None
   dtw_aheads: whisper_aheads | None # TODO: Typed fabric functions for nested structs.
@@ -142,7 +234,7 @@ class whisper_full_params_dict(TypedDict, total=False):
   new_segment_callback: whisper_new_segment_callback | None# type: ignore
   new_segment_callback_user_data: ctypes.c_void_p | None
   progress_callback: whisper_progress_callback | None # type: ignore
-  profress_callback_user_data: ctypes.c_void_p | None
+  progress_callback_user_data: ctypes.c_void_p | None
   encoder_begin_callback: whisper_encoder_begin_callback | None # type: ignore
   encoder_begin_callback_user_data: ctypes.c_void_p | None
   abort_callback: ggml_abort_callback | None # type: ignore
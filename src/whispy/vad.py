@@ -0,0 +1,219 @@
+from typing import Callable, Sequence
+from array import array
+from bisect import bisect_right
+import math
+
+from .utils import PCM_SAMPLE_RATE, pcm_f32_view
+from .audio import FRAME_SIZE, frame_energies, frame_zero_crossings, np
+
+
+class SpeechRegion:
+  """A range of the audio that contains speech, in samples.
+  """
+
+  __slots__ = ("start", "end")
+
+  def __init__(self, start: int, end: int):
+    self.start = start
+    self.end = end
+
+  @property
+  def start_seconds(self):
+    return self.start / PCM_SAMPLE_RATE
+
+  @property
+  def end_seconds(self):
+    return self.end / PCM_SAMPLE_RATE
+
+  def __len__(self):
+    return self.end - self.start
+
+  def __eq__(self, other: object):
+    return isinstance(other, SpeechRegion) and (self.start, self.end) == (other.start, other.end)
+
+  def to_dict(self):
+    return dict(start=self.start, end=self.end)
+
+  def __repr__(self):
+    return f"SpeechRegion(start={self.start_seconds:.2f}s, end={self.end_seconds:.2f}s)"
+
+
+VoiceActivityDetector = Callable[[memoryview], Sequence[SpeechRegion | tuple[int, int]]]
+"""Any callable that receives a float32 view over 16 kHz PCM samples and returns the speech regions, either as `SpeechRegion`s or as (start, end) sample pairs.
+"""
+
+
+class EnergyVAD:
+  """Voice activity detector based on short-term energy and zero-crossing rate.
+
+  The energy threshold adapts to the noise floor of each recording: a frame is speech if its energy is `threshold_db` above the quietest frames, or if it is a bit quieter but has the high zero-crossing rate of unvoiced consonants. Speech frames are then merged into regions, short gaps are bridged and every region is padded, so words are not clipped. Analysis is vectorized with NumPy when it is available.
+  """
+
+  def __init__(
+    self,
+    threshold_db: float = 12.0,
+    min_energy: float = 1e-6,
+    zcr_threshold: float = 0.25,
+    min_speech_seconds: float = 0.25,
+    min_silence_seconds: float = 0.5,
+    padding_seconds: float = 0.2,
+    noise_percentile: float = 10.0
+  ):
+    """
+    Args:
+        threshold_db (float, optional): Energy above the noise floor that marks speech. Defaults to 12.0.
+        min_energy (float, optional): Absolute energy below which nothing is speech (digital silence). Defaults to 1e-6.
+        zcr_threshold (float, optional): Zero-crossing rate that marks unvoiced speech in frames slightly below the energy threshold. Defaults to 0.25.
+        min_speech_seconds (float, optional): Regions shorter than this are dropped. Defaults to 0.25.
+        min_silence_seconds (float, optional): Gaps shorter than this are bridged. Defaults to 0.5.
+        padding_seconds (float, optional): Audio kept on each side of every region. Defaults to 0.2.
+        noise_percentile (float, optional): Percentile of the frame energies used as the noise floor. Defaults to 10.0.
+    """
+    self.threshold_db = threshold_db
+    self.min_energy = min_energy
+    self.zcr_threshold = zcr_threshold
+    self.min_speech_seconds = min_speech_seconds
+    self.min_silence_seconds = min_silence_seconds
+    self.padding_seconds = padding_seconds
+    self.noise_percentile = noise_percentile
+
+  def _speech_frames(self, samples: memoryview) -> Sequence[bool]:
+    energies = frame_energies(samples)
+    rates = frame_zero_crossings(samples)
+    if not len(energies):
+      return []
+
+    ratio = 10 ** (self.threshold_db / 10)
+    if np is not None:
+      noise_floor = max(float(np.percentile(energies, self.noise_percentile)), self.min_energy)
+      threshold = noise_floor * ratio
+      voiced = energies > threshold
+      unvoiced = (energies > threshold / 4) & (rates > self.zcr_threshold)
+      return list(voiced | unvoiced)
+
+    ordered = sorted(energies)
+    noise_floor = max(ordered[int(len(ordered) * self.noise_percentile / 100)], self.min_energy)
+    threshold = noise_floor * ratio
+    return [
+      energy > threshold or (energy > threshold / 4 and rate > self.zcr_threshold)
+      for energy, rate in zip(energies, rates)
+    ]
+
+  def __call__(self, samples: memoryview):
+    """Finds the speech regions of the signal.
+
+    Args:
+        samples (memoryview): A float32 view over the PCM samples.
+
+    Returns:
+        list[SpeechRegion]: Sorted, non overlapping speech regions.
+    """
+    frames = self._speech_frames(samples)
+
+    regions: list[list[int]] = []
+    for i, is_speech in enumerate(frames):
+      if not is_speech:
+        continue
+      if regions and regions[-1][1] == i:
+        regions[-1][1] = i + 1
+      else:
+        regions.append([i, i + 1])
+
+    min_gap = math.ceil(self.min_silence_seconds * PCM_SAMPLE_RATE / FRAME_SIZE)
+    min_len = math.ceil(self.min_speech_seconds * PCM_SAMPLE_RATE / FRAME_SIZE)
+    padding = int(self.padding_seconds * PCM_SAMPLE_RATE)
+
+    merged: list[list[int]] = []
+    for region in regions:
+      if merged and region[0] - merged[-1][1] < min_gap:
+        merged[-1][1] = region[1]
+      else:
+        merged.append(region)
+
+    speech: list[SpeechRegion] = []
+    for start, end in merged:
+      if end - start < min_len:
+        continue
+      start = max(0, start * FRAME_SIZE - padding)
+      end = min(len(samples), end * FRAME_SIZE + padding)
+      if speech and start <= speech[-1].end:
+        speech[-1].end = end
+      else:
+        speech.append(SpeechRegion(start, end))
+    return speech
+
+
+class SpeechTimeline:
+  """Maps timestamps of the concatenated speech regions back to the original audio.
+  """
+
+  GAP_SECONDS = 0.1
+  """Silence placed between regions, so words of consecutive regions are not glued together.
+  """
+
+  def __init__(self, regions: Sequence[SpeechRegion]):
+    gap = int(self.GAP_SECONDS * PCM_SAMPLE_RATE)
+    self.regions = list(regions)
+    self._packed_starts: list[int] = []
+
+    position = 0
+    for region in self.regions:
+      self._packed_starts.append(position)
+      position += len(region) + gap
+
+  def pack(self, samples: object):
+    """Concatenates the speech regions of the signal, any buffer of float32 samples.
+
+    Returns:
+        array: Float32 samples with only the speech regions.
+    """
+    gap = array("f", bytes(4 * int(self.GAP_SECONDS * PCM_SAMPLE_RATE)))
+    packed = array("f")
+    samples = pcm_f32_view(samples)
+    for region in self.regions:
+      packed.frombytes(samples[region.start: region.end].cast("B"))
+      packed.extend(gap)
+    return packed
+
+  def to_original(self, t_cs: int):
+    """Converts a timestamp of the packed audio to the original one, both in centiseconds.
+    """
+    position = t_cs * PCM_SAMPLE_RATE // 100
+    i = max(0, bisect_right(self._packed_starts, position) - 1)
+    region = self.regions[i]
+    original = region.start + min(position - self._packed_starts[i], len(region))
+    return original * 100 // PCM_SAMPLE_RATE
+
+  def to_original_column(self, column: object):
+    """Converts a column of timestamps in place, e.g. of `TokenColumns`, with a single vectorized pass over NumPy columns. Negative timestamps mean unset and are kept.
+    """
+    if np is None or not isinstance(column, np.ndarray):
+      for i, t_cs in enumerate(column): # type: ignore
+        if t_cs >= 0:
+          column[i] = self.to_original(t_cs) # type: ignore
+      return
+
+    packed_starts = np.asarray(self._packed_starts, dtype=np.int64)
+    region_starts = np.fromiter((region.start for region in self.regions), dtype=np.int64, count=len(self.regions))
+    region_lengths = np.fromiter((len(region) for region in self.regions), dtype=np.int64, count=len(self.regions))
+
+    position = column.astype(np.int64) * PCM_SAMPLE_RATE // 100
+    i = np.maximum(np.searchsorted(packed_starts, position, side="right") - 1, 0)
+    original = region_starts[i] + np.minimum(position - packed_starts[i], region_lengths[i])
+    np.copyto(column, original * 100 // PCM_SAMPLE_RATE, where=column >= 0, casting="unsafe")
+
+
+def detect_speech(vad: VoiceActivityDetector, samples: memoryview):
+  """Runs a voice activity detector and normalizes its output.
+
+  Returns:
+      list[SpeechRegion]: Sorted speech regions within the bounds of the signal.
+  """
+  regions = [
+    region if isinstance(region, SpeechRegion) else SpeechRegion(*region)
+    for region in vad(samples)
+  ]
+  return sorted(
+    (SpeechRegion(max(0, region.start), min(len(samples), region.end)) for region in regions if region.end > region.start),
+    key=lambda region: region.start
+  )
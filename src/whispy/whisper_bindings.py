@@ -1,8 +1,43 @@
+from enum import IntEnum
 import ctypes
 
 
 # User-defined types
 
+class whispy_tc_state(IntEnum):
+  """Mirrors the `whispy_tc_state` enum of the backend.
+  """
+
+  OK = 0
+  LOADMODEL_ERROR = 1
+  LOADSPEECH_ERROR = 2
+  MEMALLOC_ERROR = 3
+  INVWHISCTX_ERROR = 4
+  SPEECHGEN_ERROR = 5
+  FREEDCTX_ERROR = 6
+  TIMEOUT_ERROR = 7
+  AUDIOLEN_ERROR = 8
+
+class whisper_alignment_heads_preset(IntEnum):
+  """Mirrors the `whisper_alignment_heads_preset` enum of whisper.cpp: the cross-attention heads DTW token timestamps are computed from.
+  """
+
+  NONE = 0
+  N_TOP_MOST = 1
+  CUSTOM = 2
+  TINY_EN = 3
+  TINY = 4
+  BASE_EN = 5
+  BASE = 6
+  SMALL_EN = 7
+  SMALL = 8
+  MEDIUM_EN = 9
+  MEDIUM = 10
+  LARGE_V1 = 11
+  LARGE_V2 = 12
+  LARGE_V3 = 13
+  LARGE_V3_TURBO = 14
+
 class nullptr:
   """Emulates C/C++ null pointers.
   """
@@ -10,11 +45,52 @@ class nullptr:
   def __init__(self):
     _as_parameter_ = 0
 
+class whispy_timings(ctypes.Structure):
+  """Mirrors the `whispy_timings` struct of the backend. Float timings are negative when unavailable.
+  """
+  _fields_ = [
+    ("load_ms", ctypes.c_double),
+    ("mel_ms", ctypes.c_double),
+    ("inference_ms", ctypes.c_double),
+    ("n_windows", ctypes.c_int32),
+    ("encode_ms", ctypes.c_float),
+    ("decode_ms", ctypes.c_float),
+    ("sample_ms", ctypes.c_float),
+    ("batchd_ms", ctypes.c_float),
+    ("prompt_ms", ctypes.c_float)
+  ]
+
+class whispy_limits(ctypes.Structure):
+  """Mirrors the `whispy_limits` struct of the backend. Zero disables a limit.
+  """
+  _fields_ = [
+    ("timeout_ms", ctypes.c_double),
+    ("max_audio_ms", ctypes.c_double),
+    ("abort_flag", ctypes.POINTER(ctypes.c_int32))
+  ]
+
 class whispy_transcript_context(ctypes.Structure):
   _fields_ = [
     ("last_error_code", ctypes.c_uint8),
     ("last_error_message", ctypes.c_char_p),
-    ("model_context", ctypes.c_void_p)
+    ("model_context", ctypes.c_void_p),
+    ("model_state", ctypes.c_void_p),
+    ("timings", whispy_timings),
+    ("limits", whispy_limits)
+  ]
+
+class whispy_token_columns(ctypes.Structure):
+  """Mirrors the `whispy_token_columns` struct of the backend. Null columns are skipped.
+  """
+  _fields_ = [
+    ("segment", ctypes.POINTER(ctypes.c_int32)),
+    ("id", ctypes.POINTER(ctypes.c_int32)),
+    ("p", ctypes.POINTER(ctypes.c_float)),
+    ("plog", ctypes.POINTER(ctypes.c_float)),
+    ("t0", ctypes.POINTER(ctypes.c_int64)),
+    ("t1", ctypes.POINTER(ctypes.c_int64)),
+    ("t_dtw", ctypes.POINTER(ctypes.c_int64)),
+    ("vlen", ctypes.POINTER(ctypes.c_float))
   ]
 
 class whisper_ahead(ctypes.Structure):
@@ -73,6 +149,17 @@ ggml_abort_callback = ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_void_p)
 
 whisper_logits_filter_callback = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(whisper_token_data), ctypes.c_int, ctypes.POINTER(ctypes.c_float), ctypes.c_void_p)
 
+class whisper_greedy_params(ctypes.Structure):
+  _fields_ = [
+    ("best_of", ctypes.c_int)
+  ]
+
+class whisper_beam_search_params(ctypes.Structure):
+  _fields_ = [
+    ("beam_size", ctypes.c_int),
+    ("patience", ctypes.c_float)
+  ]
+
 class whisper_full_params(ctypes.Structure):
   _fields_ = [
     ("strategy", ctypes.c_int),
@@ -125,11 +212,14 @@ class whisper_full_params(ctypes.Structure):
     ("logprob_thold", ctypes.c_float),
     ("no_speech_thold", ctypes.c_float),
 
+    ("greedy", whisper_greedy_params),
+    ("beam_search", whisper_beam_search_params),
+
     ("new_segment_callback", whisper_new_segment_callback),
     ("new_segment_callback_user_data", ctypes.c_void_p),
 
     ("progress_callback", whisper_progress_callback),
-    ("new_segment_callback_user_data", ctypes.c_void_p),
+    ("progress_callback_user_data", ctypes.c_void_p),
 
     ("encoder_begin_callback", whisper_encoder_begin_callback),
     ("encoder_begin_callback_user_data", ctypes.c_void_p),
@@ -147,18 +237,85 @@ class whisper_full_params(ctypes.Structure):
   ]
 
 
+class whispy_segment(ctypes.Structure):
+  _fields_ = [
+    ("t0", ctypes.c_int64),
+    ("t1", ctypes.c_int64),
+    ("no_speech_prob", ctypes.c_float),
+    ("text_offset", ctypes.c_uint32),
+    ("text_size", ctypes.c_uint32)
+  ]
+
+# The text is received as a raw address, so it can be viewed without being copied.
+whispy_segment_batch_callback = ctypes.CFUNCTYPE(None, ctypes.POINTER(whispy_segment), ctypes.c_int, ctypes.c_void_p, ctypes.c_uint64, ctypes.c_void_p)
+
+
 # Library prototyping
 
 def bind_c_api(dll: ctypes.CDLL):
     dll.whispy_tc_make.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.c_char_p, whisper_context_params]
     dll.whispy_tc_make.restype = ctypes.c_int
 
+    dll.whispy_tc_make_shared.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.c_char_p, whisper_context_params]
+    dll.whispy_tc_make_shared.restype = ctypes.c_int
+
+    dll.whispy_tc_make_state.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.POINTER(whispy_transcript_context)]
+    dll.whispy_tc_make_state.restype = ctypes.c_int
+
+    dll.whispy_tc_reset.argtypes = [ctypes.POINTER(whispy_transcript_context)]
+    dll.whispy_tc_reset.restype = ctypes.c_int
+
     dll.whispy_tc_free.argtypes = [ctypes.POINTER(whispy_transcript_context)]
     dll.whispy_tc_free.restype = None
 
     dll.whispy_speech_to_text.argtypes = [ctypes.c_char_p, ctypes.c_uint64, ctypes.POINTER(whispy_transcript_context), ctypes.c_char_p, whisper_full_params]
     dll.whispy_speech_to_text.restype = ctypes.c_int
 
+    dll.whispy_speech_to_text_pcm.argtypes = [ctypes.c_char_p, ctypes.c_uint64, ctypes.POINTER(whispy_transcript_context), ctypes.POINTER(ctypes.c_float), ctypes.c_uint64, whisper_full_params]
+    dll.whispy_speech_to_text_pcm.restype = ctypes.c_int
+
+    dll.whispy_transcribe.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.c_char_p, whisper_full_params]
+    dll.whispy_transcribe.restype = ctypes.c_int
+
+    dll.whispy_transcribe_pcm.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.POINTER(ctypes.c_float), ctypes.c_uint64, whisper_full_params]
+    dll.whispy_transcribe_pcm.restype = ctypes.c_int
+
+    dll.whispy_count_tokens.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.c_bool]
+    dll.whispy_count_tokens.restype = ctypes.c_uint64
+
+    dll.whispy_fill_tokens.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.c_bool, ctypes.POINTER(whispy_token_columns), ctypes.c_uint64]
+    dll.whispy_fill_tokens.restype = ctypes.c_uint64
+
+    dll.whispy_detect_language_pcm.argtypes = [ctypes.POINTER(whispy_transcript_context), ctypes.POINTER(ctypes.c_float), ctypes.c_uint64, ctypes.c_int, ctypes.POINTER(ctypes.c_float)]
+    dll.whispy_detect_language_pcm.restype = ctypes.c_int
+
+    dll.whispy_decoder_open.argtypes = [ctypes.c_char_p, ctypes.c_uint64, ctypes.c_char_p, ctypes.c_uint64]
+    dll.whispy_decoder_open.restype = ctypes.c_void_p
+
+    dll.whispy_decoder_read.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_float), ctypes.c_uint64]
+    dll.whispy_decoder_read.restype = ctypes.c_int64
+
+    dll.whispy_decoder_duration_ms.argtypes = [ctypes.c_void_p]
+    dll.whispy_decoder_duration_ms.restype = ctypes.c_int64
+
+    dll.whispy_decoder_error.argtypes = [ctypes.c_void_p]
+    dll.whispy_decoder_error.restype = ctypes.c_char_p
+
+    dll.whispy_decoder_close.argtypes = [ctypes.c_void_p]
+    dll.whispy_decoder_close.restype = None
+
+    dll.whispy_batcher_make.argtypes = [ctypes.c_int, ctypes.c_int, whispy_segment_batch_callback, ctypes.c_void_p]
+    dll.whispy_batcher_make.restype = ctypes.c_void_p
+
+    dll.whispy_batcher_install.argtypes = [ctypes.c_void_p, ctypes.POINTER(whisper_full_params)]
+    dll.whispy_batcher_install.restype = None
+
+    dll.whispy_batcher_flush.argtypes = [ctypes.c_void_p]
+    dll.whispy_batcher_flush.restype = None
+
+    dll.whispy_batcher_free.argtypes = [ctypes.c_void_p]
+    dll.whispy_batcher_free.restype = None
+
     # whisper.cpp
 
     ## params
@@ -173,4 +330,52 @@ def bind_c_api(dll: ctypes.CDLL):
     dll.whisper_full_n_segments.restype = ctypes.c_int
 
     dll.whisper_full_get_segment_text.argtypes = [ctypes.c_void_p, ctypes.c_int]
-    dll.whisper_full_get_segment_text.restype = ctypes.c_char_p
\ No newline at end of file
+    dll.whisper_full_get_segment_text.restype = ctypes.c_char_p
+
+    dll.whisper_full_get_segment_t0.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_t0.restype = ctypes.c_int64
+
+    dll.whisper_full_get_segment_t1.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_t1.restype = ctypes.c_int64
+
+    dll.whisper_full_get_segment_no_speech_prob.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_no_speech_prob.restype = ctypes.c_float
+
+    ## segments (whisper_state)
+    dll.whisper_full_n_segments_from_state.argtypes = [ctypes.c_void_p]
+    dll.whisper_full_n_segments_from_state.restype = ctypes.c_int
+
+    dll.whisper_full_get_segment_text_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_text_from_state.restype = ctypes.c_char_p
+
+    dll.whisper_full_get_segment_t0_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_t0_from_state.restype = ctypes.c_int64
+
+    dll.whisper_full_get_segment_t1_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_t1_from_state.restype = ctypes.c_int64
+
+    dll.whisper_full_get_segment_no_speech_prob_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    dll.whisper_full_get_segment_no_speech_prob_from_state.restype = ctypes.c_float
+
+    dll.whisper_full_lang_id_from_state.argtypes = [ctypes.c_void_p]
+    dll.whisper_full_lang_id_from_state.restype = ctypes.c_int
+
+    ## vocabulary
+    dll.whisper_n_vocab.argtypes = [ctypes.c_void_p]
+    dll.whisper_n_vocab.restype = ctypes.c_int
+
+    dll.whisper_token_to_str.argtypes = [ctypes.c_void_p, ctypes.c_int32]
+    dll.whisper_token_to_str.restype = ctypes.c_char_p
+
+    ## language
+    dll.whisper_full_lang_id.argtypes = [ctypes.c_void_p]
+    dll.whisper_full_lang_id.restype = ctypes.c_int
+
+    dll.whisper_lang_str.argtypes = [ctypes.c_int]
+    dll.whisper_lang_str.restype = ctypes.c_char_p
+
+    dll.whisper_lang_max_id.argtypes = []
+    dll.whisper_lang_max_id.restype = ctypes.c_int
+
+    dll.whisper_is_multilingual.argtypes = [ctypes.c_void_p]
+    dll.whisper_is_multilingual.restype = ctypes.c_int
\ No newline at end of file
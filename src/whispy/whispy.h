@@ -37,18 +37,148 @@ enum class whispy_tc_state
   /**
    * The transcript context was intentionally freed. 
    */
-  FREEDCTX_ERROR
+  FREEDCTX_ERROR,
+
+  /**
+   * The transcription ran out of its time budget (see whispy_limits::timeout_ms). The segments decoded until then are kept.
+   */
+  TIMEOUT_ERROR,
+
+  /**
+   * The audio is longer than allowed (see whispy_limits::max_audio_ms).
+   */
+  AUDIOLEN_ERROR
 };
 
-extern constexpr const std::size_t tc_message_size = 1024; // 1 KiB
+inline constexpr std::size_t tc_message_size = 1024; // 1 KiB (inline, since several translation units include it)
+
+/**
+ * Timings of the last transcription of a transcript context, in milliseconds.
+ */
+struct whispy_timings
+{
+  /**
+   * Reading a raw PCM file (whispy_transcribe only).
+   */
+  double load_ms = 0;
+
+  /**
+   * From the start of whisper_full until the first encoder run, which is mostly the log-mel spectrogram computation.
+   */
+  double mel_ms = 0;
+
+  /**
+   * The whole whisper_full call.
+   */
+  double inference_ms = 0;
+
+  /**
+   * Encoder runs, one per 30 seconds window.
+   */
+  std::int32_t n_windows = 0;
+
+  /**
+   * Time spent encoding windows (from encoder_begin_callback until the decoder first filters logits, so it includes the prompt) and decoding them (the rest of every window), measured by whispy itself. Negative if no window was encoded.
+   */
+  float encode_ms = -1;
+  float decode_ms = -1;
+
+  /**
+   * whisper.cpp internal timings (whisper_get_timings). They are only kept by whisper contexts that own their state, so they are negative for transcript contexts created by whispy_tc_make_state, the ones WhispyModel transcribes with.
+   */
+  float sample_ms = -1;
+  float batchd_ms = -1;
+  float prompt_ms = -1;
+};
+
+/**
+ * Limits enforced natively on the next transcriptions of a transcript context. Zero disables a limit.
+ */
+struct whispy_limits
+{
+  /**
+   * Time budget of whisper_full, in milliseconds. It is checked before every encoder window (encoder_begin_callback) and between graph computations (abort_callback), so native work stops shortly after it runs out.
+   */
+  double timeout_ms = 0;
+
+  /**
+   * Longest audio accepted, in milliseconds.
+   */
+  double max_audio_ms = 0;
+
+  /**
+   * Optional flag owned by the caller, who may set it to nonzero from any thread to stop the transcription. It is read natively at the same points as the time budget, so polling it never calls back into the caller. It must outlive the transcription.
+   */
+  int32_t *abort_flag = nullptr;
+};
 
 struct whispy_transcript_context
 {
   whispy_tc_state last_error_code = whispy_tc_state::OK;
   char *last_error_message = nullptr;
   whisper_context *model_context = nullptr;
+
+  /**
+   * Only set for transcript contexts created by whispy_tc_make_state. They borrow model_context from a shared transcript context and run whisper_full_with_state over their own whisper_state.
+   */
+  whisper_state *model_state = nullptr;
+
+  /**
+   * Filled by every transcription.
+   */
+  whispy_timings timings{};
+
+  /**
+   * Set by the caller before every transcription.
+   */
+  whispy_limits limits{};
 };
 
+/**
+ * Destination columns of whispy_fill_tokens, one array per field of whisper_token_data. Any column may be null to skip it.
+ */
+struct whispy_token_columns
+{
+  /**
+   * Index of the segment each token belongs to.
+   */
+  std::int32_t *segment = nullptr;
+  std::int32_t *id = nullptr;
+  float *p = nullptr;
+  float *plog = nullptr;
+  std::int64_t *t0 = nullptr;
+  std::int64_t *t1 = nullptr;
+  std::int64_t *t_dtw = nullptr;
+  float *vlen = nullptr;
+};
+
+/**
+ * Streaming audio decoder (see whispy_decoder_open). Its definition is private to the backend.
+ */
+struct whispy_audio_decoder;
+
+/**
+ * A segment delivered by a whispy_segment_batcher. Its text lives in the text buffer of the batch.
+ */
+struct whispy_segment
+{
+  std::int64_t t0;
+  std::int64_t t1;
+  float no_speech_prob;
+  std::uint32_t text_offset;
+  std::uint32_t text_size;
+};
+
+/**
+ * Receives a batch of segments. segments and text are only valid during the call.
+ */
+typedef void (*whispy_segment_batch_callback)(const whispy_segment *segments, int n_segments, const char *text, std::uint64_t text_size, void *user_data);
+
+/**
+ * Accumulates new segments natively and delivers them in batches (see whispy_batcher_make). Its definition is private to the backend.
+ */
+struct whispy_segment_batcher;
+
 extern "C"
 {
   /**
@@ -58,6 +188,27 @@ extern "C"
    */
   whispy_tc_state whispy_tc_make(whispy_transcript_context *tc, const char *model_path, whisper_context_params cparams);
 
+  /**
+   * Initializes a whispy_transcript_context that only holds the model weights (no whisper_state), so they can be shared by several states.
+   * @param tc A pointer to the whispy_transcript_context.
+   * @param model_path A file system path that points to the model path.
+   */
+  whispy_tc_state whispy_tc_make_shared(whispy_transcript_context *tc, const char *model_path, whisper_context_params cparams);
+
+  /**
+   * Initializes a whispy_transcript_context with its own whisper_state over the weights of a shared transcript context.
+   * @param tc A pointer to the whispy_transcript_context to initialize.
+   * @param shared A transcript context initialized with whispy_tc_make_shared. It must outlive tc.
+   */
+  whispy_tc_state whispy_tc_make_state(whispy_transcript_context *tc, const whispy_transcript_context *shared);
+
+  /**
+   * Clears a recoverable error (LOADSPEECH_ERROR, SPEECHGEN_ERROR, TIMEOUT_ERROR or AUDIOLEN_ERROR) so the transcript context can be used again.
+   * @param tc A pointer to the whispy_transcript_context.
+   * @returns The state of the transcript context after the reset.
+   */
+  whispy_tc_state whispy_tc_reset(whispy_transcript_context *tc);
+
   /**
    * Frees the resources associated with a whispy_transcript_context.
    */
@@ -70,4 +221,113 @@ extern "C"
    * @param speech_path A file system path that points to the audio to transcribe.
    */
   whispy_tc_state whispy_speech_to_text(char *text, std::size_t text_size, whispy_transcript_context *tc, const char *speech_path, whisper_full_params wparams);
+
+  /**
+   * @param text A writable C-Style array of characters.
+   * @param text_size The ammount of bytes that can be writen in text.
+   * @param tc The transcript context on which to work.
+   * @param samples Mono 16 kHz float32 PCM samples owned by the caller. They are passed to whisper.cpp without being copied.
+   * @param n_samples The number of samples in samples.
+   */
+  whispy_tc_state whispy_speech_to_text_pcm(char *text, std::size_t text_size, whispy_transcript_context *tc, const float *samples, std::size_t n_samples, whisper_full_params wparams);
+
+  /**
+   * Runs whisper_full over an audio file and leaves the segments within the model context, so they can be read with the whisper_full_get_segment_* family.
+   * @param tc The transcript context on which to work.
+   * @param speech_path A file system path that points to the audio to transcribe.
+   */
+  whispy_tc_state whispy_transcribe(whispy_transcript_context *tc, const char *speech_path, whisper_full_params wparams);
+
+  /**
+   * Same as whispy_transcribe but with PCM samples that are already in memory.
+   * @param tc The transcript context on which to work.
+   * @param samples Mono 16 kHz float32 PCM samples owned by the caller.
+   * @param n_samples The number of samples in samples.
+   */
+  whispy_tc_state whispy_transcribe_pcm(whispy_transcript_context *tc, const float *samples, std::size_t n_samples, whisper_full_params wparams);
+
+  /**
+   * Counts the tokens produced by the last transcription of a transcript context.
+   * @param tc The transcript context that ran the transcription.
+   * @param include_special Whether special tokens (start of transcript, timestamps...) are counted.
+   */
+  std::size_t whispy_count_tokens(const whispy_transcript_context *tc, bool include_special);
+
+  /**
+   * Copies the token data of the last transcription of a transcript context into columns, in bulk.
+   * @param tc The transcript context that ran the transcription.
+   * @param include_special Whether special tokens (start of transcript, timestamps...) are copied.
+   * @param columns The destination arrays, each one with room for capacity values.
+   * @param capacity Maximum number of tokens to copy, usually whispy_count_tokens().
+   * @returns The number of tokens copied.
+   */
+  std::size_t whispy_fill_tokens(const whispy_transcript_context *tc, bool include_special, const whispy_token_columns *columns, std::size_t capacity);
+
+  /**
+   * Detects the spoken language of PCM samples without transcribing them: computes their log-mel spectrogram and runs the encoder and a single decoder step over the first window.
+   * @param tc The transcript context on which to work.
+   * @param samples Mono 16 kHz float32 PCM samples owned by the caller. Only the first 30 seconds are relevant.
+   * @param n_samples The number of samples in samples.
+   * @param n_threads Threads used to compute the spectrogram and run the model.
+   * @param lang_probs Receives the probability of every language, indexed by language id. It must hold whisper_lang_max_id() + 1 floats.
+   */
+  whispy_tc_state whispy_detect_language_pcm(whispy_transcript_context *tc, const float *samples, std::size_t n_samples, int n_threads, float *lang_probs);
+
+  /**
+   * Opens an audio file for streaming decoding into mono 16 kHz float32 PCM. Packets are decoded and resampled on demand into a fixed-size ring buffer, so memory does not depend on the length of the file.
+   * @param speech_path A file system path that points to the audio (wav, flac, mp3, ogg...).
+   * @param ring_capacity Samples the ring buffer can hold.
+   * @param error A writable C-Style array of characters for the error message. May be nullptr.
+   * @param error_size The ammount of bytes that can be writen in error.
+   * @returns The decoder, or nullptr on failure.
+   */
+  whispy_audio_decoder *whispy_decoder_open(const char *speech_path, std::size_t ring_capacity, char *error, std::size_t error_size);
+
+  /**
+   * @param dec A decoder opened with whispy_decoder_open.
+   * @param samples A writable array of floats.
+   * @param max_samples The ammount of samples that can be writen in samples.
+   * @returns The number of samples written, 0 at the end of the audio or -1 on failure.
+   */
+  std::int64_t whispy_decoder_read(whispy_audio_decoder *dec, float *samples, std::size_t max_samples);
+
+  /**
+   * @returns The estimated duration of the audio in milliseconds, or -1 if unknown.
+   */
+  std::int64_t whispy_decoder_duration_ms(const whispy_audio_decoder *dec);
+
+  /**
+   * @returns The message of the last error of the decoder.
+   */
+  const char *whispy_decoder_error(const whispy_audio_decoder *dec);
+
+  /**
+   * Frees the resources associated with a decoder.
+   */
+  void whispy_decoder_close(whispy_audio_decoder *dec);
+
+  /**
+   * Creates a segment batcher. A batch is delivered once it holds every_n segments or every_ms milliseconds passed since the last delivery, whatever happens first.
+   * @param every_n Segments per batch, 0 to disable the limit.
+   * @param every_ms Maximum milliseconds between deliveries, 0 to disable the limit.
+   * @param callback The receiver of the batches.
+   * @param user_data Passed to callback as is.
+   * @returns The batcher, or nullptr on failure.
+   */
+  whispy_segment_batcher *whispy_batcher_make(int every_n, int every_ms, whispy_segment_batch_callback callback, void *user_data);
+
+  /**
+   * Wires the batcher to the new_segment_callback of a whisper_full_params struct. A batcher serves a single transcription at a time.
+   */
+  void whispy_batcher_install(whispy_segment_batcher *batcher, whisper_full_params *wparams);
+
+  /**
+   * Delivers the pending segments, if any. Call it once the transcription finished.
+   */
+  void whispy_batcher_flush(whispy_segment_batcher *batcher);
+
+  /**
+   * Frees the resources associated with a batcher. Pending segments are dropped.
+   */
+  void whispy_batcher_free(whispy_segment_batcher *batcher);
 }
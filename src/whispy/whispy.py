@@ -1,12 +1,55 @@
-from typing import Literal, Callable
-from functools import wraps
+from typing import Literal, Callable, Iterable
+from functools import wraps, partial
+import threading
 import ctypes 
+import time
+import os
 
 from .whisper_bindings import *
 from .utils import *
+from .results import TOKEN_FIELDS, TranscriptSegment, TranscriptResult, TokenOutputSpec, TokenColumns
+from .state_pool import WhisperStatePool
+from .abort import AbortFlag, CallBudget
+from .streaming import StreamingSession, StreamingUpdate
+from .long_audio import transcribe_long
+from .audio import RAW_PCM_EXTENSION, load_audio, load_audio_head, audio_duration, iter_audio_blocks, prefetch
+from .vad import VoiceActivityDetector, SpeechTimeline, detect_speech
+from .pcm_cache import PCMCache
+from .result_cache import ResultCache, canonical_params, model_identity, hash_audio
+from .segment_batch import SegmentBatchSpec, SegmentBatcher
+from .metrics import Timings, record_transcription, get_sink as get_metrics_sink
+from .models import ModelHeader, verify_checksum, registry as model_registry
+from .tuning import tuned_threads
 
 
 lib_loader = LibWhispy()
+"""The backend library, loaded on first use (see `preload`).
+"""
+
+WARMUP_SECONDS = 1.0
+"""Length of the silent clip decoded by `WhispyModel.warmup`. whisper.cpp pads every input to a 30 seconds window, so the encoder does its full amount of work anyway.
+"""
+
+WARMUP_MAX_TOKENS = 4
+"""Tokens the decoder may generate while warming up, enough to run every decoding step at least once.
+"""
+
+LANGUAGE_WINDOW_SECONDS = 30.0
+"""Audio whisper.cpp looks at to detect the language: the encoder window. Anything after it is neither decoded nor analyzed.
+"""
+
+def preload():
+  """Loads and binds the backend library now instead of on first use, e.g. while a server starts.
+
+  Raises:
+      WhisperInitError: If the library could not be loaded.
+
+  Returns:
+      ctypes.CDLL: The backend shared library.
+  """
+  if not lib_loader:
+    raise WhisperInitError(lib_loader.loading_error)
+  return lib_loader.dll()
 
 class ModelParams:
   """Instructs whispy how to initialize a model.
@@ -16,12 +59,28 @@ class ModelParams:
 
   def __init__(
     self,
-    model_name: Literal["base"], # Maybe TODO: Add more models
+    model_name: str,
     use_gpu: bool | None = None,
-    flash_attn: bool | None = None
+    flash_attn: bool | None = None,
+    n_states: int = 1,
+    pcm_cache: PCMCache | None = None,
+    result_cache: ResultCache | None = None,
+    checksum: str | None = None,
+    use_profile: bool = True
   ):
+    """
+    Args:
+        model_name (str): One of `models.MODEL_VARIANTS` (tiny, base, small, medium, large-v3...), a name registered in `models.registry` or the path of a local ggml model file.
+        checksum (str | None, optional): Expected SHA-256 digest of the model file. Overrides the one found in the registry or in a `<model file>.sha256` file.
+        use_profile (bool, optional): Applies the profile stored by `whispy tune` for this host, if any, wherever `n_threads`, `workers` or `threads_per_worker` are left unset. Defaults to True.
+    """
     self._whispy_params = dict(
-      model_name=model_name 
+      model_name=model_name,
+      checksum=checksum,
+      n_states=n_states,
+      pcm_cache=pcm_cache,
+      result_cache=result_cache,
+      use_profile=use_profile
     )
     self._whisper_context_params_dict = whisper_context_params_dict(
         use_gpu=use_gpu,
@@ -44,10 +103,40 @@ class ModelParams:
     )
     return cparams
   
-  def model_name(self, new_value: Literal["base"]):
+  def model_name(self, new_value: str):
     self._whispy_params["model_name"] = new_value
     return self
 
+  def checksum(self, new_value: str | None):
+    """Sets the expected SHA-256 digest of the model file.
+    """
+    self._whispy_params["checksum"] = new_value
+    return self
+
+  def n_states(self, new_value: int):
+    """Sets how many whisper states (and so, concurrent transcriptions) can share the model weights.
+    """
+    self._whispy_params["n_states"] = new_value
+    return self
+
+  def pcm_cache(self, new_value: PCMCache | None):
+    """Sets an on-disk cache of decoded PCM, so compressed inputs are only decoded once.
+    """
+    self._whispy_params["pcm_cache"] = new_value
+    return self
+
+  def result_cache(self, new_value: ResultCache | None):
+    """Sets a persistent cache of transcription results, so repeated requests for the same audio and parameters skip inference.
+    """
+    self._whispy_params["result_cache"] = new_value
+    return self
+
+  def use_profile(self, new_value: bool):
+    """Sets whether the tuning profile of this host is applied (see `tuning.tune`).
+    """
+    self._whispy_params["use_profile"] = new_value
+    return self
+
   def use_gpu(self, new_value: bool):
     self._whisper_context_params_dict["use_gpu"] = new_value
     return self
@@ -55,6 +144,26 @@ class ModelParams:
   def flash_attn(self, new_value: bool):
     self._whisper_context_params_dict["flash_attn"] = new_value
     return self
+
+  def dtw(
+    self,
+    preset: Literal["auto"] | whisper_alignment_heads_preset | None = "auto",
+    n_top: int | None = None,
+    mem_size: int | None = None
+  ):
+    """Enables DTW token timestamps (`t_dtw`, see `SpeechToTextParams.token_output`). whisper.cpp turns them off when `flash_attn` is enabled.
+
+    Args:
+        preset: The alignment heads to use. "auto" picks the ones of the model (see `ModelHeader.alignment_heads`). None disables DTW.
+        n_top (int | None, optional): Text layers used with `whisper_alignment_heads_preset.N_TOP_MOST`.
+        mem_size (int | None, optional): Bytes reserved for the DTW computation. Defaults to whisper.cpp's.
+    """
+    self._whispy_params["dtw"] = preset
+    self._whisper_context_params_dict["dtw_token_timestamps"] = preset is not None
+    self._whisper_context_params_dict["dtw_aheads_preset"] = int(preset) if preset not in (None, "auto") else None # type: ignore
+    self._whisper_context_params_dict["dtw_n_top"] = n_top
+    self._whisper_context_params_dict["dtw_mem_size"] = mem_size
+    return self
   
 
 class SpeechToTextParams:
@@ -79,6 +188,7 @@ class SpeechToTextParams:
     temperature: float | None = None,
     new_segment_callback: Callable[[str], None] | None = None,
     progress_callback: Callable[[int], None] | None = None,
+    vad: VoiceActivityDetector | None = None,
   ):
     @SpeechToTextParams._nscallback
     def nscallback(segment: str):
@@ -91,7 +201,10 @@ class SpeechToTextParams:
         progress_callback(progress)
 
     self._whispy_params = dict(
-      sampling_strategy=sampling_strategy 
+      sampling_strategy=sampling_strategy,
+      vad=vad,
+      segment_batch=None,
+      tokens=None
     )
 
     self._wfull_params_dict = whisper_full_params_dict(
@@ -125,15 +238,15 @@ class SpeechToTextParams:
     Backend library calls within `WhispyModel` are wrapped with meaningful exception messages.
     """
     @wraps(func)
-    def wrapper(ctx: ctypes.c_void_p, state: ctypes.c_void_p, n_new: ctypes.c_int, user_data: ctypes.c_void_p):
+    def wrapper(ctx: ctypes.c_void_p, state: ctypes.c_void_p, n_new: int, user_data: ctypes.c_void_p):
       lib = lib_loader.dll()
-      segments = b""
 
-      n_segments: int = lib.whisper_full_n_segments(ctx).value
-      seg_idx = n_segments - n_new.value
-      while seg_idx < n_segments:
-        segments += lib.whisper_full_get_segment_text(ctx, state, seg_idx)
-        seg_idx += 1
+      # Models transcribe over their own whisper states, so segments are read from the state and not from the context.
+      n_segments: int = lib.whisper_full_n_segments_from_state(state)
+      segments = b"".join(
+        lib.whisper_full_get_segment_text_from_state(state, seg_idx)
+        for seg_idx in range(n_segments - n_new, n_segments)
+      )
 
       func(str(segments, encoding="utf-8"))
 
@@ -142,10 +255,20 @@ class SpeechToTextParams:
   @classmethod
   def _prcallback(cls, func: Callable[[int], None]):
     @wraps(func)
-    def wrapper(ctx: ctypes.c_void_p, state: ctypes.c_void_p, progress: ctypes.c_int, user_data: ctypes.c_void_p):
-      func(progress.value)
+    def wrapper(ctx: ctypes.c_void_p, state: ctypes.c_void_p, progress: int, user_data: ctypes.c_void_p):
+      func(progress)
     return wrapper
 
+  def __getstate__(self):
+    """Callbacks cannot be sent to other processes, so they are left behind when the parameters are pickled.
+    """
+    state = self.__dict__.copy()
+    state["_wfull_params_dict"] = whisper_full_params_dict(**{
+      key: value for key, value in self._wfull_params_dict.items() if "_callback" not in key
+    })
+    state["_whispy_params"] = dict(self._whispy_params, segment_batch=None)
+    return state
+
   def _get_whispy_parms(self):
     return self._whispy_params
 
@@ -177,6 +300,69 @@ class SpeechToTextParams:
     self._wfull_params_dict["new_segment_callback"] = nscallback
     return self
 
+  def segment_batch_callback(
+    self,
+    func: Callable[[list[TranscriptSegment]], None] | None,
+    every_n: int = 16,
+    every_ms: int = 1000,
+    zero_copy: bool = False
+  ):
+    """Registers a callback that receives new segments in batches, accumulated by the backend, instead of one call per segment. It replaces `new_segment_callback`.
+
+    A batch is delivered once it holds `every_n` segments or `every_ms` milliseconds passed since the last one, whatever happens first, and the rest when the transcription finishes.
+
+    Args:
+        func: Receives a list of `TranscriptSegment`. With `zero_copy`, it receives a ctypes array of `whispy_segment` and a `memoryview` of their utf-8 texts instead (see `whispy_segment.text_offset`), both only valid during the call. None unregisters it.
+        every_n (int, optional): Segments per batch, 0 for no limit. Defaults to 16.
+        every_ms (int, optional): Maximum milliseconds between batches, 0 for no limit. Defaults to 1000.
+        zero_copy (bool, optional): Delivers views over the native buffers instead of Python objects. Defaults to False.
+
+    Returns:
+        SpeechToTextParams: A reference to the speech params object.
+    """
+    self._whispy_params["segment_batch"] = SegmentBatchSpec(func, every_n, every_ms, zero_copy) if func is not None else None
+    return self
+
+  def token_output(self, fields: Iterable[str] | None = TOKEN_FIELDS, special: bool = False):
+    """Asks for token-level output in `TranscriptResult.tokens`, as one compact array per field filled in bulk by the backend (see `TokenColumns`).
+
+    Token timestamps (`t0`, `t1`) are enabled along with it, and `t_dtw` needs a model loaded with `ModelParams.dtw`. Results with tokens bypass the result cache, which does not store them.
+
+    Args:
+        fields (Iterable[str] | None, optional): Columns to fill, any of `TOKEN_FIELDS`. Defaults to every one. None disables token output.
+        special (bool, optional): Keeps special tokens (start of transcript, timestamps...). Defaults to False.
+
+    Raises:
+        ValueError: If a field is unknown.
+
+    Returns:
+        SpeechToTextParams: A reference to the speech params object.
+    """
+    if fields is None:
+      self._whispy_params["tokens"] = None
+      return self
+
+    spec = TokenOutputSpec(fields, special)
+    for field in spec.fields:
+      if field not in TOKEN_FIELDS:
+        raise ValueError(f"Unknown token field: {field!r}")
+    self._whispy_params["tokens"] = spec
+    if "t0" in spec.fields or "t1" in spec.fields:
+      self._wfull_params_dict["token_timestampts"] = True
+    return self
+
+  def vad(self, detector: VoiceActivityDetector | None):
+    """Enables a voice activity detection stage before inference, so only speech regions are transcribed (e.g. `EnergyVAD()`).
+
+    Args:
+        detector (VoiceActivityDetector | None): Any callable that returns the speech regions of the PCM samples. None disables the stage.
+
+    Returns:
+        SpeechToTextParams: A reference to the speech params object.
+    """
+    self._whispy_params["vad"] = detector
+    return self
+
   def progress_callback(self, func: Callable[[int], None]):
     @SpeechToTextParams._prcallback
     def nscallback(progress: int):
@@ -191,12 +377,15 @@ class WhispyModel:
     ## whisper.cpp binding for python
 
     Whispy is a lightweight python wrapper over whisper.cpp that allows to generate plain text from audio recordings.
+
+    The model weights are loaded once and shared by a bounded pool of whisper states (see `ModelParams.n_states`), so a single model can be used to transcribe from several threads at the same time.
   """
-  def __init__(self, params: ModelParams = ModelParams("base")):
+  def __init__(self, params: ModelParams = ModelParams("base"), warmup: bool | Literal["background"] = False):
     """Simple clas
 
     Args:
         model_path: Anything used to construct a utf-8 bytes object.
+        warmup: Runs `warmup` before returning, so the first transcription is as fast as the next ones. "background" warms up on a daemon thread instead, see `ready`.
 
     Raises:
         RuntimeError: If the underlying C api detects an error.
@@ -205,53 +394,738 @@ class WhispyModel:
     if not lib_loader:
       raise WhisperInitError(lib_loader.loading_error)
     self._libwhispy = lib_loader.dll()
+    self._params = params
 
     # Configure the tc
-    model_path =\
-      fetch_model_path(params._get_whispy_params()["model_name"])  # type: ignore
-    if model_path is None:
-      raise WhisperInitError("No such model name")
-    
+    whispy_params = params._get_whispy_params()
+    model_entry = model_registry.resolve(whispy_params["model_name"]) # type: ignore
+    if model_entry is None:
+      raise WhisperInitError(f"No such model name: {whispy_params['model_name']}")
+
+    checksum = whispy_params["checksum"] or model_entry.checksum
+    if checksum is not None:
+      verify_checksum(model_entry.path, checksum) # type: ignore
+    self._header: ModelHeader = model_entry.header() # Fails early on anything that is not a ggml file
+    model_path = bytes(model_entry.path, encoding="utf-8")
+
     self._tc = whispy_transcript_context()
     cparams = params._get_whisper_context_params() # type: ignore
+    if whispy_params.get("dtw") == "auto":
+      cparams.dtw_aheads_preset = self._header.alignment_heads(whispy_params["model_name"]) # type: ignore
 
-    make_result: int = self._libwhispy.whispy_tc_make(
+    make_result: int = self._libwhispy.whispy_tc_make_shared(
       ctypes.pointer(self._tc),
       model_path,
       cparams   
     )
     if make_result != 0:
       raise WhisperInitError(format_tc_error(self._tc))
+
+    self._states = WhisperStatePool(self._libwhispy, self._tc, whispy_params["n_states"]) # type: ignore
+    self._pcm_cache: PCMCache | None = whispy_params["pcm_cache"] # type: ignore
+    self._result_cache: ResultCache | None = whispy_params["result_cache"] # type: ignore
+    self._model_id = model_identity(model_path, params) if self._result_cache is not None else None
+    self._tuned_threads = tuned_threads(self._header, whispy_params["n_states"]) if whispy_params.get("use_profile", True) else None # type: ignore
+
+    self._executor = None
+    self._executor_lock = threading.Lock()
+    self._vocabulary: list[bytes] | None = None
+
+    self._ready = threading.Event()
+    self._warmup_error: BaseException | None = None
+    self.warmup_seconds: float | None = None
+    """How long the last `warmup` took, None if the model was never warmed up.
+    """
+    if not warmup:
+      self._ready.set()
+    elif warmup == "background":
+      self.warmup(background=True)
+    else:
+      try:
+        self.warmup()
+      except BaseException:
+        self.destroy()
+        raise
   
 
-  def speech_to_text(self, speech_path: str, params: SpeechToTextParams = SpeechToTextParams("greedy")):
+  @property
+  def states(self):
+    """The pool of whisper states that share the model weights.
+    """
+    return self._states
+
+
+  @property
+  def header(self):
+    """The hyperparameters of the loaded model, parsed from its file.
+    """
+    return self._header
+
+
+  @property
+  def vocabulary(self):
+    """The bytes of every token id, to turn the `id` column of `TokenColumns` into text. Tokens may hold partial utf-8 sequences, so texts are joined before being decoded.
+    """
+    if self._vocabulary is None:
+      ctx = self._tc.model_context
+      self._vocabulary = [self._libwhispy.whisper_token_to_str(ctx, token_id) or b"" for token_id in range(self._libwhispy.whisper_n_vocab(ctx))]
+    return self._vocabulary
+
+
+  @property
+  def ready(self):
+    """Whether the model is loaded and, if it was asked to, warmed up. Meant for readiness probes.
+    """
+    return self._ready.is_set() and self._warmup_error is None
+
+
+  def wait_ready(self, timeout: float | None = None):
+    """Blocks until the model is `ready`.
+
+    Raises:
+        BaseException: The error of a background warm-up that failed.
+
+    Returns:
+        bool: Whether the model became ready within `timeout`.
+    """
+    ready = self._ready.wait(timeout)
+    if self._warmup_error is not None:
+      raise self._warmup_error
+    return ready
+
+
+  def warmup(self, background: bool = False):
+    """Decodes a short silent clip on every state of the pool, so real transcriptions do not pay for the first-call costs: lazy buffer allocations, page faults on the weights (a full encoder and decoder pass reads every tensor) and the spin-up of the backend thread pool.
+
+    Every state is checked out while it warms up, so concurrent transcriptions wait for it. `ready` becomes true once it completes.
+
+    Args:
+        background: Warms up on a daemon thread and returns immediately.
+
+    Raises:
+        WhisperTextGenError: If the synthetic decode failed.
+
+    Returns:
+        float | None: Seconds the warm-up took, None when it runs in the background.
+    """
+    if background:
+      def warmup_thread():
+        try:
+          self.warmup()
+        except BaseException as e:
+          self._warmup_error = e
+          self._ready.set() # Unblocks `wait_ready`, which raises the error
+      threading.Thread(target=warmup_thread, name="whispy-warmup", daemon=True).start()
+      return None
+
+    params = SpeechToTextParams("greedy", n_threads=self._tuned_threads)
+    params._wfull_params_dict.update(single_segment=True, no_context=True, max_tokens=WARMUP_MAX_TOKENS)
+    wparams = params._get_whisper_full_params()
+    silence = bytes(ctypes.sizeof(ctypes.c_float) * int(WARMUP_SECONDS * PCM_SAMPLE_RATE))
+    pcm, n_samples, _owner = as_pcm_f32(silence)
+
+    start = time.perf_counter()
+    warmed: list[whispy_transcript_context] = []
+    try:
+      # States stay checked out until every one of them is warm, so each checkout yields a cold one.
+      for _ in range(self._states.size):
+        tc = self._states.checkout()
+        warmed.append(tc)
+        if self._libwhispy.whispy_transcribe_pcm(ctypes.pointer(tc), pcm, n_samples, wparams) != 0:
+          raise WhisperTextGenError(format_tc_error(tc))
+    finally:
+      for tc in warmed:
+        self._states.checkin(tc)
+
+    self.warmup_seconds = time.perf_counter() - start
+    get_metrics_sink().observe("whispy_warmup_seconds", self.warmup_seconds)
+    self._warmup_error = None
+    self._ready.set()
+    return self.warmup_seconds
+
+
+  @property
+  def tuned_threads(self):
+    """The `n_threads` of the tuning profile of this host, used by transcriptions that leave it unset. None if there is no profile.
+    """
+    return self._tuned_threads
+
+
+  @property
+  def pcm_cache(self):
+    """The on-disk cache of decoded PCM, if any.
+    """
+    return self._pcm_cache
+
+
+  @property
+  def result_cache(self):
+    """The persistent cache of transcription results, if any.
+    """
+    return self._result_cache
+
+
+  def _load_audio(self, speech_path: str, timings: Timings):
+    """Loads the samples of an audio file, through the PCM cache if there is one.
+    """
+    with timings.measure("decode"):
+      if self._pcm_cache is not None:
+        return self._pcm_cache.get_or_decode(self._libwhispy, speech_path)
+      return load_audio(self._libwhispy, speech_path)
+
+
+  def transcribe(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    abort: AbortFlag | None = None,
+    timeout: float | None = None,
+    max_audio_seconds: float | None = None
+  ):
+    """Transcribes the speech and returns the structured result.
+
+    A whisper state is checked out from the pool for the duration of the call, so it blocks while every state is busy.
+
+    Args:
+        speech: Either a path to the audio file (raw PCM or any format libav can decode) or mono 16 kHz float32 PCM samples already in memory (see `as_pcm_f32`).
+        abort: A flag that stops the native work as soon as it is set from another thread.
+        timeout: Seconds the whole call may take, waiting for a state included. The backend checks it before every encoder window and between graph computations, so inference stops by itself once it runs out. Defaults to None, which means no timeout.
+        max_audio_seconds: Longest audio accepted. Defaults to None, which means no limit.
+
+    Raises:
+        ValueError: If `speech` is a buffer but not a contiguous float32 one, or a limit is not positive.
+        WhisperAbortedError: If `abort` was set before the transcription finished.
+        WhisperTimeoutError: If the transcription ran out of time. Its `partial` holds the segments decoded until then.
+        WhisperAudioTooLongError: If the audio is longer than `max_audio_seconds`.
+        WhisperTextGenError: If the underlying C api detects an error.
+
+    Returns:
+        TranscriptResult: The segments of the transcription with their timestamps, the detected language, where the time went (`timings`) and a lazily joined plain text view.
+    """
+    budget = CallBudget(timeout, max_audio_seconds) if timeout is not None or max_audio_seconds is not None else None
+    return self._transcribe_within(speech, params, abort, budget)
+
+
+  def _transcribe_within(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams,
+    abort: AbortFlag | None,
+    budget: CallBudget | None
+  ):
+    """Body of `transcribe`, for callers whose budget started earlier (see `transcribe_async`).
+    """
+    timings = Timings()
+    try:
+      with timings.measure("total"):
+        result = self._transcribe_cached(speech, params, abort, budget, timings)
+    except WhisperAbortedError:
+      record_transcription("aborted", timings)
+      raise
+    except WhisperTimeoutError:
+      record_transcription("timeout", timings)
+      raise
+    except Exception:
+      record_transcription("error", timings)
+      raise
+
+    result.timings = timings
+    record_transcription("ok", timings, result)
+    return result
+
+
+  def _transcribe_cached(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams,
+    abort: AbortFlag | None,
+    budget: CallBudget | None,
+    timings: Timings
+  ):
+    """Looks the result up in the result cache before transcribing, if there is one.
+    """
+    if self._result_cache is None or params._get_whispy_parms().get("tokens") is not None: # Tokens are not cached
+      return self._transcribe_uncached(speech, params, abort, budget, timings)
+
+    try:
+      params_form = canonical_params(params)
+    except TypeError: # Would be mistaken for other parameters
+      return self._transcribe_uncached(speech, params, abort, budget, timings)
+
+    with timings.measure("cache"):
+      key = ResultCache.key(hash_audio(speech), self._model_id, params_form) # type: ignore
+      result = self._result_cache.get(key)
+    get_metrics_sink().inc("whispy_result_cache_total", outcome="miss" if result is None else "hit")
+
+    if result is None:
+      result = self._transcribe_uncached(speech, params, abort, budget, timings)
+      with timings.measure("cache"):
+        self._result_cache.put(key, result)
+    return result
+
+
+  def _transcribe_uncached(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams,
+    abort: AbortFlag | None,
+    budget: CallBudget | None,
+    timings: Timings
+  ):
+    if budget is not None and budget.max_audio_seconds is not None:
+      # Rejects long files before decoding them, the backend checks the samples it gets anyway.
+      try:
+        audio_seconds = audio_duration(self._libwhispy, speech)
+      except (OSError, WhisperTextGenError): # Unreadable inputs fail when they are transcribed
+        audio_seconds = None
+      if audio_seconds is not None and audio_seconds > budget.max_audio_seconds:
+        raise WhisperAudioTooLongError(f"The audio lasts {audio_seconds:.1f}s, more than the {budget.max_audio_seconds}s allowed")
+
+    vad = params._get_whispy_parms().get("vad")
+    if vad is not None:
+      return self._transcribe_speech(speech, params, abort, budget, vad, timings)
+    return self._transcribe(speech, params, abort, budget, timings)
+
+
+  def _transcribe_speech(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams,
+    abort: AbortFlag | None,
+    budget: CallBudget | None,
+    vad: VoiceActivityDetector,
+    timings: Timings
+  ):
+    """Transcribes only the speech regions found by the voice activity detector, packed together, and maps the timestamps back to the original audio.
+    """
+    # Decoded files come as arrays, which `detect_speech` and `pack` slice as float32 views too.
+    samples = pcm_f32_view(self._load_audio(speech, timings) if isinstance(speech, str) else speech)
+    with timings.measure("vad"):
+      regions = detect_speech(vad, samples)
+
+    if regions:
+      timeline = SpeechTimeline(regions)
+      def to_original(result: TranscriptResult):
+        for segment in result.segments:
+          segment.t0 = timeline.to_original(segment.t0)
+          segment.t1 = timeline.to_original(segment.t1)
+        if result.tokens is not None:
+          result.tokens.map_times(timeline)
+
+      try:
+        result = self._transcribe(timeline.pack(samples), params, abort, budget, timings, timeline)
+      except WhisperTimeoutError as e:
+        if e.partial is not None:
+          to_original(e.partial)
+        raise
+      to_original(result)
+    else:
+      result = TranscriptResult([])
+
+    result.speech_regions = regions
+    result.audio_seconds = len(samples) / PCM_SAMPLE_RATE
+    return result
+
+
+  def _transcribe(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams,
+    abort: AbortFlag | None,
+    budget: CallBudget | None,
+    timings: Timings,
+    timeline: SpeechTimeline | None = None
+  ):
+    """Runs the backend over the whole speech. Segment batches are mapped through `timeline` when only the speech regions are transcribed, so they agree with the result.
+    """
+    wparams = params._get_whisper_full_params() # type: ignore
+    if self._tuned_threads is not None and params._wfull_params_dict.get("n_threads") is None:
+      wparams.n_threads = self._tuned_threads
+
+    # The backend reads raw PCM files by itself, anything else is decoded before taking a state.
+    if isinstance(speech, str) and not speech.endswith(RAW_PCM_EXTENSION):
+      speech = self._load_audio(speech, timings)
+
+    batch_spec: SegmentBatchSpec | None = params._get_whispy_parms().get("segment_batch") # type: ignore
+    batcher = SegmentBatcher(self._libwhispy, batch_spec, timeline.to_original if timeline is not None else None) if batch_spec is not None else None
+    if batcher is not None:
+      batcher.install(wparams)
+
+    try:
+      token_spec: TokenOutputSpec | None = params._get_whispy_parms().get("tokens") # type: ignore
+      return self._transcribe_with_state(speech, wparams, abort, budget, batcher, token_spec, timings)
+    finally:
+      if batcher is not None:
+        batcher.close()
+
+
+  def _transcribe_with_state(
+    self,
+    speech: str | object,
+    wparams: whisper_full_params,
+    abort: AbortFlag | None,
+    budget: CallBudget | None,
+    batcher: SegmentBatcher | None,
+    token_spec: TokenOutputSpec | None,
+    timings: Timings
+  ):
+    """Checks out a whisper state and runs the backend with it.
+    """
+    with timings.measure("queue"):
+      try:
+        tc = self._states.checkout(budget.remaining() if budget is not None else None)
+      except TimeoutError:
+        raise WhisperTimeoutError("Timed out waiting for a whisper state", None, budget.timeout) from None # type: ignore
+
+    try:
+      if abort is not None and abort.is_set():
+        raise WhisperAbortedError("Aborted before starting")
+      # States are shared, the limits of a previous call must not leak into this one.
+      tc.limits = budget.limits() if budget is not None else whispy_limits()
+      if abort is not None:
+        tc.limits.abort_flag = abort.pointer()
+      if budget is not None and budget.deadline is not None and not tc.limits.timeout_ms:
+        raise WhisperTimeoutError("Timed out before starting", None, budget.timeout)
+
+      if isinstance(speech, str):
+        audio_seconds = os.path.getsize(speech) / 4 / PCM_SAMPLE_RATE
+        with timings.measure("inference"):
+          speech_result: int =\
+            self._libwhispy.whispy_transcribe(
+              ctypes.pointer(tc),
+              bytes(speech, encoding="utf-8"),
+              wparams
+            )
+      else:
+        pcm, n_samples, _owner = as_pcm_f32(speech)
+        audio_seconds = n_samples / PCM_SAMPLE_RATE
+        with timings.measure("inference"):
+          speech_result: int =\
+            self._libwhispy.whispy_transcribe_pcm(
+              ctypes.pointer(tc),
+              pcm,
+              n_samples,
+              wparams
+            )
+      timings.set_native(tc.timings)
+
+      if abort is not None and abort.is_set():
+        raise WhisperAbortedError("Aborted while transcribing")
+      if speech_result == whispy_tc_state.TIMEOUT_ERROR:
+        partial_result = TranscriptResult.from_state(self._libwhispy, tc.model_state)
+        if token_spec is not None:
+          partial_result.tokens = TokenColumns.from_context(self._libwhispy, tc, token_spec.fields, token_spec.special)
+        partial_result.audio_seconds = audio_seconds
+        raise WhisperTimeoutError(format_tc_error(tc), partial_result, budget.timeout) # type: ignore
+      if speech_result == whispy_tc_state.AUDIOLEN_ERROR:
+        raise WhisperAudioTooLongError(format_tc_error(tc))
+      if speech_result != 0:
+        raise WhisperTextGenError(format_tc_error(tc))
+      if batcher is not None:
+        batcher.flush()
+
+      with timings.measure("extract"):
+        result = TranscriptResult.from_state(self._libwhispy, tc.model_state)
+        if token_spec is not None:
+          result.tokens = TokenColumns.from_context(self._libwhispy, tc, token_spec.fields, token_spec.special)
+      result.audio_seconds = audio_seconds
+      return result
+    finally:
+      self._states.checkin(tc) # Also clears the limits, including the abort flag
+
+
+  def _get_executor(self):
+    """Returns the executor that runs asynchronous transcriptions and batched language detection, one thread per whisper state.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with self._executor_lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(
+          max_workers=self._states.size,
+          thread_name_prefix="whispy"
+        )
+      return self._executor
+
+
+  async def transcribe_async(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    timeout: float | None = None,
+    max_audio_seconds: float | None = None
+  ):
+    """Same as `transcribe`, but runs on a dedicated executor without blocking the event loop.
+
+    Cancelling the task aborts the native work through its `AbortFlag` instead of leaving it running in the background. The timeout is enforced by the backend itself, as in `transcribe`, and counts the time spent waiting for the executor.
+
+    Args:
+        timeout: Seconds after which the transcription is stopped. Defaults to None, which means no timeout.
+        max_audio_seconds: Longest audio accepted. Defaults to None, which means no limit.
+
+    Raises:
+        WhisperTimeoutError: If the transcription took longer than `timeout`. It is an `asyncio.TimeoutError` too.
+        asyncio.CancelledError: If the task was cancelled.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    abort = AbortFlag()
+    budget = CallBudget(timeout, max_audio_seconds) if timeout is not None or max_audio_seconds is not None else None
+    future = loop.run_in_executor(
+      self._get_executor(),
+      partial(self._transcribe_within, speech, params, abort, budget)
+    )
+
+    try:
+      return await asyncio.shield(future)
+    except asyncio.CancelledError:
+      abort.set()
+      # The native work returns shortly after, drop its aborted result.
+      future.add_done_callback(lambda f: f.cancelled() or f.exception())
+      raise
+
+
+  async def speech_to_text_async(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    timeout: float | None = None,
+    max_audio_seconds: float | None = None
+  ):
+    """Returns a string with the transcription of the speech without blocking the event loop (see `transcribe_async`).
+
+    Args:
+        speech: Either a path to the audio file or mono 16 kHz float32 PCM samples already in memory.
+    """
+    return (await self.transcribe_async(speech, params, timeout, max_audio_seconds)).text
+
+
+  def speech_to_text(
+    self,
+    speech_path: str,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    timeout: float | None = None,
+    max_audio_seconds: float | None = None
+  ):
     """Returns a string with the transcription of the speech.
 
     Args:
         speech_path: Ahything used to construct a utf-8 bytes object. 
+        timeout: Seconds after which the backend stops transcribing (see `transcribe`). Defaults to None, which means no timeout.
+        max_audio_seconds: Longest audio accepted. Defaults to None, which means no limit.
+
+    Raises:
+        WhisperTimeoutError: If the transcription ran out of time. Its `partial` holds the segments decoded until then.
+        WhisperAudioTooLongError: If the audio is longer than `max_audio_seconds`.
     """
-    MAX_TEXT_SIZE = (1 << 10) * 8 # 8 KiB: More than enough
-    text = (ctypes.c_char * MAX_TEXT_SIZE)()
+    return self.transcribe(speech_path, params, None, timeout, max_audio_seconds).text
 
-    wparams = params._get_whisper_full_params() # type: ignore
-    speech_result: int =\
-      self._libwhispy.whispy_speech_to_text(
-        text,
-        MAX_TEXT_SIZE,
-        ctypes.pointer(self._tc),
-        bytes(speech_path, encoding="utf-8"),
-        wparams
-      )
 
-    if speech_result != 0:
-      raise WhisperTextGenError(format_tc_error(self._tc))
+  def speech_to_text_pcm(
+    self,
+    samples: object,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    timeout: float | None = None,
+    max_audio_seconds: float | None = None
+  ):
+    """Returns a string with the transcription of PCM samples that are already in memory.
+
+    The samples are handed to the backend without being copied nor written to disk.
+
+    Args:
+        samples: Mono 16 kHz float32 PCM samples: a NumPy float32 array, a `memoryview` or any buffer-protocol object (see `as_pcm_f32`).
+        timeout: Seconds after which the backend stops transcribing (see `transcribe`). Defaults to None, which means no timeout.
+        max_audio_seconds: Longest audio accepted. Defaults to None, which means no limit.
+
+    Raises:
+        ValueError: If `samples` is not a contiguous float32 buffer.
+        WhisperTimeoutError: If the transcription ran out of time. Its `partial` holds the segments decoded until then.
+        WhisperAudioTooLongError: If the audio is longer than `max_audio_seconds`.
+        WhisperTextGenError: If the underlying C api detects an error.
+    """
+    return self.transcribe(samples, params, None, timeout, max_audio_seconds).text
+
+
+  def detect_language(
+    self,
+    speech: str | object,
+    max_seconds: float = LANGUAGE_WINDOW_SECONDS,
+    n_threads: int | None = None,
+    top_k: int | None = None
+  ):
+    """Detects the spoken language without transcribing the speech.
+
+    Only the leading `max_seconds` are decoded. Their spectrogram goes through the encoder once and the decoder runs a single step (`whisper_lang_auto_detect`), which costs a fraction of a transcription of the same audio. English-only models always return {"en": 1.0} without running.
+
+    Args:
+        speech: Either a path to the audio file or mono 16 kHz float32 PCM samples already in memory.
+        max_seconds: Leading seconds of audio to analyze, at most `LANGUAGE_WINDOW_SECONDS`. Defaults to it.
+        n_threads: whisper.cpp threads. Defaults to the tuned profile of this host, or to whisper.cpp's own default.
+        top_k: Keeps only the `top_k` most likely languages. Defaults to None, which keeps every language.
+
+    Raises:
+        ValueError: If `speech` is a buffer but not a contiguous float32 one.
+        WhisperTextGenError: If the audio cannot be decoded or the underlying C api detects an error.
+
+    Returns:
+        dict[str, float]: Probability of every language by its code (e.g. "en"), most likely first.
+    """
+    if not self._libwhispy.whisper_is_multilingual(self._tc.model_context):
+      return {"en": 1.0}
+
+    samples = load_audio_head(self._libwhispy, speech, min(max_seconds, LANGUAGE_WINDOW_SECONDS))
+    pcm, n_samples, _owner = as_pcm_f32(samples)
+    if n_threads is None:
+      n_threads = self._tuned_threads or min(4, os.cpu_count() or 1)
+    n_languages: int = self._libwhispy.whisper_lang_max_id() + 1
+    probs = (ctypes.c_float * n_languages)()
+
+    tc = self._states.checkout()
+    try:
+      detect_result: int = self._libwhispy.whispy_detect_language_pcm(ctypes.pointer(tc), pcm, n_samples, n_threads, probs)
+      if detect_result != 0:
+        raise WhisperTextGenError(format_tc_error(tc))
+    finally:
+      self._states.checkin(tc)
+
+    ranked = sorted(range(n_languages), key=lambda lang_id: probs[lang_id], reverse=True)[:top_k]
+    return {str(self._libwhispy.whisper_lang_str(lang_id), encoding="utf-8"): probs[lang_id] for lang_id in ranked}
+
+
+  def detect_languages(
+    self,
+    inputs: Iterable[object],
+    max_seconds: float = LANGUAGE_WINDOW_SECONDS,
+    n_threads: int | None = None,
+    top_k: int | None = None
+  ):
+    """Detects the language of many inputs, as many at once as the model has whisper states (see `detect_language`).
+
+    Every input is decoded on the thread that analyzes it, so decoding overlaps with the inference of the others. A failed input does not abort the batch, its error is reported within its `BatchResult` instead.
+
+    Inputs are pulled lazily and only as many as the model has whisper states are submitted at once, so `inputs` may be a lazy iterable of any length and the executor shared with `transcribe_async` is not flooded.
+
+    Returns:
+        Iterator[BatchResult]: One result per input, in input order. Their `result` is the dict returned by `detect_language`.
+    """
+    from collections import deque
+    from .batch import BatchResult
+
+    def detect(item: tuple[int, object]):
+      index, speech = item
+      path = speech if isinstance(speech, str) else None
+      try:
+        return BatchResult(index, path, result=self.detect_language(speech, max_seconds, n_threads, top_k)) # type: ignore
+      except Exception as e:
+        return BatchResult(index, path, error=f"{type(e).__name__}: {e}")
+
+    executor = self._get_executor()
+    window: deque = deque()
+    try:
+      for item in enumerate(inputs):
+        window.append(executor.submit(detect, item))
+        if len(window) >= self._states.size:
+          yield window.popleft().result()
+      while window:
+        yield window.popleft().result()
+    finally:
+      for future in window: # The caller stopped early
+        future.cancel()
+
+
+  def transcribe_many(
+    self,
+    inputs: Iterable[object],
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    workers: int | None = None,
+    threads_per_worker: int | None = None,
+    ordered: bool = False
+  ):
+    """Transcribes many inputs in parallel with a pool of worker processes.
+
+    Every worker loads its own copy of this model once and keeps it for the whole batch. The available cores are split between the workers and the `n_threads` of each one (see `split_cores`). A failed input does not abort the batch, its error is reported within its `BatchResult` instead.
+
+    Args:
+        inputs: Audio file paths or picklable PCM buffers (bytes, `array.array`, NumPy arrays...).
+        params: Transcription parameters shared by every input. Callbacks are not sent to the workers.
+        workers: Number of worker processes. Defaults to the throughput profile of this host (see `tuning.tune`), or as many as fit in the available cores.
+        threads_per_worker: whisper.cpp threads per worker.
+        ordered: Yields results in input order instead of completion order.
+
+    Returns:
+        Iterator[BatchResult]: A generator that yields one result per input as soon as it is ready.
+    """
+    from .batch import transcribe_many
+    return transcribe_many(self._params, inputs, params, workers, threads_per_worker, ordered)
+
+
+  def transcribe_long(
+    self,
+    speech: str | object,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    chunk_seconds: float = 120.0,
+    overlap_seconds: float = 1.0,
+    max_workers: int | None = None
+  ):
+    """Transcribes a long recording in parallel chunks (see `transcribe_long`).
+
+    The recording is split at low-energy points, every chunk runs on its own whisper state and the segments are stitched back with timestamps relative to the beginning of the recording. Wall-clock time scales with the size of the state pool.
+
+    Args:
+        speech: Either a path to an audio file, decoded as a stream, or mono 16 kHz float32 PCM samples already in memory.
+        chunk_seconds: Preferred length of every chunk.
+        overlap_seconds: Extra context decoded on each side of a chunk boundary.
+        max_workers: Chunks transcribed at once. Defaults to the size of the state pool.
+
+    Returns:
+        TranscriptResult: The stitched transcription.
+    """
+    return transcribe_long(self, speech, params, chunk_seconds, overlap_seconds, max_workers)
+
+
+  def streaming_session(
+    self,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    step_seconds: float = 3.0,
+    window_seconds: float = 30.0,
+    overlap_seconds: float = 1.0
+  ):
+    """Starts a real-time transcription session fed with audio chunks as they arrive (see `StreamingSession`).
+
+    Returns:
+        StreamingSession: A session that yields finalized and tentative segments.
+    """
+    return StreamingSession(self, params, step_seconds, window_seconds, overlap_seconds)
+
+
+  def stream_file(
+    self,
+    speech_path: str,
+    params: SpeechToTextParams = SpeechToTextParams("greedy"),
+    step_seconds: float = 3.0,
+    window_seconds: float = 30.0,
+    overlap_seconds: float = 1.0
+  ):
+    """Transcribes an audio file as it is decoded, yielding segments as they are finalized (see `StreamingSession`).
+
+    The file is decoded on a background thread into a bounded ring buffer, overlapped with inference, so peak memory does not depend on the length of the file.
+
+    Args:
+        speech_path: A raw PCM file or any file libav can decode (wav, flac, mp3, ogg...).
+
+    Returns:
+        Iterator[StreamingUpdate]: The updates of the streaming session.
+    """
+    session = self.streaming_session(params, step_seconds, window_seconds, overlap_seconds)
+    blocks = prefetch(iter_audio_blocks(self._libwhispy, speech_path, block_seconds=step_seconds))
+    return session.stream(blocks)
 
-    decoded_text = str(memoryview(text), encoding="utf-8")
-    end_pos = decoded_text.find("\x00")
-    return decoded_text[1: end_pos if end_pos > 0 else 0]
- 
 
   def destroy(self):
+    if self._executor is not None:
+      self._executor.shutdown(wait=True)
+    self._states.close()
     self._libwhispy.whispy_tc_free(ctypes.pointer(self._tc))
 
 
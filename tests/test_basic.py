@@ -49,6 +49,514 @@ class BasicTest(unittest.TestCase):
     model.destroy()
     print("Model was destroyed.")
 
+  def test_speech_to_text_pcm(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, flash_attn=True))
+
+    # Raw little endian float32 samples straight from memory
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      samples = memoryview(bytearray(speech_file.read())).cast("f")
+
+    output_text = model.speech_to_text_pcm(samples)
+    print("The resulting text is:", output_text)
+    self.assertTrue(output_text.lower().count("ask not what your country can do for you") > 0)
+
+    with self.assertRaises(ValueError):
+      model.speech_to_text_pcm(memoryview(bytearray(6)))
+
+    model.destroy()
+
+  def test_transcribe(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, flash_attn=True))
+    result = model.transcribe("./inputs/jfk.pcmf32")
+    print("The resulting segments are:", result.segments)
+
+    self.assertIsInstance(result, whispy.TranscriptResult)
+    self.assertGreater(len(result.segments), 0)
+    self.assertEqual(result.language, "en")
+    for segment in result.segments:
+      self.assertLessEqual(segment.t0, segment.t1)
+    self.assertTrue(result.text.lower().count("my fellow americans") > 0)
+
+    model.destroy()
+
+  def test_concurrent_states(self):
+    import whispy
+    from concurrent.futures import ThreadPoolExecutor
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=2))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+      texts = list(executor.map(model.speech_to_text, ["./inputs/jfk.pcmf32"] * 4))
+
+    # Both states share one copy of the weights
+    self.assertLessEqual(model.states.n_created, 2)
+    for text in texts:
+      self.assertTrue(text.lower().count("my fellow americans") > 0)
+
+    model.destroy()
+
+  def test_transcribe_many(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+    inputs = ["./inputs/jfk.pcmf32", "./inputs/missing.pcmf32", "./inputs/jfk.pcmf32"]
+    results = list(model.transcribe_many(inputs, workers=2, threads_per_worker=1, ordered=True))
+
+    self.assertEqual([item.index for item in results], [0, 1, 2])
+    self.assertTrue(results[0].ok and results[2].ok)
+    self.assertFalse(results[1].ok) # Errors are reported per item
+    self.assertTrue(results[0].result.text.lower().count("my fellow americans") > 0)
+
+    model.destroy()
+
+  def test_speech_to_text_async(self):
+    import asyncio
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+
+    async def transcribe():
+      text = await model.speech_to_text_async("./inputs/jfk.pcmf32")
+      self.assertTrue(text.lower().count("my fellow americans") > 0)
+
+      # A timeout aborts the native work, and the state is reused afterwards
+      with self.assertRaises(asyncio.TimeoutError):
+        await model.speech_to_text_async("./inputs/jfk.pcmf32", timeout=0.01)
+      text = await model.speech_to_text_async("./inputs/jfk.pcmf32")
+      self.assertTrue(text.lower().count("my fellow americans") > 0)
+
+    asyncio.run(transcribe())
+    model.destroy()
+
+  def test_streaming_session(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+    session = model.streaming_session(step_seconds=2.0, window_seconds=10.0)
+
+    # Half a second chunks, as if they were coming from a microphone
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      chunks = iter(lambda: speech_file.read(4 * 8000), b"")
+      finalized = [segment for update in session.stream(chunks) for segment in update.finalized]
+
+    text = "".join(segment.text for segment in finalized).lower()
+    print("The streamed text is:", text)
+    self.assertTrue(text.count("ask not what your country can do for you") > 0)
+    for previous, segment in zip(finalized, finalized[1:]):
+      self.assertLessEqual(previous.t0, segment.t0)
+
+    model.destroy()
+
+  def test_transcribe_long(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=2))
+    result = model.transcribe_long("./inputs/jfk.pcmf32", chunk_seconds=4.0)
+    print("The stitched segments are:", result.segments)
+
+    self.assertTrue(result.text.lower().count("country") > 0)
+    for previous, segment in zip(result.segments, result.segments[1:]):
+      self.assertLessEqual(previous.t0, segment.t0)
+    self.assertGreater(result.segments[-1].t1, 800) # Timestamps are shifted to the whole recording
+
+    model.destroy()
+
+  def test_voice_activity_detection(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+
+    # Three seconds of silence before the speech
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      samples = bytes(4 * 3 * 16000) + speech_file.read()
+
+    result = model.transcribe(samples, whispy.SpeechToTextParams("greedy").vad(whispy.EnergyVAD()))
+    print("Speech regions:", result.speech_regions, "skipped seconds:", result.skipped_seconds)
+
+    self.assertGreater(len(result.speech_regions), 0)
+    self.assertGreaterEqual(result.speech_regions[0].start_seconds, 2.5)
+    self.assertGreater(result.skipped_seconds, 2.5)
+    self.assertGreaterEqual(result.segments[0].t0, 250) # Timestamps of the original audio
+    self.assertTrue(result.text.lower().count("my fellow americans") > 0)
+
+    # Decoded files
+    result = model.transcribe("./inputs/jfk.mp3", whispy.SpeechToTextParams("greedy").vad(whispy.EnergyVAD()))
+    self.assertGreater(len(result.speech_regions), 0)
+    self.assertTrue(result.text.lower().count("my fellow americans") > 0)
+
+    model.destroy()
+
+  def test_compressed_audio(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+
+    for speech_path in ["./inputs/jfk.mp3", "./inputs/jfk.flac"]:
+      text = model.speech_to_text(speech_path)
+      print(f"The resulting text of '{speech_path}' is:", text)
+      self.assertTrue(text.lower().count("my fellow americans") > 0)
+
+    # Decoded as a stream, overlapped with inference
+    finalized = [segment for update in model.stream_file("./inputs/jfk.mp3", step_seconds=2.0) for segment in update.finalized]
+    self.assertTrue("".join(segment.text for segment in finalized).lower().count("country") > 0)
+
+    model.destroy()
+
+  def test_pcm_cache(self):
+    import tempfile
+    import whispy
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache = whispy.PCMCache(cache_dir, max_bytes=64 << 20)
+      model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, pcm_cache=cache))
+
+      first = model.speech_to_text("./inputs/jfk.mp3")
+      second = model.speech_to_text("./inputs/jfk.mp3") # Memory-mapped from the cache
+      self.assertEqual(first, second)
+      self.assertEqual((cache.hits, cache.misses), (1, 1))
+      self.assertGreater(cache.size(), 0)
+
+      model.destroy()
+
+  def test_result_cache(self):
+    import tempfile
+    import whispy
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache = whispy.ResultCache(cache_dir + "/results.sqlite3")
+      model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, result_cache=cache))
+
+      first = model.transcribe("./inputs/jfk.mp3")
+      second = model.transcribe("./inputs/jfk.mp3") # Served from the cache
+      self.assertEqual(first.to_dict(), second.to_dict())
+      self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+      model.transcribe("./inputs/jfk.mp3", whispy.SpeechToTextParams("greedy", translate=True))
+      self.assertEqual(cache.misses, 2)
+
+      model.destroy()
+
+  def test_model_registry(self):
+    import tempfile
+    import whispy
+    from whispy.models import registry
+
+    entry = registry.resolve("base")
+    self.assertIsNotNone(entry)
+    self.assertEqual(entry.header().size, "base") # type: ignore
+
+    # Local paths and registered names resolve to the same file.
+    self.assertEqual(registry.resolve(entry.path).path, entry.path) # type: ignore
+    registry.register("test-base", entry.path) # type: ignore
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="test-base", use_gpu=False))
+    self.assertEqual(model.header.n_audio_state, 512)
+    model.destroy()
+
+    with self.assertRaises(whispy.WhisperInitError):
+      whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, checksum="0" * 64))
+
+    with tempfile.NamedTemporaryFile(suffix=".bin") as not_a_model:
+      not_a_model.write(b"\0" * 64)
+      not_a_model.flush()
+      with self.assertRaises(whispy.WhisperInitError):
+        whispy.WhispyModel(whispy.ModelParams(model_name=not_a_model.name, use_gpu=False))
+
+  def test_prefork_pool(self):
+    import whispy
+
+    inputs = ["./inputs/jfk.pcmf32"] * 4
+    with whispy.PreforkPool(whispy.ModelParams(model_name="base", use_gpu=False), workers=2, max_jobs=1) as pool:
+      results = list(pool.map(inputs, whispy.SpeechToTextParams("greedy"), ordered=True))
+
+      self.assertEqual([result.index for result in results], list(range(len(inputs))))
+      self.assertTrue(all(result.ok for result in results))
+      self.assertEqual(len({result.result.text for result in results}), 1) # type: ignore
+      self.assertEqual(pool.n_recycled, len(inputs)) # Every worker retires after a single job
+
+  def test_import_time(self):
+    import json
+
+    # Measured in a fresh interpreter, since this one already imported whispy.
+    probe = (
+      "import sys, time, json\n"
+      "start = time.perf_counter()\n"
+      "import whispy\n"
+      "imported = time.perf_counter() - start\n"
+      "whispy.ModelParams('base'), whispy.SpeechToTextParams('greedy')\n"
+      "from whispy.whispy import lib_loader\n"
+      "print(json.dumps(dict(imported=imported, loaded=lib_loader.loaded,"
+      " heavy=[m for m in ('asyncio', 'multiprocessing', 'sqlite3') if m in sys.modules])))\n"
+    )
+    report = json.loads(subprocess.check_output([sys.executable, "-c", probe]))
+
+    self.assertLess(report["imported"], 0.1, "import whispy exceeded its time budget")
+    self.assertFalse(report["loaded"], "Building params must not load the backend library")
+    self.assertEqual(report["heavy"], [])
+
+  def test_segment_batch_callback(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+    expected = model.transcribe("./inputs/jfk.pcmf32")
+
+    batches = []
+    params = whispy.SpeechToTextParams("greedy").segment_batch_callback(batches.append, every_n=2, every_ms=0)
+    model.transcribe("./inputs/jfk.pcmf32", params)
+    self.assertTrue(all(0 < len(batch) <= 2 for batch in batches))
+    self.assertEqual([segment.to_dict() for batch in batches for segment in batch], [segment.to_dict() for segment in expected])
+
+    texts = []
+    params.segment_batch_callback(
+      lambda segments, text: texts.extend(bytes(text[s.text_offset:s.text_offset + s.text_size]) for s in segments),
+      zero_copy=True
+    )
+    model.transcribe("./inputs/jfk.pcmf32", params)
+    self.assertEqual(b"".join(texts).decode(), "".join(segment.text for segment in expected))
+
+    # With voice activity detection, batches carry the timestamps of the original audio, as the result does
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      samples = bytes(4 * 3 * 16000) + speech_file.read()
+    batches = []
+    params = whispy.SpeechToTextParams("greedy").vad(whispy.EnergyVAD()).segment_batch_callback(batches.append, every_n=1, every_ms=0)
+    result = model.transcribe(samples, params)
+    self.assertGreaterEqual(result.segments[0].t0, 250)
+    self.assertEqual([segment.to_dict() for batch in batches for segment in batch], [segment.to_dict() for segment in result])
+
+    model.destroy()
+
+  def test_timings_and_metrics(self):
+    import whispy
+    from whispy import metrics
+
+    registry = whispy.MetricsRegistry()
+    previous = metrics.set_sink(registry)
+    try:
+      model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+      result = model.transcribe("./inputs/jfk.mp3")
+      model.destroy()
+    finally:
+      metrics.set_sink(previous)
+
+    for stage in ("decode", "queue", "inference", "extract", "total"):
+      self.assertIn(stage, result.timings.stages)
+    self.assertGreater(result.timings.native["mel_ms"], 0)
+    self.assertEqual(result.timings.native["n_windows"], 1) # jfk is shorter than 30 seconds
+    self.assertGreater(result.timings.native["encode_ms"], 0)
+    self.assertGreater(result.timings.native["decode_ms"], 0)
+    self.assertLessEqual(result.timings.native["mel_ms"] + result.timings.native["encode_ms"] + result.timings.native["decode_ms"], result.timings.native["inference_ms"])
+    self.assertLessEqual(result.timings.stages["inference"], result.timings.total_ms)
+
+    self.assertEqual(registry.counter("whispy_transcriptions_total", status="ok"), 1)
+    self.assertAlmostEqual(registry.counter("whispy_audio_seconds_total"), result.audio_seconds)
+    self.assertIn('whispy_stage_seconds_bucket{stage="inference",le="+Inf"} 1', registry.prometheus_text())
+
+  def test_tuning_profile(self):
+    import tempfile
+    import whispy
+    from whispy import tuning
+
+    with tempfile.TemporaryDirectory() as profiles_dir:
+      os.environ["WHISPY_PROFILES_DIR"] = profiles_dir
+      try:
+        profiles = tuning.tune(whispy.ModelParams(model_name="base", use_gpu=False), ["./inputs/jfk.pcmf32"], threads=[1, 2], repeat=1)
+        self.assertEqual(set(profiles), {"latency", "throughput"})
+        self.assertIn(profiles["latency"].n_threads, (1, 2))
+        self.assertEqual(len(profiles["latency"].measurements), 2)
+
+        model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+        self.assertEqual(model.tuned_threads, profiles["latency"].n_threads)
+        self.assertIn("ask not what your country can do for you", model.transcribe("./inputs/jfk.pcmf32").text.lower())
+        model.destroy()
+
+        untuned = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, use_profile=False))
+        self.assertIsNone(untuned.tuned_threads)
+        untuned.destroy()
+
+        throughput = profiles["throughput"]
+        self.assertEqual(tuning.tuned_topology(whispy.ModelParams("base")), (throughput.workers, throughput.n_threads))
+      finally:
+        del os.environ["WHISPY_PROFILES_DIR"]
+
+  def test_warmup(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=2), warmup=True)
+    self.assertTrue(model.ready)
+    self.assertGreater(model.warmup_seconds, 0)
+    self.assertEqual(model.states.n_created, 2) # Every state was warmed up
+    self.assertIn("ask not what your country can do for you", model.transcribe("./inputs/jfk.pcmf32").text.lower())
+    model.destroy()
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False), warmup="background")
+    self.assertTrue(model.wait_ready(timeout=60))
+    self.assertTrue(model.ready)
+    model.destroy()
+
+  def test_serve(self):
+    import json
+    import asyncio
+    import threading
+    import urllib.request
+    import whispy
+    from whispy.serve import TranscriptionServer
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=1), warmup=True)
+    server = TranscriptionServer(model, port=0, max_queue=0)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    base_url = f"http://127.0.0.1:{server.port}"
+
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      samples = speech_file.read()
+
+    def post(query: str = ""):
+      request = urllib.request.Request(f"{base_url}/transcribe{query}", data=samples, headers={"Content-Type": "audio/pcm"})
+      with urllib.request.urlopen(request) as response:
+        return response.read()
+
+    try:
+      with urllib.request.urlopen(f"{base_url}/readyz") as response:
+        self.assertEqual(response.status, 200)
+
+      result = json.loads(post())
+      self.assertIn("ask not what your country can do for you", result["text"].lower())
+
+      lines = [json.loads(line) for line in post("?stream=1").splitlines()]
+      self.assertEqual([line["segment"] for line in lines[:-1]], lines[-1]["result"]["segments"])
+
+      with urllib.request.urlopen(f"{base_url}/metrics") as response:
+        self.assertIn(b'whispy_server_requests_total{endpoint="/transcribe",status="200"}', response.read())
+    finally:
+      asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+      loop.call_soon_threadsafe(loop.stop)
+      model.destroy()
+
+  def test_scheduler(self):
+    import time
+    import whispy
+    from whispy.scheduler import BATCH
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=1))
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      jfk = speech_file.read()
+
+    with whispy.TranscriptionScheduler(model, policy="sjf", chunk_seconds=30) as scheduler:
+      long_job = scheduler.submit(jfk * 8, priority=BATCH)
+      time.sleep(0.5)
+      short_job = scheduler.submit("./inputs/jfk.pcmf32")
+
+      self.assertIn("ask not what your country can do for you", short_job.result().text.lower())
+      self.assertFalse(long_job.done(), "The interactive job should not wait for the batch one")
+      self.assertEqual(long_job.n_preempted, 1)
+      self.assertGreaterEqual(long_job.result().text.lower().count("my fellow americans"), 6)
+
+    model.destroy()
+
+  def test_timeout(self):
+    import time
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False, n_states=1))
+    with open("./inputs/jfk.pcmf32", "rb") as speech_file:
+      jfk = speech_file.read()
+    full = model.transcribe(jfk * 6)
+
+    # The backend stops by itself and keeps the segments decoded until then
+    start = time.perf_counter()
+    with self.assertRaises(whispy.WhisperTimeoutError) as caught:
+      model.transcribe(jfk * 6, timeout=full.timings.total_ms / 1000 / 3)
+    self.assertLess(time.perf_counter() - start, full.timings.total_ms / 1000)
+    self.assertIsNotNone(caught.exception.partial)
+    self.assertLess(len(caught.exception.partial.segments), len(full.segments))
+
+    with self.assertRaises(whispy.WhisperAudioTooLongError):
+      model.speech_to_text("./inputs/jfk.pcmf32", max_audio_seconds=5)
+
+    # Limits do not leak into the next call over the same state
+    self.assertIn("ask not what your country can do for you", model.speech_to_text_pcm(jfk).lower())
+
+    model.destroy()
+
+  def test_detect_language(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False))
+    probs = model.detect_language("./inputs/jfk.pcmf32", max_seconds=10)
+    self.assertEqual(next(iter(probs)), "en")
+    self.assertAlmostEqual(sum(probs.values()), 1.0, places=2)
+    self.assertEqual(len(model.detect_language("./inputs/jfk.pcmf32", top_k=3)), 3)
+
+    results = list(model.detect_languages(["./inputs/jfk.pcmf32", "./inputs/missing.pcmf32", "./inputs/jfk.mp3"], top_k=1))
+    self.assertEqual([item.index for item in results], [0, 1, 2])
+    self.assertFalse(results[1].ok)
+    self.assertEqual(list(results[0].result), ["en"])
+    self.assertEqual(list(results[2].result), ["en"])
+
+    model.destroy()
+
+  def test_transcribe_corpus(self):
+    import json
+    import shutil
+    import tempfile
+    from whispy.cli import main
+
+    with tempfile.TemporaryDirectory() as work_dir:
+      corpus_dir = os.path.join(work_dir, "corpus")
+      os.makedirs(os.path.join(corpus_dir, "nested"))
+      shutil.copy("./inputs/jfk.pcmf32", corpus_dir)
+      shutil.copy("./inputs/jfk.mp3", os.path.join(corpus_dir, "nested"))
+      output_dir = os.path.join(work_dir, "out")
+      argv = ["transcribe", "--output", output_dir, "--format", "jsonl,srt,vtt", "--workers", "2", "--threads-per-worker", "1", "--quiet", corpus_dir]
+
+      self.assertEqual(main(argv), 0)
+      with open(os.path.join(output_dir, "transcripts.jsonl")) as jsonl:
+        lines = [json.loads(line) for line in jsonl]
+      self.assertEqual(len(lines), 2)
+      self.assertTrue(all("my fellow americans" in line["text"].lower() for line in lines))
+      with open(os.path.join(output_dir, "nested", "jfk.srt")) as srt:
+        self.assertTrue(srt.read().startswith("1\n00:00:00,000 --> "))
+      with open(os.path.join(output_dir, "jfk.vtt")) as vtt:
+        self.assertTrue(vtt.read().startswith("WEBVTT"))
+
+      # A second run finds everything done and transcribes nothing
+      self.assertEqual(main(argv), 0)
+      with open(os.path.join(output_dir, "transcripts.jsonl")) as jsonl:
+        self.assertEqual(len(jsonl.readlines()), 2)
+
+      # Transcribing everything again replaces the lines instead of appending duplicates
+      self.assertEqual(main(argv + ["--force"]), 0)
+      with open(os.path.join(output_dir, "transcripts.jsonl")) as jsonl:
+        self.assertEqual(len(jsonl.readlines()), 2)
+
+  def test_token_output(self):
+    import whispy
+
+    model = whispy.WhispyModel(whispy.ModelParams(model_name="base", use_gpu=False).dtw("auto"))
+    params = whispy.SpeechToTextParams("greedy").token_output()
+    result = model.transcribe("./inputs/jfk.pcmf32", params)
+
+    tokens = result.tokens
+    self.assertIsNotNone(tokens)
+    self.assertGreater(len(tokens), 10)
+    self.assertEqual({len(column) for column in tokens.columns.values()}, {len(tokens)})
+    self.assertEqual(tokens.nbytes, 44 * len(tokens))
+    self.assertEqual(max(tokens["segment"]), len(result.segments) - 1)
+    self.assertTrue(all(t0 <= t1 for t0, t1 in zip(tokens["t0"], tokens["t1"])))
+    self.assertGreater(max(tokens["t_dtw"]), 0)
+
+    # Without special tokens, the ids spell the text
+    text = b"".join(model.vocabulary[token_id] for token_id in tokens["id"]).decode("utf-8")
+    self.assertEqual(text.strip(), result.text.strip())
+
+    # Opt-in only
+    self.assertIsNone(model.transcribe("./inputs/jfk.pcmf32").tokens)
+    model.destroy()
+
 
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file